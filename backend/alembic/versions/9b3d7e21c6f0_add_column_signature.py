@@ -0,0 +1,44 @@
+"""Add column signature
+
+Revision ID: 9b3d7e21c6f0
+Revises: f82d6c0e5a14
+Create Date: 2026-10-18 22:48:05.216734
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9b3d7e21c6f0"
+down_revision: Union[str, Sequence[str], None] = "f82d6c0e5a14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "dataset_registry", sa.Column("column_signature", sa.JSON(), nullable=True)
+    )
+    op.add_column(
+        "dataset_registry", sa.Column("signature_hash", sa.String(), nullable=True)
+    )
+    op.create_index(
+        op.f("ix_dataset_registry_signature_hash"),
+        "dataset_registry",
+        ["signature_hash"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        op.f("ix_dataset_registry_signature_hash"), table_name="dataset_registry"
+    )
+    op.drop_column("dataset_registry", "signature_hash")
+    op.drop_column("dataset_registry", "column_signature")
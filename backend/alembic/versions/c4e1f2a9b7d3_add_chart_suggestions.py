@@ -0,0 +1,36 @@
+"""Add chart suggestions
+
+Revision ID: c4e1f2a9b7d3
+Revises: 350a155c8e4b
+Create Date: 2026-10-18 10:12:41.203518
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e1f2a9b7d3"
+down_revision: Union[str, Sequence[str], None] = "350a155c8e4b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "dataset_registry", sa.Column("chart_suggestions", sa.JSON(), nullable=True)
+    )
+    op.add_column(
+        "dataset_registry",
+        sa.Column("suggestions_generated_at", sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("dataset_registry", "suggestions_generated_at")
+    op.drop_column("dataset_registry", "chart_suggestions")
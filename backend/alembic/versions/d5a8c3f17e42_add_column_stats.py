@@ -0,0 +1,31 @@
+"""Add column stats
+
+Revision ID: d5a8c3f17e42
+Revises: 9b3d7e21c6f0
+Create Date: 2026-10-18 23:05:41.552019
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d5a8c3f17e42"
+down_revision: Union[str, Sequence[str], None] = "9b3d7e21c6f0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "dataset_registry", sa.Column("column_stats", sa.JSON(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("dataset_registry", "column_stats")
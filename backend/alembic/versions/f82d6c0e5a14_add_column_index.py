@@ -0,0 +1,31 @@
+"""Add column index
+
+Revision ID: f82d6c0e5a14
+Revises: c4e1f2a9b7d3
+Create Date: 2026-10-18 11:03:27.918402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f82d6c0e5a14"
+down_revision: Union[str, Sequence[str], None] = "c4e1f2a9b7d3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "dataset_registry", sa.Column("column_index", sa.JSON(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("dataset_registry", "column_index")
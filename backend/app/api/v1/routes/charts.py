@@ -1,5 +1,8 @@
 import asyncio
-from fastapi import APIRouter, HTTPException, Depends
+import json
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import inspect
 from app.core.db import get_async_db, engine
@@ -9,40 +12,135 @@ from app.services.chart_generator import chart_generator_app
 from app.models.dataset_registry import DatasetRegistry
 from app.schemas.llm_schema import ChartGenerateRequest
 from app.utils import pull_db_column_description, pull_db_schema
-from app.core.rate_limit import get_rate_limit
+from app.core.rate_limit import get_rate_limit, hybrid_rate_limiter
+from app.core.llm_cache import llm_cache
+from app.core.llm_governor import governor_stats
+from app.core.pipeline_metrics import pipeline_stats, start_trace, summarize_trace
+from app.core.single_flight import single_flight
+from app.core.config import settings
+from app.services.chart_suggestions import (
+    generate_batch_sql,
+    generate_chart_suggestions,
+    generate_single_chart,
+    load_chart_suggestions,
+    schema_with_descriptions,
+    store_chart_suggestions,
+)
+from app.services.heuristic_suggestions import heuristic_suggestions
+from app.services.intent_matcher import intent_stats
+from app.services.result_store import export_results, get_result_meta, get_result_page
 
 logger = get_logger(__name__)
 
 router = APIRouter(prefix="/charts", tags=["charts"])
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+STREAM_PREVIEW_ROWS = 20
+
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 
 @router.get(
-    "/suggest-queries",
+    "/llm-cache/stats",
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))],
+)
+async def get_llm_cache_stats():
+    """Hit/miss counts and LLM latency saved by the response cache."""
+    return await llm_cache.stats()
+
+
+@router.get(
+    "/llm-governor/stats",
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))],
+)
+async def get_llm_governor_stats():
+    """Per-model queue depth, wait times and circuit breaker state."""
+    return governor_stats()
+
+
+@router.get(
+    "/pipeline-metrics",
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))],
+)
+async def get_pipeline_metrics(dataset_id: str | None = None):
+    """
+    Latency, token and row totals per pipeline stage; with ``dataset_id``
+    also that dataset's cumulative token spend.
+    """
+    return await pipeline_stats(dataset_id)
+
+
+@router.get(
+    "/intent-matcher/stats",
     dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))],
 )
+async def get_intent_matcher_stats():
+    """Share of /generate questions answered from SQL templates without the LLM."""
+    return await intent_stats()
+
+
+@router.get(
+    "/rate-limit/stats",
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))],
+)
+async def get_rate_limit_stats():
+    """This worker's local rate-limit buckets and Redis sync health."""
+    return hybrid_rate_limiter.stats()
+
+
+@router.get(
+    "/single-flight/stats",
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))],
+)
+async def get_single_flight_stats():
+    """How many duplicate in-flight requests were coalesced."""
+    return await single_flight.stats()
+
+
+@router.get(
+    "/suggest-queries",
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60, cost=2))],
+)
 async def suggest_query_prompts(
-    dataset_id: str, db: AsyncSession = Depends(get_async_db)
+    dataset_id: str,
+    mode: Literal["heuristic", "llm"] = "heuristic",
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Get only suggested query prompts (without generating charts)"""
+    """
+    Get only suggested query prompts (without generating charts). Heuristic
+    prompts from the column profiles by default; ``mode=llm`` asks the model
+    and falls back to the heuristic prompts if it fails.
+    """
     try:
-        columns = await pull_db_schema(dataset_id)
-        if columns is None:
-            raise HTTPException(status_code=404, detail="Dataset not found")
+        if mode == "llm":
+            columns = await pull_db_schema(dataset_id)
+            if columns is None:
+                raise HTTPException(status_code=404, detail="Dataset not found")
 
-        descriptions = await pull_db_column_description(dataset_id, DatasetRegistry)
-        for col in columns:
-            col["description"] = descriptions.get(col["name"], "")
+            descriptions = await pull_db_column_description(dataset_id, DatasetRegistry)
+            for col in columns:
+                col["description"] = descriptions.get(col["name"], "")
 
-        initial_state = {"schema_info": columns}
-        result = await chart_suggester_app.ainvoke(initial_state)
-        queries = result.get("suggested_queries", [])
+            initial_state = {"dataset_id": dataset_id, "schema_info": columns}
+            result = await chart_suggester_app.ainvoke(initial_state)
+            queries = result.get("suggested_queries", [])
+            if queries:
+                return {"dataset_id": dataset_id, "suggestions": queries, "source": "llm"}
+            logger.warning("LLM query suggestions failed, using heuristics")
 
-        if not queries:
+        heuristic = await heuristic_suggestions(dataset_id)
+        if not heuristic:
             raise HTTPException(
                 status_code=500, detail="Failed to generate suggestions"
             )
-
-        return {"dataset_id": dataset_id, "suggestions": queries}
+        return {
+            "dataset_id": dataset_id,
+            "suggestions": [s["query"] for s in heuristic],
+            "source": "heuristic",
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -53,77 +151,94 @@ async def suggest_query_prompts(
 @router.get(
     "/suggest", dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))]
 )
-async def suggest_charts(dataset_id: str, db: AsyncSession = Depends(get_async_db)):
-    try:
-        columns = await pull_db_schema(dataset_id)
-
-        if columns is None:
-            logger.error("Dataset not found: %s", dataset_id)
-            raise HTTPException(status_code=404, detail="Dataset not found")
-
-        descriptions = await pull_db_column_description(dataset_id, DatasetRegistry)
-
-        # Merge descriptions
-        for col in columns:
-            col["description"] = descriptions.get(col["name"], "")
+async def suggest_charts(
+    dataset_id: str,
+    mode: Literal["auto", "heuristic", "llm"] = "auto",
+    refresh: bool = False,
+    timings: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Chart suggestions for a dataset.
 
-        # 1. Ask AI to suggest 3 queries
-        initial_state = {"schema_info": columns}
-        result = await chart_suggester_app.ainvoke(initial_state)
-        queries = result.get("suggested_queries", [])
+    * ``auto`` (default): the LLM suggestions precomputed at ingest, or
+      heuristic column-bar / KPI requests until those exist;
+    * ``llm``: stored LLM suggestions, generating them if missing;
+    * ``heuristic``: only the heuristic suggestions.
 
-        if not queries:
-            raise HTTPException(
-                status_code=500, detail="Failed to generate AI chart suggestions."
-            )
+    ``refresh=true`` forces the LLM pipeline to run again. Whenever it fails
+    the heuristic suggestions are returned instead. ``timings=true`` adds
+    per-stage latency / token accounting. Only an LLM run draws on the work
+    budget beyond the base request, through the tokens and queries it uses.
+    """
+    try:
+        trace = start_trace(dataset_id)
 
-        # 2. For each query, run the Text-to-SQL logic concurrently
-        async def generate_single_chart(query: str):
-            generator_state = {
+        def respond(suggestions, source):
+            response = {
                 "dataset_id": dataset_id,
-                "user_query": query,
-                "schema_info": columns,
+                "suggestions": suggestions,
+                "source": source,
             }
-            res = await chart_generator_app.ainvoke(generator_state)
+            if timings:
+                response["timings"] = summarize_trace(trace)
+            return response
 
-            # If it failed to generate SQL, skip peacefully
-            if res.get("sql_error"):
-                return None
+        if mode == "heuristic":
+            return respond(await heuristic_suggestions(dataset_id), "heuristic")
 
-            spec = (
-                res.get("chart_spec", {}).get("chart_spec")
-                if isinstance(res.get("chart_spec"), dict)
-                and "chart_spec" in res.get("chart_spec")
-                else res.get("chart_spec")
+        if not refresh:
+            stored = await load_chart_suggestions(dataset_id)
+            if stored is not None:
+                return respond(stored, "stored")
+            if mode == "auto":
+                return respond(await heuristic_suggestions(dataset_id), "heuristic")
+
+        try:
+            # A dashboard opened by many people at once runs the pipeline once
+            successful_charts = await single_flight.do(
+                "suggest",
+                {"dataset_id": dataset_id},
+                lambda: _generate_and_store_suggestions(dataset_id),
+                distributed=True,
             )
+        except Exception as e:
+            logger.warning(f"LLM chart suggestions failed, using heuristics: {e}")
+            return respond(await heuristic_suggestions(dataset_id), "heuristic")
+        return respond(successful_charts, "llm")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error suggesting charts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-            return {
-                "query": query,
-                "sql_query": res.get("sql_query"),
-                "chart_spec": spec,
-            }
 
-        chart_tasks = [generate_single_chart(q) for q in queries]
-        generated_charts = await asyncio.gather(*chart_tasks)
+async def _generate_and_store_suggestions(dataset_id: str) -> list[dict]:
+    columns = await schema_with_descriptions(dataset_id)
 
-        # Filter out any that failed
-        successful_charts = [c for c in generated_charts if c and c.get("chart_spec")]
+    successful_charts = await generate_chart_suggestions(dataset_id, columns)
+    if successful_charts is None:
+        raise HTTPException(
+            status_code=500, detail="Failed to generate AI chart suggestions."
+        )
 
-        return {"dataset_id": dataset_id, "suggestions": successful_charts}
-    except Exception as e:
-        logger.error(f"Error suggesting charts: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    await store_chart_suggestions(dataset_id, successful_charts)
+    return successful_charts
 
 
 @router.post(
     "/generate",
-    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))],
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60, cost=5))],
 )
 async def generate_chart(
-    request: ChartGenerateRequest, db: AsyncSession = Depends(get_async_db)
+    request: ChartGenerateRequest,
+    timings: bool = False,
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """``timings=true`` adds per-stage latency / token accounting to the response."""
     try:
         dataset_id = request.dataset_id
+        trace = start_trace(dataset_id)
         columns = await pull_db_schema(dataset_id)
         if columns is None:
             raise HTTPException(status_code=404, detail="Dataset not found")
@@ -143,13 +258,175 @@ async def generate_chart(
         if result.get("sql_error"):
             raise HTTPException(status_code=400, detail=result["sql_error"])
 
-        return {
+        rows = result.get("sql_results") or []
+        row_count = result.get("row_count") or len(rows)
+        response = {
             "sql_query": result.get("sql_query"),
-            "data": result.get("sql_results"),
+            "sql_source": result.get("sql_source"),
+            "data": rows,
+            "result_handle": result.get("result_handle"),
+            "row_count": row_count,
+            "has_more": row_count > len(rows),
             "chart_spec": result.get("chart_spec"),
         }
+        if timings:
+            response["timings"] = summarize_trace(trace)
+        return response
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error generating chart: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get(
+    "/results/{handle}",
+    dependencies=[Depends(get_rate_limit(limit=60, window_size_seconds=60))],
+)
+async def get_results(
+    handle: str,
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=5000),
+    export: Literal["csv", "ndjson"] | None = None,
+):
+    """
+    Page through (``offset`` / ``limit``) or stream an export (``export=csv``
+    or ``ndjson``) of a result spooled by /generate, without rerunning SQL.
+    """
+    meta = await get_result_meta(handle)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+
+    if export is not None:
+        media_type = "text/csv" if export == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            export_results(handle, meta["columns"], export),
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="{handle}.{export}"'
+            },
+        )
+
+    limit = limit or settings.RESULT_PAGE_SIZE
+    rows = await get_result_page(handle, offset, limit)
+    return {
+        "result_handle": handle,
+        "sql_query": meta["sql_query"],
+        "columns": meta["columns"],
+        "row_count": meta["row_count"],
+        "offset": offset,
+        "limit": limit,
+        "has_more": offset + len(rows) < meta["row_count"],
+        "data": rows,
+    }
+
+
+@router.post(
+    "/generate/stream",
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60, cost=5))],
+)
+async def generate_chart_stream(request: ChartGenerateRequest):
+    """
+    Streaming variant of /generate. Emits an SSE event as each graph node
+    finishes: ``sql_generated``, ``rows_fetched`` (with the first rows),
+    ``chart_spec``, then ``done`` - or ``error`` if a step fails.
+    """
+    columns = await schema_with_descriptions(request.dataset_id)
+    initial_state = {
+        "dataset_id": request.dataset_id,
+        "user_query": request.user_query,
+        "schema_info": columns,
+    }
+
+    async def event_stream():
+        sql_source = None
+        try:
+            async for update in chart_generator_app.astream(
+                initial_state, stream_mode="updates"
+            ):
+                for node, output in update.items():
+                    output = output or {}
+                    if output.get("sql_error"):
+                        if node == "execute_sql" and sql_source == "template":
+                            # The graph retries with LLM-generated SQL
+                            sql_source = None
+                            continue
+                        yield _sse("error", {"detail": output["sql_error"]})
+                        return
+                    if node in ("match_intent", "generate_sql") and output.get("sql_query"):
+                        sql_source = output.get("sql_source")
+                        yield _sse(
+                            "sql_generated",
+                            {"sql_query": output["sql_query"], "sql_source": sql_source},
+                        )
+                    elif node == "execute_sql":
+                        rows = output.get("sql_results") or []
+                        yield _sse(
+                            "rows_fetched",
+                            {
+                                "row_count": output.get("row_count") or len(rows),
+                                "result_handle": output.get("result_handle"),
+                                "rows": rows[:STREAM_PREVIEW_ROWS],
+                            },
+                        )
+                    elif node == "generate_chart_spec":
+                        yield _sse("chart_spec", {"chart_spec": output.get("chart_spec")})
+            yield _sse("done", {})
+        except Exception as e:
+            logger.error(f"Error streaming chart generation: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@router.get(
+    "/suggest/stream",
+    dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60, cost=10))],
+)
+async def suggest_charts_stream(dataset_id: str):
+    """
+    Streaming variant of /suggest. Emits ``queries`` once the suggestions are
+    known, then one ``chart`` event per chart as soon as it completes, then
+    ``done``.
+    """
+    columns = await schema_with_descriptions(dataset_id)
+
+    async def event_stream():
+        try:
+            result = await chart_suggester_app.ainvoke(
+                {"dataset_id": dataset_id, "schema_info": columns}
+            )
+            queries = result.get("suggested_queries", [])
+            if not queries:
+                yield _sse("error", {"detail": "Failed to generate AI chart suggestions."})
+                return
+            yield _sse("queries", {"dataset_id": dataset_id, "queries": queries})
+
+            sql_queries, schema_pruned = await generate_batch_sql(
+                dataset_id, columns, queries
+            )
+            tasks = [
+                asyncio.create_task(
+                    generate_single_chart(dataset_id, columns, q, sql, schema_pruned)
+                )
+                for q, sql in zip(queries, sql_queries)
+            ]
+            try:
+                for next_chart in asyncio.as_completed(tasks):
+                    chart = await next_chart
+                    if chart and chart.get("chart_spec"):
+                        yield _sse("chart", chart)
+            finally:
+                # Client went away mid-stream: stop paying for the LLM calls
+                for task in tasks:
+                    task.cancel()
+            yield _sse("done", {})
+        except Exception as e:
+            logger.error(f"Error streaming chart suggestions: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
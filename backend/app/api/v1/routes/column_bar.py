@@ -1,19 +1,45 @@
 """Column & Bar chart endpoint – builds ECharts specs from user-selected
 columns + aggregations, no AI involved."""
 
+import hashlib
+import json
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import text
 
+import app.core.redis as redis_module
 from app.core.db import engine
 from app.core.logging import get_logger
 from app.core.rate_limit import get_rate_limit
-from app.schemas.llm_schema import ColumnBarRequest
+from app.core.single_flight import single_flight
+from app.schemas.llm_schema import ColumnBarDrilldownRequest, ColumnBarRequest
+from app.services.aggregations import (
+    ALLOWED_AGGREGATIONS,
+    SKETCH_AGGREGATIONS,
+    aggregate_sql,
+    normalize_aggregation,
+)
+from app.services.approximate import (
+    UNSAMPLEABLE_AGGREGATIONS,
+    approx_aux_parts,
+    plan_sample,
+    sample_metadata,
+    scale_aggregate,
+    tablesample_clause,
+)
+from app.services.columnar_cache import columnar_cache
 from app.services.dataset_service import get_db_schema
+from app.services.query_engine import run_query
+from app.services.sketches import MAX_SKETCH_GROUPS, get_group_sketches, sketch_value
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/charts")
 
-ALLOWED_AGGS = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+ALLOWED_AGGS = ALLOWED_AGGREGATIONS
+TIME_GRAINS = ("day", "week", "month", "quarter", "year")
+
+DRILLDOWN_CACHE_TTL_SECONDS = 300
+DRILLDOWN_MAX_ROWS = 5000
 
 
 def _safe_identifier(name: str) -> str:
@@ -27,6 +53,12 @@ def _safe_identifier(name: str) -> str:
 )
 async def generate_column_bar(req: ColumnBarRequest):
     """Build a column/bar chart from explicit column + aggregation selections."""
+    return await single_flight.do(
+        "column_bar", req.model_dump(), lambda: _generate_column_bar(req)
+    )
+
+
+async def _generate_column_bar(req: ColumnBarRequest):
     # ---- Validate dataset exists ----
     schema = await get_db_schema(req.dataset_id)
     if not schema:
@@ -43,7 +75,7 @@ async def generate_column_bar(req: ColumnBarRequest):
             raise HTTPException(
                 status_code=400, detail=f"Column '{xv.column}' not found"
             )
-        if xv.aggregation.upper() not in ALLOWED_AGGS:
+        if normalize_aggregation(xv.aggregation) not in ALLOWED_AGGS:
             raise HTTPException(
                 status_code=400, detail=f"Invalid aggregation '{xv.aggregation}'"
             )
@@ -51,26 +83,83 @@ async def generate_column_bar(req: ColumnBarRequest):
         raise HTTPException(
             status_code=400, detail=f"Slice column '{req.slice}' not found"
         )
+    grain = req.time_grain.lower() if req.time_grain else None
+    if grain and grain not in TIME_GRAINS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid time grain '{req.time_grain}'"
+        )
+
+    metric_aggs = [
+        "COUNT"
+        if xv.column == "__record_count__"
+        else normalize_aggregation(xv.aggregation)
+        for xv in req.x_values
+    ]
+    # Metrics answered from precomputed sketches instead of SQL
+    sketch_indexes = (
+        [i for i, agg in enumerate(metric_aggs) if agg in SKETCH_AGGREGATIONS]
+        if req.sketch
+        else []
+    )
+    if sketch_indexes and req.slice:
+        raise HTTPException(
+            status_code=400, detail="Sketch mode does not support sliced charts"
+        )
+    if sketch_indexes and grain:
+        raise HTTPException(
+            status_code=400, detail="Sketch mode does not support time grains"
+        )
+    if req.approximate and any(
+        agg in UNSAMPLEABLE_AGGREGATIONS and i not in sketch_indexes
+        for i, agg in enumerate(metric_aggs)
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="COUNT_DISTINCT can't be estimated from a sample; use sketch mode",
+        )
+
+    # ---- Hot datasets are aggregated exactly from the in-memory cache ----
+    cached_rows = columnar_cache.column_bar_rows(
+        req.dataset_id,
+        req.y_axis,
+        req.x_values,
+        slice_column=req.slice,
+        sort_by=req.sort_by,
+        sort_dir=req.sort_dir,
+        time_grain=grain,
+    )
+    if cached_rows is not None:
+        sketch_indexes = []
 
     y_col = _safe_identifier(req.y_axis)
 
     # ---- Build SELECT expressions ----
-    select_parts = [f"{y_col} AS category"]
-    aliases = []
+    category_expr = (
+        f"CAST(date_trunc('{grain}', CAST({y_col} AS timestamp)) AS date)"
+        if grain
+        else y_col
+    )
+    select_parts = [f"{category_expr} AS category"]
 
     if req.slice:
         slice_col = _safe_identifier(req.slice)
         select_parts.append(f"{slice_col} AS slice_val")
 
-    for i, xv in enumerate(req.x_values):
-        agg = xv.aggregation.upper()
-        alias = f"val_{i}"
-        if xv.column == "__record_count__":
-            select_parts.append(f"COUNT(*) AS {alias}")
-        else:
-            col = _safe_identifier(xv.column)
-            select_parts.append(f"{agg}({col}) AS {alias}")
-        aliases.append(alias)
+    metric_parts, aliases = _metric_select_parts(req.x_values, sketch_indexes)
+    select_parts.extend(metric_parts)
+
+    # ---- Optional sampling for approximate previews ----
+    plan = (
+        plan_sample(schema.get("row_count"))
+        if req.approximate and cached_rows is None
+        else None
+    )
+    if plan:
+        for xv, agg, alias in zip(req.x_values, metric_aggs, aliases):
+            col_expr = (
+                "*" if xv.column == "__record_count__" else _safe_identifier(xv.column)
+            )
+            select_parts.extend(approx_aux_parts(agg, col_expr, alias))
 
     # ---- Build GROUP BY / ORDER BY ----
     group_parts = ["category"]
@@ -82,33 +171,81 @@ async def generate_column_bar(req: ColumnBarRequest):
         direction = "ASC" if req.sort_dir.lower() == "asc" else "DESC"
         if req.sort_by == "__record_count__":
             order_clause = f"ORDER BY val_0 {direction}"
+        elif grain and req.sort_by == req.y_axis:
+            order_clause = f"ORDER BY category {direction}"
         elif req.sort_by in col_names:
             order_clause = f"ORDER BY {_safe_identifier(req.sort_by)} {direction}"
     if not order_clause:
         order_clause = "ORDER BY val_0 DESC"
+    # val_0 is only filled in after the query when it comes from a sketch, so
+    # fetch every group (sketches exist for at most MAX_SKETCH_GROUPS) and
+    # rank / limit once the sketched values are known
+    resort_by_val_0 = 0 in sketch_indexes and "val_0" in order_clause
+    sort_descending = "DESC" in order_clause
+    category_limit = 200
+    row_limit = category_limit
+    if resort_by_val_0:
+        order_clause = ""
+        row_limit = MAX_SKETCH_GROUPS
 
     sql = (
         f"SELECT {', '.join(select_parts)} "
-        f"FROM {table} "
+        f"FROM {table}{tablesample_clause(plan)} "
         f"WHERE {y_col} IS NOT NULL "
         f"GROUP BY {', '.join(group_parts)} "
         f"{order_clause} "
-        f"LIMIT 200"
+        f"LIMIT {row_limit}"
     )
 
-    logger.info("Column-bar SQL: %s", sql)
+    if cached_rows is not None:
+        logger.info("Column-bar served from columnar cache: %s", req.dataset_id)
+        rows = cached_rows
+    else:
+        logger.info("Column-bar SQL: %s", sql)
 
-    try:
-        async with engine.connect() as conn:
-            result = await conn.execute(text(sql))
-            rows = [dict(r._mapping) for r in result.fetchall()]
-    except Exception as e:
-        logger.error("Column-bar query failed: %s", e)
-        raise HTTPException(status_code=500, detail=f"Query error: {e}")
+        try:
+            rows = await run_query(req.dataset_id, sql)
+        except Exception as e:
+            logger.error("Column-bar query failed: %s", e)
+            raise HTTPException(status_code=500, detail=f"Query error: {e}")
 
     if not rows:
         raise HTTPException(status_code=400, detail="Query returned no data")
 
+    # ---- Fill sketch-backed metrics per category ----
+    for i in sketch_indexes:
+        groups = await get_group_sketches(
+            req.dataset_id, req.y_axis, req.x_values[i].column
+        )
+        for r in rows:
+            sketches = groups.get(str(r["category"]))
+            r[aliases[i]] = sketch_value(metric_aggs[i], sketches) if sketches else None
+    if resort_by_val_0:
+        # Categories without a sketch value rank last either way
+        ranked = sorted(
+            (r for r in rows if r["val_0"] is not None),
+            key=lambda r: r["val_0"],
+            reverse=sort_descending,
+        )
+        rows = (ranked + [r for r in rows if r["val_0"] is None])[:category_limit]
+
+    # ---- Scale sampled aggregates back up ----
+    approximate = None
+    if plan:
+        error_bounds = []
+        for r in rows:
+            errors = []
+            for agg, alias in zip(metric_aggs, aliases):
+                r[alias], err = scale_aggregate(agg, r, alias, plan["fraction"])
+                errors.append(err)
+            bound = {"category": str(r["category"]), "errors": errors}
+            if req.slice:
+                bound["slice"] = (
+                    str(r["slice_val"]) if r["slice_val"] is not None else "(empty)"
+                )
+            error_bounds.append(bound)
+        approximate = {**sample_metadata(plan), "error_bounds": error_bounds}
+
     # ---- Build ECharts spec ----
     is_horizontal = req.chart_type.lower() == "bar"
 
@@ -117,7 +254,204 @@ async def generate_column_bar(req: ColumnBarRequest):
     else:
         chart_spec = _build_simple_spec(rows, aliases, req, is_horizontal)
 
-    return {"chart_spec": chart_spec, "sql_query": sql, "row_count": len(rows)}
+    return {
+        "chart_spec": chart_spec,
+        "sql_query": sql,
+        "row_count": len(rows),
+        "approximate": approximate,
+        "served_from": "memory" if cached_rows is not None else "postgres",
+    }
+
+
+def _metric_select_parts(x_values, sketch_indexes=()):
+    """SELECT expressions + aliases (val_0, val_1, ...) for the requested metrics.
+
+    Metrics listed in ``sketch_indexes`` are selected as NULL placeholders and
+    filled in from precomputed sketches after the query.
+    """
+    select_parts = []
+    aliases = []
+    for i, xv in enumerate(x_values):
+        agg = normalize_aggregation(xv.aggregation)
+        alias = f"val_{i}"
+        if xv.column == "__record_count__":
+            select_parts.append(f"COUNT(*) AS {alias}")
+        elif i in sketch_indexes:
+            select_parts.append(f"NULL AS {alias}")
+        else:
+            col = _safe_identifier(xv.column)
+            select_parts.append(f"{aggregate_sql(agg, col)} AS {alias}")
+        aliases.append(alias)
+    return select_parts, aliases
+
+
+@router.post(
+    "/column-bar/drilldown",
+    dependencies=[Depends(get_rate_limit(limit=20, window_size_seconds=60))],
+)
+async def generate_column_bar_drilldown(req: ColumnBarDrilldownRequest):
+    """Return every drill level for a dimension hierarchy from one ROLLUP query.
+
+    The full tree is cached, so follow-up drill clicks (sent with a ``path``)
+    are answered from Redis without touching the dataset table. ``truncated``
+    is set when the ROLLUP hit ``DRILLDOWN_MAX_ROWS`` and the deepest nodes
+    are missing.
+    """
+    cache_key = "drilldown:" + hashlib.sha256(
+        json.dumps(
+            {
+                "dataset_id": req.dataset_id,
+                "dimensions": req.dimensions,
+                "x_values": [xv.model_dump() for xv in req.x_values],
+            },
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+
+    tree = None
+    sql = None
+    truncated = False
+    try:
+        cached = await redis_module.redis_client.get(cache_key)
+        if cached:
+            payload = json.loads(cached)
+            tree, sql, truncated = (
+                payload["tree"],
+                payload["sql_query"],
+                payload["truncated"],
+            )
+    except Exception as e:
+        logger.warning("Drilldown cache read failed: %s", e)
+
+    cache_hit = tree is not None
+    if not cache_hit:
+        tree, sql, truncated = await _query_drilldown_tree(req)
+        try:
+            await redis_module.redis_client.set(
+                cache_key,
+                json.dumps({"tree": tree, "sql_query": sql, "truncated": truncated}),
+                ex=DRILLDOWN_CACHE_TTL_SECONDS,
+            )
+        except Exception as e:
+            logger.warning("Drilldown cache write failed: %s", e)
+
+    node = tree
+    for key in req.path:
+        node = next((c for c in node["children"] if c["key"] == key), None)
+        if node is None:
+            raise HTTPException(
+                status_code=404, detail=f"Drill path {req.path} not found"
+            )
+
+    return {
+        "dimensions": req.dimensions,
+        "metrics": [
+            "Record Count"
+            if xv.column == "__record_count__"
+            else f"{xv.aggregation.upper()}({xv.column})"
+            for xv in req.x_values
+        ],
+        "path": req.path,
+        "tree": node,
+        "truncated": truncated,
+        "sql_query": sql,
+        "cached": cache_hit,
+    }
+
+
+async def _query_drilldown_tree(req: ColumnBarDrilldownRequest):
+    """Run the GROUP BY ROLLUP query and fold its rows into a tree.
+
+    Returns ``(tree, sql, truncated)``; one extra row is fetched to tell
+    whether the row cap cut the result short.
+    """
+    schema = await get_db_schema(req.dataset_id)
+    if not schema:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    col_names = {c["name"] for c in schema.get("columns", [])}
+    table = _safe_identifier(req.dataset_id)
+
+    for dim in req.dimensions:
+        if dim not in col_names:
+            raise HTTPException(status_code=400, detail=f"Column '{dim}' not found")
+    for xv in req.x_values:
+        if xv.column != "__record_count__" and xv.column not in col_names:
+            raise HTTPException(
+                status_code=400, detail=f"Column '{xv.column}' not found"
+            )
+        if normalize_aggregation(xv.aggregation) not in ALLOWED_AGGS:
+            raise HTTPException(
+                status_code=400, detail=f"Invalid aggregation '{xv.aggregation}'"
+            )
+
+    dim_cols = [_safe_identifier(d) for d in req.dimensions]
+    select_parts = [f"{c} AS d_{i}" for i, c in enumerate(dim_cols)]
+    select_parts += [f"GROUPING({c}) AS g_{i}" for i, c in enumerate(dim_cols)]
+    metric_parts, aliases = _metric_select_parts(req.x_values)
+    select_parts.extend(metric_parts)
+
+    # Order so every parent subtotal comes out before its children
+    order_by = ", ".join(f"g_{i} DESC, d_{i}" for i in range(len(dim_cols)))
+
+    sql = (
+        f"SELECT {', '.join(select_parts)} "
+        f"FROM {table} "
+        f"GROUP BY ROLLUP({', '.join(dim_cols)}) "
+        f"ORDER BY {order_by} "
+        f"LIMIT {DRILLDOWN_MAX_ROWS + 1}"
+    )
+
+    logger.info("Column-bar drilldown SQL: %s", sql)
+
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(text(sql))
+            rows = [dict(r._mapping) for r in result.fetchall()]
+    except Exception as e:
+        logger.error("Column-bar drilldown query failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Query error: {e}")
+
+    if not rows:
+        raise HTTPException(status_code=400, detail="Query returned no data")
+
+    truncated = len(rows) > DRILLDOWN_MAX_ROWS
+    rows = rows[:DRILLDOWN_MAX_ROWS]
+    return _build_drilldown_tree(rows, aliases, len(dim_cols)), sql, truncated
+
+
+def _build_drilldown_tree(rows, aliases, depth):
+    """Fold ROLLUP rows into nested nodes, children sorted by the first metric."""
+    root = {"key": None, "level": 0, "values": [], "children": []}
+    index = {(): root}
+
+    for r in rows:
+        level = sum(1 for i in range(depth) if not r[f"g_{i}"])
+        keys = tuple(
+            str(r[f"d_{i}"]) if r[f"d_{i}"] is not None else "(empty)"
+            for i in range(level)
+        )
+        values = [float(r[a]) if r[a] is not None else 0 for a in aliases]
+
+        if level == 0:
+            root["values"] = values
+            continue
+
+        parent = index.get(keys[:-1])
+        if parent is None:
+            # Parent fell outside the row cap; skip the orphan
+            continue
+        node = {"key": keys[-1], "level": level, "values": values, "children": []}
+        parent["children"].append(node)
+        index[keys] = node
+
+    def _sort(node):
+        node["children"].sort(key=lambda c: c["values"][0], reverse=True)
+        for child in node["children"]:
+            _sort(child)
+
+    _sort(root)
+    return root
 
 
 def _build_simple_spec(rows, aliases, req, is_horizontal):
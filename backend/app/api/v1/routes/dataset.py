@@ -11,25 +11,44 @@ from fastapi import (
     Request,
     HTTPException,
     Depends,
+    BackgroundTasks,
 )
 from app.services.dataset_service import upload_dataset, get_db_schema, compute_kpi
+from app.services.chart_suggestions import precompute_chart_suggestions
+from app.services.sketches import precompute_sketches
 from app.core.db import get_async_db, engine
 from app.core.logging import get_logger
 from app.core.rate_limit import get_rate_limit
+from app.core.single_flight import single_flight
 from app.schemas.llm_schema import KpiComputeRequest
+from app.services.query_engine import run_query
+from app.services.approximate import (
+    plan_sample,
+    sample_metadata,
+    scale_aggregate,
+    tablesample_clause,
+)
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/dataset")
 
 
 @router.post(
-    "/upload", dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60))]
+    "/upload", dependencies=[Depends(get_rate_limit(limit=10, window_size_seconds=60, cost=10))]
 )
 async def upload_file(
-    file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db)
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
 ):
     logger.info("Uploading file: %s", file.filename)
-    return await upload_dataset(file, db)
+    result = await upload_dataset(file, db)
+
+    # New or replaced dataset: build its chart suggestions after responding
+    if result.get("rows_inserted"):
+        background_tasks.add_task(precompute_chart_suggestions, result["dataset_id"])
+        background_tasks.add_task(precompute_sketches, result["dataset_id"])
+    return result
 
 
 @router.get(
@@ -105,11 +124,17 @@ async def compute_dataset_kpi(
         request.aggregation,
         request.kpi_column,
     )
-    return await compute_kpi(
-        dataset_id=dataset_id,
-        kpi_column=request.kpi_column,
-        aggregation=request.aggregation,
-        date_column=request.date_column,
+    return await single_flight.do(
+        "kpi",
+        {"dataset_id": dataset_id, **request.model_dump()},
+        lambda: compute_kpi(
+            dataset_id=dataset_id,
+            kpi_column=request.kpi_column,
+            aggregation=request.aggregation,
+            date_column=request.date_column,
+            approximate=request.approximate,
+            sketch=request.sketch,
+        ),
     )
 
 
@@ -119,56 +144,73 @@ async def compute_dataset_kpi(
 )
 async def get_distinct_values(
     dataset_id: str,
+    approximate: bool = False,
     db: AsyncSession = Depends(get_async_db),
 ):
-    """Get distinct values and counts for each column in the dataset."""
+    """Get distinct values and counts for each column in the dataset.
+
+    With ``approximate=true`` the counts are estimated from a table sample;
+    rare values may be missing from the result.
+    """
     logger.info(f"Getting distinct values for dataset {dataset_id}")
     try:
         schema = await get_db_schema(dataset_id)
         if not schema:
             raise HTTPException(status_code=404, detail="Dataset not found")
 
+        plan = plan_sample(schema.get("row_count")) if approximate else None
+        source = f'"{dataset_id}"{tablesample_clause(plan)}'
+
         columns = schema.get("columns", [])
         result_columns = []
-        async with engine.connect() as conn:
-            for col in columns:
-                col_name = col["name"]
-                col_type = col.get("type", "unknown")
-                try:
-                    query = text(
-                        f'SELECT "{col_name}" AS val, COUNT(*) AS cnt '
-                        f'FROM "{dataset_id}" '
-                        f'WHERE "{col_name}" IS NOT NULL '
-                        f'GROUP BY "{col_name}" '
-                        f"ORDER BY cnt DESC "
-                        f"LIMIT 100"
-                    )
-                    rows = await conn.execute(query)
-                    values = [
-                        {"value": str(r.val), "count": r.cnt} for r in rows.fetchall()
-                    ]
-                    result_columns.append(
-                        {
-                            "name": col_name,
-                            "type": col_type,
-                            "distinct_count": len(values),
-                            "values": values,
-                        }
-                    )
-                except Exception as col_err:
-                    logger.warning(
-                        f"Error getting distinct values for {col_name}: {col_err}"
-                    )
-                    result_columns.append(
-                        {
-                            "name": col_name,
-                            "type": col_type,
-                            "distinct_count": 0,
-                            "values": [],
-                        }
-                    )
-
-        return {"dataset_id": dataset_id, "columns": result_columns}
+        for col in columns:
+            col_name = col["name"]
+            col_type = col.get("type", "unknown")
+            try:
+                query = (
+                    f'SELECT "{col_name}" AS val, COUNT(*) AS cnt '
+                    f"FROM {source} "
+                    f'WHERE "{col_name}" IS NOT NULL '
+                    f'GROUP BY "{col_name}" '
+                    f"ORDER BY cnt DESC "
+                    f"LIMIT 100"
+                )
+                rows = await run_query(dataset_id, query)
+                values = [
+                    {"value": str(r["val"]), "count": r["cnt"]} for r in rows
+                ]
+                if plan:
+                    for v in values:
+                        count, error = scale_aggregate(
+                            "COUNT", v, "count", plan["fraction"]
+                        )
+                        v["count"], v["error"] = round(count), round(error)
+                result_columns.append(
+                    {
+                        "name": col_name,
+                        "type": col_type,
+                        "distinct_count": len(values),
+                        "values": values,
+                    }
+                )
+            except Exception as col_err:
+                logger.warning(
+                    f"Error getting distinct values for {col_name}: {col_err}"
+                )
+                result_columns.append(
+                    {
+                        "name": col_name,
+                        "type": col_type,
+                        "distinct_count": 0,
+                        "values": [],
+                    }
+                )
+
+        return {
+            "dataset_id": dataset_id,
+            "columns": result_columns,
+            "approximate": sample_metadata(plan) if plan else None,
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -0,0 +1,164 @@
+"""Pivot / crosstab endpoint – computes the pivot matrix in Postgres with
+conditional aggregation instead of shipping raw rows to the browser."""
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+
+from app.api.v1.routes.column_bar import ALLOWED_AGGS, _safe_identifier
+from app.core.db import engine
+from app.core.logging import get_logger
+from app.core.rate_limit import get_rate_limit
+from app.schemas.llm_schema import PivotRequest
+from app.services.aggregations import aggregate_sql, normalize_aggregation
+from app.services.dataset_service import get_db_schema
+
+logger = get_logger(__name__)
+router = APIRouter(prefix="/charts")
+
+
+def _to_number(v):
+    """Convert Decimal/int aggregates to float, keeping None as None."""
+    return float(v) if v is not None else None
+
+
+@router.post(
+    "/pivot",
+    dependencies=[Depends(get_rate_limit(limit=20, window_size_seconds=60))],
+)
+async def generate_pivot(req: PivotRequest):
+    """Build a pivot table from row/column dimensions and one aggregated measure."""
+    # ---- Validate dataset exists ----
+    schema = await get_db_schema(req.dataset_id)
+    if not schema:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    col_names = {c["name"] for c in schema.get("columns", [])}
+    table = _safe_identifier(req.dataset_id)
+
+    # ---- Validate columns ----
+    for name in req.rows + req.columns:
+        if name not in col_names:
+            raise HTTPException(status_code=400, detail=f"Column '{name}' not found")
+    if set(req.rows) & set(req.columns):
+        raise HTTPException(
+            status_code=400,
+            detail="A column cannot be both a row and a column dimension",
+        )
+    if req.measure != "__record_count__" and req.measure not in col_names:
+        raise HTTPException(
+            status_code=400, detail=f"Column '{req.measure}' not found"
+        )
+    agg = normalize_aggregation(req.aggregation)
+    if agg not in ALLOWED_AGGS:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid aggregation '{req.aggregation}'"
+        )
+
+    measure_expr = (
+        "*" if req.measure == "__record_count__" else _safe_identifier(req.measure)
+    )
+    if measure_expr == "*" and agg != "COUNT":
+        raise HTTPException(
+            status_code=400, detail="Record count only supports COUNT aggregation"
+        )
+
+    row_cols = [_safe_identifier(c) for c in req.rows]
+    pivot_cols = [_safe_identifier(c) for c in req.columns]
+
+    try:
+        async with engine.connect() as conn:
+            # ---- 1. Resolve the (capped) set of pivot column keys ----
+            column_keys = []
+            keys_truncated = False
+            if pivot_cols:
+                keys_sql = (
+                    f"SELECT {', '.join(f'{c} AS k_{i}' for i, c in enumerate(pivot_cols))} "
+                    f"FROM {table} "
+                    f"GROUP BY {', '.join(pivot_cols)} "
+                    f"ORDER BY COUNT(*) DESC "
+                    f"LIMIT {req.max_column_keys + 1}"
+                )
+                logger.info("Pivot keys SQL: %s", keys_sql)
+                result = await conn.execute(text(keys_sql))
+                column_keys = [list(r) for r in result.fetchall()]
+                if len(column_keys) > req.max_column_keys:
+                    keys_truncated = True
+                    column_keys = column_keys[: req.max_column_keys]
+
+            # ---- 2. Conditional aggregation, one expression per column key ----
+            params = {}
+            select_parts = [f"{c} AS r_{i}" for i, c in enumerate(row_cols)]
+            if req.subtotals:
+                select_parts += [
+                    f"GROUPING({c}) AS g_{i}" for i, c in enumerate(row_cols)
+                ]
+            for k, key in enumerate(column_keys):
+                conds = []
+                for j, value in enumerate(key):
+                    param = f"ck_{k}_{j}"
+                    params[param] = value
+                    conds.append(f"{pivot_cols[j]} IS NOT DISTINCT FROM :{param}")
+                select_parts.append(
+                    f"{aggregate_sql(agg, measure_expr)} "
+                    f"FILTER (WHERE {' AND '.join(conds)}) AS c_{k}"
+                )
+            select_parts.append(f"{aggregate_sql(agg, measure_expr)} AS total")
+
+            group_by = ", ".join(row_cols)
+            if req.subtotals:
+                group_by = f"ROLLUP({group_by})"
+                order_by = ", ".join(
+                    f"g_{i}, r_{i}" for i in range(len(row_cols))
+                )
+            else:
+                order_by = ", ".join(f"r_{i}" for i in range(len(row_cols)))
+
+            sql = (
+                f"SELECT {', '.join(select_parts)} "
+                f"FROM {table} "
+                f"GROUP BY {group_by} "
+                f"ORDER BY {order_by} "
+                f"LIMIT {req.max_rows + 1}"
+            )
+            logger.info("Pivot SQL: %s", sql)
+            result = await conn.execute(text(sql), params)
+            raw_rows = [dict(r._mapping) for r in result.fetchall()]
+    except Exception as e:
+        logger.error("Pivot query failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Query error: {e}")
+
+    rows_truncated = len(raw_rows) > req.max_rows
+    raw_rows = raw_rows[: req.max_rows]
+
+    rows = []
+    for r in raw_rows:
+        level = (
+            sum(r[f"g_{i}"] for i in range(len(row_cols))) if req.subtotals else 0
+        )
+        rows.append(
+            {
+                "keys": [
+                    None if r[f"r_{i}"] is None else str(r[f"r_{i}"])
+                    for i in range(len(row_cols))
+                ],
+                "values": [_to_number(r[f"c_{k}"]) for k in range(len(column_keys))],
+                "total": _to_number(r["total"]),
+                "is_subtotal": level > 0,
+                "rollup_level": level,
+            }
+        )
+
+    return {
+        "dataset_id": req.dataset_id,
+        "row_dimensions": req.rows,
+        "column_dimensions": req.columns,
+        "measure": req.measure,
+        "aggregation": agg,
+        "column_keys": [
+            [None if v is None else str(v) for v in key] for key in column_keys
+        ],
+        "rows": rows,
+        "column_keys_truncated": keys_truncated,
+        "rows_truncated": rows_truncated,
+        "sql_query": sql,
+    }
@@ -11,10 +11,100 @@ class Settings(BaseSettings):
 
     APP_ENV: Literal["development", "production"] = "development"
     DATABASE_URL: str
-    DEEPINFRA_API_KEY: str
+    # Not needed when LLM_PROVIDER=stub or LLM_RECORD_MODE=replay
+    DEEPINFRA_API_KEY: str = ""
     REDIS_URL: str
     LOG_LEVEL: str = "INFO"
     RATE_LIMIT_TRUST_PROXY_HEADERS: bool = True
+    # "hybrid": local token buckets synced to Redis in batches; "redis": one
+    # atomic Redis check per request
+    RATE_LIMIT_BACKEND: Literal["hybrid", "redis"] = "hybrid"
+    RATE_LIMIT_SYNC_INTERVAL_SECONDS: float = 1.0
+    RATE_LIMIT_REDIS_TIMEOUT_SECONDS: float = 0.5
+    # When Redis can't be reached: keep admitting ("open") or refuse ("closed")
+    RATE_LIMIT_FAIL_MODE: Literal["open", "closed"] = "open"
+    RATE_LIMIT_STALE_AFTER_SECONDS: float = 10
+    # Quota tiers: route limits are multiplied by limit_multiplier, and the
+    # work budget is in cost units per RATE_LIMIT_BUDGET_WINDOW_SECONDS.
+    # Clients are assigned in the Redis hash rate_limit:client_tiers.
+    RATE_LIMIT_TIERS: dict[str, dict] = {
+        "free": {"limit_multiplier": 1.0, "budget": 500},
+        "pro": {"limit_multiplier": 5.0, "budget": 5000},
+        "internal": {"limit_multiplier": 20.0, "budget": 100_000},
+    }
+    RATE_LIMIT_DEFAULT_TIER: str = "free"
+    RATE_LIMIT_TIER_CACHE_SECONDS: float = 60
+    # Bounds on per-worker client state (tier cache, local buckets)
+    RATE_LIMIT_MAX_TRACKED_CLIENTS: int = 10_000
+    RATE_LIMIT_BUCKET_IDLE_SECONDS: float = 60
+    RATE_LIMIT_BUDGET_WINDOW_SECONDS: int = 60 * 60
+    # Cost units charged for the work a request does, on top of its route cost
+    RATE_LIMIT_TOKENS_PER_UNIT: float = 1000
+    RATE_LIMIT_ROWS_PER_UNIT: float = 10_000
+    RATE_LIMIT_QUERY_MS_PER_UNIT: float = 1000
+
+    # In-process columnar cache for hot datasets
+    COLUMNAR_CACHE_ENABLED: bool = False
+    COLUMNAR_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    COLUMNAR_CACHE_MAX_ROWS: int = 2_000_000
+    COLUMNAR_CACHE_HOT_THRESHOLD: int = 3
+
+    # Analytical query engine: Postgres, or DuckDB over Parquet snapshots
+    QUERY_ENGINE: Literal["postgres", "duckdb"] = "postgres"
+    PARQUET_SNAPSHOT_DIR: str = "data/snapshots"
+
+    # LLM response cache
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    LLM_CACHE_MAX_ENTRIES: int = 10_000
+    LLM_CACHE_LOCAL_MAX_ENTRIES: int = 512
+
+    # Column retrieval for text-to-SQL prompts on wide tables
+    COLUMN_RETRIEVAL_TOP_K: int = 25
+    COLUMN_RETRIEVAL_MIN_COLUMNS: int = 40
+
+    # Guard for LLM-generated SQL
+    SQL_GUARD_MAX_ROWS: int = 5000
+    SQL_GUARD_MAX_PLAN_COST: float = 1_000_000
+    SQL_GUARD_STATEMENT_TIMEOUT_MS: int = 15_000
+
+    # Server-side spool for LLM query results
+    RESULT_HANDLE_TTL_SECONDS: int = 60 * 60
+    RESULT_PAGE_SIZE: int = 200
+
+    # Common questions answered from SQL templates instead of the LLM
+    INTENT_MATCHER_ENABLED: bool = True
+
+    # Coalescing of identical in-flight requests
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_LOCK_TTL_SECONDS: int = 120
+    SINGLE_FLIGHT_RESULT_TTL_SECONDS: int = 10
+    SINGLE_FLIGHT_WAIT_SECONDS: float = 90
+
+    # Reuse of AI descriptions across uploads with matching columns
+    METADATA_REUSE_ENABLED: bool = True
+    METADATA_REUSE_MIN_OVERLAP: float = 0.5
+
+    # Chunked column-description generation for wide datasets
+    COLUMN_DESCRIPTION_CHUNK_TOKENS: int = 1500
+    COLUMN_DESCRIPTION_CONCURRENCY: int = 4
+    COLUMN_DESCRIPTION_CHUNK_RETRIES: int = 2
+
+    # LLM provider: DeepInfra or an offline stub, optionally recorded/replayed
+    LLM_PROVIDER: Literal["deepinfra", "stub"] = "deepinfra"
+    LLM_STUB_LATENCY_MS: float = 0
+    LLM_STUB_RESPONSES_FILE: str | None = None
+    LLM_STUB_DEFAULT_RESPONSE: str = "{}"
+    LLM_RECORD_MODE: Literal["off", "record", "replay"] = "off"
+    LLM_RECORDINGS_DIR: str = "data/llm_recordings"
+
+    # LLM concurrency governor (per model, per worker)
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_MAX_QUEUE_DEPTH: int = 64
+    LLM_QUEUE_MAX_WAIT_SECONDS: float = 15
+    LLM_CALL_TIMEOUT_SECONDS: float = 60
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", case_sensitive=False, extra="ignore"
@@ -0,0 +1,173 @@
+"""Response cache in front of the LLM chains.
+
+Entries are keyed by a namespace (which chain), the dataset, a fingerprint
+of the schema / inputs and the normalized user question, so asking the same
+thing about the same dataset never reaches the model twice. A small
+in-process LRU sits in front of Redis; entries in both expire
+``LLM_CACHE_TTL_SECONDS`` after they were created, and the oldest Redis
+entries are trimmed past ``LLM_CACHE_MAX_ENTRIES``. The LRU holds the
+serialised entry, so every hit gets its own copy to modify. Each entry remembers how long the original call
+took, so every hit adds that to the ``saved_ms`` counter.
+"""
+
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+import app.core.redis as redis_module
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "llm_cache:"
+INDEX_KEY = "llm_cache:index"
+STATS_KEY = "llm_cache:stats"
+
+# Sentence punctuation only: a mark followed by a space or the end. Operators,
+# signs and decimal points ("> 100", "!=", "-5", "2.5") change the meaning
+# of a question and must survive normalisation.
+_SENTENCE_PUNCTUATION = re.compile(r"[?!.,;:]+(?=\s|$)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-, whitespace- and sentence-punctuation-insensitive form of a question."""
+    query = _SENTENCE_PUNCTUATION.sub(" ", query.lower())
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def fingerprint(value: Any) -> str:
+    """Stable short hash of any JSON-serialisable value (schema, samples, rows)."""
+    payload = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class LLMResponseCache:
+    def __init__(self, enabled: bool, ttl_seconds: int, max_entries: int, local_max_entries: int):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.local_max_entries = local_max_entries
+        # key -> (expires at, serialised entry)
+        self._local: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def _key(self, namespace: str, parts: dict) -> str:
+        return f"{KEY_PREFIX}{namespace}:{fingerprint(parts)}"
+
+    def _remember(self, key: str, raw: str, created_at: float):
+        self._local[key] = (created_at + self.ttl_seconds, raw)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_max_entries:
+            self._local.popitem(last=False)
+
+    async def _lookup(self, key: str) -> dict | None:
+        local = self._local.get(key)
+        if local is not None:
+            expires_at, raw = local
+            if time.time() < expires_at:
+                self._local.move_to_end(key)
+                return json.loads(raw)
+            del self._local[key]
+        try:
+            raw = await redis_module.redis_client.get(key)
+        except Exception as e:
+            logger.warning("LLM cache read failed: %s", e)
+            return None
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        self._remember(key, raw, entry.get("created_at", time.time()))
+        return entry
+
+    async def _store(self, key: str, entry: dict):
+        raw = json.dumps(entry, default=str)
+        self._remember(key, raw, entry["created_at"])
+        try:
+            async with redis_module.redis_client.pipeline() as pipe:
+                pipe.set(key, raw, ex=self.ttl_seconds)
+                pipe.zadd(INDEX_KEY, {key: time.time()})
+                pipe.zcard(INDEX_KEY)
+                _, _, size = await pipe.execute()
+            if size > self.max_entries:
+                # Size eviction: drop the oldest entries beyond the cap
+                overflow = await redis_module.redis_client.zrange(
+                    INDEX_KEY, 0, size - self.max_entries - 1
+                )
+                if overflow:
+                    async with redis_module.redis_client.pipeline() as pipe:
+                        pipe.delete(*overflow)
+                        pipe.zrem(INDEX_KEY, *overflow)
+                        await pipe.execute()
+        except Exception as e:
+            logger.warning("LLM cache write failed: %s", e)
+
+    async def _record(self, field: str, amount: float = 1):
+        try:
+            await redis_module.redis_client.hincrbyfloat(STATS_KEY, field, amount)
+        except Exception:
+            pass
+
+    async def get_or_call(
+        self, namespace: str, parts: dict, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return the cached response for ``(namespace, parts)`` or await
+        ``call()`` and cache its result. Exceptions from ``call`` are not cached.
+        """
+        if not self.enabled:
+            return await call()
+
+        key = self._key(namespace, parts)
+        entry = await self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            self.saved_ms += entry["latency_ms"]
+            await self._record("hits")
+            await self._record("saved_ms", entry["latency_ms"])
+            logger.info(
+                "LLM cache hit (%s), saved %.0f ms", namespace, entry["latency_ms"]
+            )
+            return entry["response"]
+
+        start = time.perf_counter()
+        response = await call()
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        self.misses += 1
+        await self._record("misses")
+        await self._store(
+            key,
+            {"response": response, "latency_ms": latency_ms, "created_at": time.time()},
+        )
+        return response
+
+    async def stats(self) -> dict:
+        """Worker-local counters plus the totals shared through Redis."""
+        shared = {}
+        try:
+            shared = await redis_module.redis_client.hgetall(STATS_KEY)
+        except Exception as e:
+            logger.warning("LLM cache stats read failed: %s", e)
+        return {
+            "worker": {
+                "hits": self.hits,
+                "misses": self.misses,
+                "saved_ms": round(self.saved_ms, 1),
+            },
+            "total": {k: float(v) for k, v in shared.items()},
+        }
+
+
+llm_cache = LLMResponseCache(
+    enabled=settings.LLM_CACHE_ENABLED,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    local_max_entries=settings.LLM_CACHE_LOCAL_MAX_ENTRIES,
+)
@@ -0,0 +1,231 @@
+"""Concurrency governor around the chat models.
+
+Every model gets its own governor that:
+
+* caps concurrent calls at ``LLM_MAX_CONCURRENCY`` and queues the rest;
+* rejects new calls up front when the queue is full
+  (``LLM_MAX_QUEUE_DEPTH``) or the expected wait - queue depth times the
+  recent call latency - would exceed ``LLM_QUEUE_MAX_WAIT_SECONDS``, and
+  drops calls that still wait longer than that;
+* aborts calls running longer than ``LLM_CALL_TIMEOUT_SECONDS``;
+* opens a circuit breaker after ``LLM_BREAKER_FAILURE_THRESHOLD``
+  consecutive failures, failing fast for ``LLM_BREAKER_RESET_SECONDS``
+  before letting one probe call through.
+
+Rejections raise LLMUnavailableError. Callers already degrade on errors:
+cached answers are served before the governor is reached, chart specs fall
+back to the deterministic builder, and descriptions to empty values.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.pipeline_metrics import record_llm_usage
+
+logger = get_logger(__name__)
+
+# Weight of the latest call in the moving latency average
+_LATENCY_ALPHA = 0.2
+
+
+class LLMUnavailableError(RuntimeError):
+    """The governor refused or abandoned an LLM call."""
+
+
+class LLMGovernor:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue_depth: int,
+        max_wait_seconds: float,
+        call_timeout_seconds: float,
+        failure_threshold: int,
+        reset_seconds: float,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.max_wait_seconds = max_wait_seconds
+        self.call_timeout_seconds = call_timeout_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._probe_in_flight = False
+        self.in_flight = 0
+        self.queued = 0
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.wait_ms_total = 0.0
+        self.max_wait_ms = 0.0
+        self.latency_ms: float | None = None
+
+    @property
+    def breaker_state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        logger.warning("LLM call to %s rejected: %s", self.name, reason)
+        raise LLMUnavailableError(f"LLM {self.name} unavailable: {reason}")
+
+    def _admit(self) -> bool:
+        """Admission control; returns whether this call is the half-open probe."""
+        state = self.breaker_state
+        if state == "open":
+            self._reject("circuit breaker open")
+        if state == "half_open":
+            if self._probe_in_flight:
+                self._reject("circuit breaker half-open, probe in flight")
+            return True
+        if self.queued >= self.max_queue_depth:
+            self._reject(f"queue full ({self.queued} waiting)")
+        if self.latency_ms and self.in_flight >= self.max_concurrency:
+            # Deadline-aware admission: don't queue a call that can't start in time
+            expected_wait = (
+                (self.queued + 1) / self.max_concurrency * self.latency_ms / 1000
+            )
+            if expected_wait > self.max_wait_seconds:
+                self._reject(f"expected queue wait {expected_wait:.1f}s too long")
+        return False
+
+    def _on_success(self, latency_ms: float):
+        self.consecutive_failures = 0
+        if self.opened_at is not None:
+            logger.info("LLM circuit breaker for %s closed", self.name)
+        self.opened_at = None
+        self.latency_ms = (
+            latency_ms
+            if self.latency_ms is None
+            else (1 - _LATENCY_ALPHA) * self.latency_ms + _LATENCY_ALPHA * latency_ms
+        )
+
+    def _on_failure(self):
+        self.consecutive_failures += 1
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.breaker_state != "open":
+                logger.warning(
+                    "LLM circuit breaker for %s opened after %d failures",
+                    self.name,
+                    self.consecutive_failures,
+                )
+            self.opened_at = time.monotonic()
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        probe = self._admit()
+        if probe:
+            self._probe_in_flight = True
+        try:
+            self.queued += 1
+            queued_at = time.perf_counter()
+            try:
+                await asyncio.wait_for(
+                    self._semaphore.acquire(), timeout=self.max_wait_seconds
+                )
+            except asyncio.TimeoutError:
+                self._reject(f"waited over {self.max_wait_seconds:g}s in queue")
+            finally:
+                self.queued -= 1
+
+            wait_ms = (time.perf_counter() - queued_at) * 1000
+            self.wait_ms_total += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.calls += 1
+            self.in_flight += 1
+            started_at = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(call(), timeout=self.call_timeout_seconds)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._on_failure()
+                raise LLMUnavailableError(
+                    f"LLM {self.name} timed out after {self.call_timeout_seconds:g}s"
+                )
+            except Exception:
+                self.failures += 1
+                self._on_failure()
+                raise
+            finally:
+                self.in_flight -= 1
+                self._semaphore.release()
+
+            self._on_success((time.perf_counter() - started_at) * 1000)
+            return result
+        finally:
+            if probe:
+                self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "breaker": self.breaker_state,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "avg_wait_ms": round(self.wait_ms_total / self.calls, 1) if self.calls else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 1),
+            "avg_latency_ms": round(self.latency_ms or 0.0, 1),
+        }
+
+
+_governors: dict[str, LLMGovernor] = {}
+
+
+def get_governor(name: str) -> LLMGovernor:
+    governor = _governors.get(name)
+    if governor is None:
+        governor = _governors[name] = LLMGovernor(
+            name,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_queue_depth=settings.LLM_MAX_QUEUE_DEPTH,
+            max_wait_seconds=settings.LLM_QUEUE_MAX_WAIT_SECONDS,
+            call_timeout_seconds=settings.LLM_CALL_TIMEOUT_SECONDS,
+            failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+            reset_seconds=settings.LLM_BREAKER_RESET_SECONDS,
+        )
+    return governor
+
+
+def governor_stats() -> dict:
+    """Queue depth, wait times and breaker state per model (this worker)."""
+    return {name: governor.stats() for name, governor in _governors.items()}
+
+
+class GovernedChatModel(BaseChatModel):
+    """Routes a chat model's async calls through its model's governor."""
+
+    inner: BaseChatModel
+    model_name: str
+
+    @property
+    def _llm_type(self) -> str:
+        return getattr(self.inner, "_llm_type", "chat")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self.inner.invoke(messages, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        message = await get_governor(self.model_name).run(
+            lambda: self.inner.ainvoke(messages, stop=stop, **kwargs)
+        )
+        record_llm_usage(message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
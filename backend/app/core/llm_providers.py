@@ -0,0 +1,201 @@
+"""LLM provider selection: DeepInfra, an offline stub, and record / replay.
+
+``LLM_PROVIDER`` picks the backing chat model:
+
+* ``deepinfra`` - the OpenAI-compatible DeepInfra endpoint (default);
+* ``stub`` - a local deterministic model. It sleeps ``LLM_STUB_LATENCY_MS``
+  and answers from the rules in ``LLM_STUB_RESPONSES_FILE`` (a JSON list of
+  ``{"model": ..., "match": <regex>, "response": <str or JSON>}``, first
+  match wins), else ``LLM_STUB_DEFAULT_RESPONSE``.
+
+``LLM_RECORD_MODE`` wraps whichever model was chosen: ``record`` saves every
+exchange under ``LLM_RECORDINGS_DIR`` (one JSON file per distinct prompt),
+``replay`` answers only from those files and never calls the provider, so
+pipeline benchmarks run offline and reproducibly. The result is always
+wrapped by the model's concurrency governor.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+from app.core.llm_governor import GovernedChatModel
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+DEEPINFRA_BASE_URL = "https://api.deepinfra.com/v1/openai"
+
+# Model and sampling settings per pipeline role
+MODEL_ROLES = {
+    # Low temperature since we want structured data/SQL
+    "main": {"model": "Qwen/Qwen2.5-72B-Instruct", "temperature": 0.2, "max_retries": 2},
+    # The fast/cheap brain for simple metadata categorization
+    "description": {"model": "meta-llama/Meta-Llama-3-8B-Instruct", "temperature": 0.0},
+}
+
+
+def _load_stub_rules(path: str | None) -> list[dict]:
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    for rule in rules:
+        if not isinstance(rule["response"], str):
+            rule["response"] = json.dumps(rule["response"])
+    return rules
+
+
+def _prompt_text(messages: list[BaseMessage]) -> str:
+    return "\n".join(f"{m.type}: {m.content}" for m in messages)
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic offline chat model with configurable latency."""
+
+    model_name: str
+    latency_ms: float = 0
+    rules: list[dict] = []
+    default_response: str = "{}"
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _respond(self, messages: list[BaseMessage]) -> ChatResult:
+        prompt = _prompt_text(messages)
+        content = self.default_response
+        for rule in self.rules:
+            if rule.get("model", self.model_name) != self.model_name:
+                continue
+            if re.search(rule["match"], prompt, re.IGNORECASE | re.DOTALL):
+                content = rule["response"]
+                break
+        # Rough token counts so usage accounting works offline too
+        usage = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4,
+        }
+        message = AIMessage(content=content, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        return self._respond(messages)
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(messages)
+
+
+class RecordReplayChatModel(BaseChatModel):
+    """Wraps a chat model to record its exchanges to disk or replay them."""
+
+    inner: BaseChatModel
+    model_name: str
+    mode: str
+    directory: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"{self.mode}:{getattr(self.inner, '_llm_type', 'chat')}"
+
+    def _path(self, messages: list[BaseMessage], kwargs: dict) -> str:
+        payload = json.dumps(
+            {
+                "model": self.model_name,
+                "messages": [[m.type, m.content] for m in messages],
+                "kwargs": kwargs,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        key = hashlib.sha256(payload.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _replay(self, path: str) -> ChatResult:
+        try:
+            with open(path, encoding="utf-8") as f:
+                recording = json.load(f)
+        except FileNotFoundError:
+            raise LookupError(f"No LLM recording for this prompt ({path})")
+        message = AIMessage(
+            content=recording["content"],
+            usage_metadata=recording.get("usage_metadata"),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _record(self, path: str, messages: list[BaseMessage], message: BaseMessage):
+        os.makedirs(self.directory, exist_ok=True)
+        recording = {
+            "model": self.model_name,
+            "prompt": _prompt_text(messages),
+            "content": message.content,
+            "usage_metadata": getattr(message, "usage_metadata", None),
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(recording, f, indent=2, default=str)
+        os.replace(tmp_path, path)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        path = self._path(messages, kwargs)
+        if self.mode == "replay":
+            return self._replay(path)
+        message = self.inner.invoke(messages, stop=stop, **kwargs)
+        self._record(path, messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        path = self._path(messages, kwargs)
+        if self.mode == "replay":
+            return self._replay(path)
+        message = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+        await asyncio.to_thread(self._record, path, messages, message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def build_chat_model(role: str) -> BaseChatModel:
+    """The chat model for a pipeline role (``main`` / ``description``)."""
+    config = MODEL_ROLES[role]
+    model: Any
+    if settings.LLM_PROVIDER == "stub":
+        model = StubChatModel(
+            model_name=config["model"],
+            latency_ms=settings.LLM_STUB_LATENCY_MS,
+            rules=_load_stub_rules(settings.LLM_STUB_RESPONSES_FILE),
+            default_response=settings.LLM_STUB_DEFAULT_RESPONSE,
+        )
+    else:
+        # We use the ChatOpenAI client, but redirect the base_url to DeepInfra!
+        model = ChatOpenAI(
+            api_key=settings.DEEPINFRA_API_KEY,
+            base_url=DEEPINFRA_BASE_URL,
+            **config,
+        )
+
+    if settings.LLM_RECORD_MODE != "off":
+        logger.info("LLM %s mode for %s", settings.LLM_RECORD_MODE, config["model"])
+        model = RecordReplayChatModel(
+            inner=model,
+            model_name=config["model"],
+            mode=settings.LLM_RECORD_MODE,
+            directory=settings.LLM_RECORDINGS_DIR,
+        )
+    # Concurrency cap, timeouts and circuit breaker (see llm_governor)
+    return GovernedChatModel(inner=model, model_name=config["model"])
@@ -0,0 +1,200 @@
+"""Per-stage latency and token accounting for the LLM pipelines.
+
+Graph nodes and metadata chains are wrapped with ``@instrument("<stage>")``,
+which records wall time, LLM calls, prompt / completion tokens (reported by
+the governed chat models through ``record_llm_usage``) and result row counts.
+Every finished stage is:
+
+* appended to the current request's trace (``start_trace``), which routes
+  return as an optional ``timings`` block;
+* added to this worker's aggregates, which a background task adds to the
+  shared Redis hashes ``pipeline_metrics:stats`` and
+  ``pipeline_metrics:tokens:<dataset_id>`` every
+  ``FLUSH_INTERVAL_SECONDS`` (one pipeline per flush, never on the request
+  path; failed flushes are retried).
+"""
+
+import asyncio
+import functools
+import time
+from contextvars import ContextVar
+
+import app.core.redis as redis_module
+from app.core.logging import get_logger
+from app.core.quotas import record_work
+
+logger = get_logger(__name__)
+
+STATS_KEY = "pipeline_metrics:stats"
+TOKENS_KEY_PREFIX = "pipeline_metrics:tokens:"
+_FIELDS = ("count", "ms", "llm_calls", "prompt_tokens", "completion_tokens", "rows")
+_TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "llm_calls")
+FLUSH_INTERVAL_SECONDS = 5.0
+
+_trace: ContextVar[dict | None] = ContextVar("pipeline_trace", default=None)
+_stage: ContextVar[dict | None] = ContextVar("pipeline_stage", default=None)
+_totals: dict[str, dict] = {}
+# Not yet flushed to Redis: stage -> field sums, dataset id -> token sums
+_pending_stats: dict[str, dict] = {}
+_pending_tokens: dict[str, dict] = {}
+_flush_task: asyncio.Task | None = None
+
+
+def start_trace(dataset_id: str | None = None) -> dict:
+    """Start collecting stages for the current request (and its child tasks)."""
+    trace = {"dataset_id": dataset_id, "started_at": time.perf_counter(), "stages": []}
+    _trace.set(trace)
+    return trace
+
+
+def record_llm_usage(message):
+    """Attribute one model response's token usage to the running stage."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    # Charged to the client's work budget as well (see app.core.quotas)
+    record_work(llm_tokens=usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+    stage = _stage.get()
+    if stage is None:
+        return
+    stage["llm_calls"] += 1
+    stage["prompt_tokens"] += usage.get("input_tokens", 0)
+    stage["completion_tokens"] += usage.get("output_tokens", 0)
+
+
+def _row_count(result) -> int:
+    if not isinstance(result, dict):
+        return 0
+    if result.get("row_count") is not None:
+        return result["row_count"]
+    rows = result.get("sql_results")
+    return len(rows) if isinstance(rows, list) else 0
+
+
+def _add(sums: dict, values: dict, fields: tuple):
+    for field in fields:
+        sums[field] = sums.get(field, 0) + values.get(field, 0)
+
+
+def _finish_stage(stage: dict):
+    global _flush_task
+    trace = _trace.get()
+    if trace is not None:
+        trace["stages"].append(stage)
+
+    counted = {**stage, "count": 1}
+    _add(_totals.setdefault(stage["stage"], dict.fromkeys(_FIELDS, 0)), counted, _FIELDS)
+    _add(_pending_stats.setdefault(stage["stage"], {}), counted, _FIELDS)
+    dataset_id = trace.get("dataset_id") if trace else None
+    if dataset_id and stage["llm_calls"]:
+        _add(_pending_tokens.setdefault(dataset_id, {}), stage, _TOKEN_FIELDS)
+
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flush_loop())
+
+
+async def _flush_loop():
+    while _pending_stats or _pending_tokens:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        await flush_metrics()
+
+
+async def flush_metrics():
+    """Add the buffered aggregates to the shared Redis hashes in one pipeline."""
+    if not _pending_stats and not _pending_tokens:
+        return
+    stats, tokens = dict(_pending_stats), dict(_pending_tokens)
+    _pending_stats.clear()
+    _pending_tokens.clear()
+    try:
+        async with redis_module.redis_client.pipeline(transaction=False) as pipe:
+            for stage, sums in stats.items():
+                pipe.hincrby(STATS_KEY, f"{stage}:count", sums["count"])
+                for field in _FIELDS[1:]:
+                    pipe.hincrbyfloat(STATS_KEY, f"{stage}:{field}", sums[field])
+            for dataset_id, sums in tokens.items():
+                key = f"{TOKENS_KEY_PREFIX}{dataset_id}"
+                for field in _TOKEN_FIELDS:
+                    pipe.hincrby(key, field, sums[field])
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to record pipeline metrics: %s", e)
+        # Keep them for the next flush
+        for stage, sums in stats.items():
+            _add(_pending_stats.setdefault(stage, {}), sums, _FIELDS)
+        for dataset_id, sums in tokens.items():
+            _add(_pending_tokens.setdefault(dataset_id, {}), sums, _TOKEN_FIELDS)
+
+
+def instrument(stage_name: str):
+    """Decorator for async graph nodes / chains that records one stage per call."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            stage = {
+                "stage": stage_name,
+                "ms": 0.0,
+                "llm_calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "rows": 0,
+            }
+            token = _stage.set(stage)
+            started_at = time.perf_counter()
+            result = None
+            try:
+                result = await fn(*args, **kwargs)
+                return result
+            finally:
+                _stage.reset(token)
+                stage["ms"] = round((time.perf_counter() - started_at) * 1000, 1)
+                stage["rows"] = _row_count(result)
+                _finish_stage(stage)
+
+        return wrapper
+
+    return decorator
+
+
+def summarize_trace(trace: dict) -> dict:
+    """The ``timings`` block: total wall time plus per-stage sums."""
+    stages: dict[str, dict] = {}
+    for stage in trace["stages"]:
+        summary = stages.setdefault(stage["stage"], dict.fromkeys(_FIELDS, 0))
+        summary["count"] += 1
+        for field in _FIELDS[1:]:
+            summary[field] += stage[field]
+    for summary in stages.values():
+        summary["ms"] = round(summary["ms"], 1)
+    return {
+        "total_ms": round((time.perf_counter() - trace["started_at"]) * 1000, 1),
+        "stages": stages,
+    }
+
+
+async def pipeline_stats(dataset_id: str | None = None) -> dict:
+    """
+    Worker-local and Redis-wide stage aggregates, plus a dataset's token
+    spend; the Redis totals trail by up to ``FLUSH_INTERVAL_SECONDS``.
+    """
+    shared, tokens = {}, None
+    try:
+        shared = await redis_module.redis_client.hgetall(STATS_KEY)
+        if dataset_id:
+            tokens = await redis_module.redis_client.hgetall(
+                f"{TOKENS_KEY_PREFIX}{dataset_id}"
+            )
+    except Exception as e:
+        logger.warning("Pipeline metrics read failed: %s", e)
+
+    total: dict[str, dict] = {}
+    for key, value in shared.items():
+        stage, field = key.rsplit(":", 1)
+        total.setdefault(stage, {})[field] = float(value)
+
+    stats = {"worker": _totals, "total": total}
+    if dataset_id:
+        stats["dataset"] = {
+            "dataset_id": dataset_id,
+            **{k: int(v) for k, v in (tokens or {}).items()},
+        }
+    return stats
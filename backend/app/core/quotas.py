@@ -0,0 +1,107 @@
+"""Per-client quota tiers and metering of the work a request actually does.
+
+Each client belongs to a tier from ``RATE_LIMIT_TIERS``; tiers are
+assigned in the Redis hash ``rate_limit:client_tiers``
+(``HSET rate_limit:client_tiers key:<sha256 prefix> pro``) and default to
+``RATE_LIMIT_DEFAULT_TIER``. An ``X-API-Key`` only identifies the client
+when its hash is registered there; any other key is ignored and the client
+is its IP, so made-up keys can't mint fresh limits. A tier scales every
+route's request limit and sets the client's work budget in cost units per
+``RATE_LIMIT_BUDGET_WINDOW_SECONDS``.
+
+While a request runs, LLM tokens (from the governed chat models) and rows /
+query time (from ``run_query``) are added to a per-request meter, which
+``work_cost`` converts to cost units once the request is done.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from fastapi import Request
+
+import app.core.redis as redis_module
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+CLIENT_TIERS_KEY = "rate_limit:client_tiers"
+API_KEY_HEADER = "x-api-key"
+
+
+@dataclass
+class WorkMeter:
+    llm_tokens: int = 0
+    rows: int = 0
+    query_ms: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+
+_meter: ContextVar[WorkMeter | None] = ContextVar("work_meter", default=None)
+# client id -> (assigned tier name or None, fetched at); LRU, size-capped
+_tier_cache: OrderedDict[str, tuple[str | None, float]] = OrderedDict()
+
+
+async def _assigned_tier(client: str) -> str | None:
+    """The tier assigned in Redis, if any; lookups are cached per worker."""
+    cached = _tier_cache.get(client)
+    if cached and time.monotonic() - cached[1] < settings.RATE_LIMIT_TIER_CACHE_SECONDS:
+        _tier_cache.move_to_end(client)
+        return cached[0]
+
+    name = None
+    try:
+        name = await redis_module.redis_client.hget(CLIENT_TIERS_KEY, client)
+    except Exception as e:
+        logger.warning("Could not load quota tier for %s: %s", client, e)
+    name = name if name in settings.RATE_LIMIT_TIERS else None
+    _tier_cache[client] = (name, time.monotonic())
+    _tier_cache.move_to_end(client)
+    while len(_tier_cache) > settings.RATE_LIMIT_MAX_TRACKED_CLIENTS:
+        _tier_cache.popitem(last=False)
+    return name
+
+
+async def resolve_client(request: Request, client_ip: str) -> tuple[str, dict]:
+    """
+    The client's identity and tier settings: ``key:<hash>`` for a registered
+    API key (never the raw key), else ``ip:<ip>``.
+    """
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key:
+        client = "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        name = await _assigned_tier(client)
+        if name is not None:
+            return client, {"name": name, **settings.RATE_LIMIT_TIERS[name]}
+
+    client = f"ip:{client_ip}"
+    name = await _assigned_tier(client) or settings.RATE_LIMIT_DEFAULT_TIER
+    return client, {"name": name, **settings.RATE_LIMIT_TIERS[name]}
+
+
+def start_work_meter() -> WorkMeter:
+    """Start metering the current request (shared with its child tasks)."""
+    meter = WorkMeter()
+    _meter.set(meter)
+    return meter
+
+
+def record_work(llm_tokens: int = 0, rows: int = 0, query_ms: float = 0.0):
+    meter = _meter.get()
+    if meter is None:
+        return
+    meter.llm_tokens += llm_tokens
+    meter.rows += rows
+    meter.query_ms += query_ms
+
+
+def work_cost(meter: WorkMeter) -> float:
+    """Cost units for the metered work, on top of the route's fixed cost."""
+    return (
+        meter.llm_tokens / settings.RATE_LIMIT_TOKENS_PER_UNIT
+        + meter.rows / settings.RATE_LIMIT_ROWS_PER_UNIT
+        + meter.query_ms / settings.RATE_LIMIT_QUERY_MS_PER_UNIT
+    )
@@ -1,8 +1,16 @@
+import asyncio
+import math
 import time
+from collections import OrderedDict
+from dataclasses import dataclass
 import app.core.redis as redis_module
-from fastapi import Request, HTTPException, status
+from fastapi import Request, Response, HTTPException, status
 from typing import Callable
 from app.core.config import settings
+from app.core.logging import get_logger
+from app.core.quotas import resolve_client, start_work_meter, work_cost
+
+logger = get_logger(__name__)
 
 
 def get_client_ip(request: Request) -> str:
@@ -21,67 +29,507 @@ def get_client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
-async def check_rate_limit(
-    identifier: str, limit: int, window_size_seconds: int = 60
-) -> bool:
+# Sliding window counters, evaluated atomically on the Redis server so that
+# concurrent requests can't all read the same count and slip past the limit.
+# Several limits (e.g. the route limit and the work budget) are checked in one
+# call, and the request is counted against all of them or none.
+# KEYS: current / previous window key pairs, one pair per limit
+# ARGV: now (s, float), then per limit: limit, window size (s),
+#       current window start (s), cost
+# Returns {all allowed (0/1), then per limit: allowed, remaining,
+#          reset (s until the current window ends)}
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local n = #KEYS / 2
+local result = {1}
+for i = 1, n do
+    local limit = tonumber(ARGV[4 * i - 2])
+    local window = tonumber(ARGV[4 * i - 1])
+    local window_start = tonumber(ARGV[4 * i])
+    local cost = tonumber(ARGV[4 * i + 1])
+
+    local prev_count = tonumber(redis.call('GET', KEYS[2 * i]) or '0')
+    local curr_count = tonumber(redis.call('GET', KEYS[2 * i - 1]) or '0')
+
+    local prev_weight = (window - (now - window_start)) / window
+    local estimated = prev_count * prev_weight + curr_count
+    local reset = math.ceil(window_start + window - now)
+
+    if estimated + cost > limit then
+        result[1] = 0
+        table.insert(result, 0)
+        table.insert(result, 0)
+    else
+        table.insert(result, 1)
+        table.insert(result, math.max(math.floor(limit - estimated - cost), 0))
+    end
+    table.insert(result, reset)
+end
+
+if result[1] == 1 then
+    for i = 1, n do
+        redis.call('INCRBYFLOAT', KEYS[2 * i - 1], ARGV[4 * i + 1])
+        redis.call('EXPIRE', KEYS[2 * i - 1], tonumber(ARGV[4 * i - 1]) * 2)
+    end
+end
+return result
+"""
+
+_sliding_window_script = None
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_seconds: int
+
+    def headers(self) -> dict[str, str]:
+        return {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset_seconds),
+        }
+
+    def quota_headers(self) -> dict[str, str]:
+        return {
+            "X-Quota-Limit": str(self.limit),
+            "X-Quota-Remaining": str(self.remaining),
+        }
+
+
+def _window_keys(identifier: str, window_size_seconds: int, now: float):
+    """Current / previous fixed-window keys and the current window's start."""
+    # calculate the timestamp of current and previous fixed windows
+    current_window_start = int(now // window_size_seconds) * window_size_seconds
+    previous_window_start = current_window_start - window_size_seconds
+
+    # The window size is part of the key so routes with different windows
+    # never share counters
+    prefix = f"rate_limit:{identifier}:{window_size_seconds}"
+    return (
+        f"{prefix}:{current_window_start}",
+        f"{prefix}:{previous_window_start}",
+        current_window_start,
+    )
+
+
+async def check_rate_limits(
+    checks: list[tuple[str, int, int, float]],
+) -> list[RateLimitResult]:
     """
-    Evaluates if a request is allowed based on the sliding window counter algorithm.
+    Evaluates ``(identifier, limit, window size, cost)`` checks with the
+    sliding window counter algorithm. Reading every window, deciding and
+    adding the costs (only if all pass) happen in one EVALSHA.
     """
+    global _sliding_window_script
+    if _sliding_window_script is None:
+        # redis-py sends EVALSHA and falls back to loading the script once
+        _sliding_window_script = redis_module.redis_client.register_script(
+            SLIDING_WINDOW_SCRIPT
+        )
 
-    window_size_seconds = 60
     current_time = time.time()
+    keys, args = [], [repr(current_time)]
+    for identifier, limit, window_size_seconds, cost in checks:
+        curr_key, prev_key, current_window_start = _window_keys(
+            identifier, window_size_seconds, current_time
+        )
+        keys += [curr_key, prev_key]
+        args += [limit, window_size_seconds, current_window_start, repr(float(cost))]
 
-    # calculate the timestamp of current and previous fixed windows
-    current_window_start = (
-        int(current_time // window_size_seconds) * window_size_seconds
-    )
-    previous_window_start = current_window_start - window_size_seconds
+    reply = await _sliding_window_script(keys=keys, args=args)
+    return [
+        RateLimitResult(bool(allowed), limit, int(remaining), int(reset))
+        for (_, limit, _, _), (allowed, remaining, reset) in zip(
+            checks, zip(*[iter(reply[1:])] * 3)
+        )
+    ]
 
-    curr_key = f"rate_limit:{identifier}:{int(current_window_start)}"
-    prev_key = f"rate_limit:{identifier}:{int(previous_window_start)}"
 
-    # query redis for both simultanously
-    prev_count_str, curr_count_str = await redis_module.redis_client.mget(
-        [prev_key, curr_key]
-    )
+# Batched sync for the hybrid limiter: adds each bucket's locally consumed
+# requests to its current window and returns the global sliding-window
+# estimate, for every bucket in one round trip.
+# KEYS: current / previous window key pairs, one pair per bucket
+# ARGV: now (s), then per bucket: consumed, window size (s), window start (s)
+# Returns the estimates as strings (Lua numbers are truncated to integers)
+SYNC_SCRIPT = """
+local now = tonumber(ARGV[1])
+local estimates = {}
+for i = 1, #KEYS / 2 do
+    local consumed = tonumber(ARGV[3 * i - 1])
+    local window = tonumber(ARGV[3 * i])
+    local window_start = tonumber(ARGV[3 * i + 1])
+    local curr_key, prev_key = KEYS[2 * i - 1], KEYS[2 * i]
+    if consumed > 0 then
+        redis.call('INCRBYFLOAT', curr_key, consumed)
+        redis.call('EXPIRE', curr_key, window * 2)
+    end
+    local prev_count = tonumber(redis.call('GET', prev_key) or '0')
+    local curr_count = tonumber(redis.call('GET', curr_key) or '0')
+    local prev_weight = (window - (now - window_start)) / window
+    estimates[i] = tostring(prev_count * prev_weight + curr_count)
+end
+return estimates
+"""
+
+
+@dataclass
+class _Bucket:
+    identifier: str
+    limit: int
+    window_size_seconds: int
+    tokens: float
+    updated_at: float
+    # Cost admitted or charged here but not yet added to the Redis counters
+    pending: float = 0.0
+    # Requests counted globally (all workers) at the last sync
+    global_used: float = 0.0
+
+
+class HybridRateLimiter:
+    """
+    Token buckets in process memory, reconciled with Redis in the background.
+
+    Each (client, route limit) gets a bucket holding ``limit`` tokens that
+    refill over the window, so requests are admitted without touching Redis.
+    Every ``RATE_LIMIT_SYNC_INTERVAL_SECONDS`` one batched script adds the
+    locally admitted requests to the shared sliding-window counters and reads
+    back the global usage, which caps each bucket at what is left across all
+    workers. Between syncs a client can overshoot by what other workers admit
+    in one interval.
+
+    Only buckets used since the last sync are sent. Idle, fully synced
+    buckets are dropped after ``RATE_LIMIT_BUCKET_IDLE_SECONDS`` (their
+    usage lives on in Redis and is read back if the client returns), and
+    at most ``RATE_LIMIT_MAX_TRACKED_CLIENTS`` synced buckets are kept,
+    least recently used first out (unsynced ones wait for the next sync).
+
+    If Redis is down or slower than ``RATE_LIMIT_REDIS_TIMEOUT_SECONDS`` the
+    unsynced counts are kept for the next attempt. With
+    ``RATE_LIMIT_FAIL_MODE=open`` decisions continue from local state alone;
+    with ``closed`` requests are refused once the last successful sync is
+    older than ``RATE_LIMIT_STALE_AFTER_SECONDS``.
+    """
+
+    def __init__(self):
+        self._buckets: OrderedDict[tuple, _Bucket] = OrderedDict()
+        self._sync_task: asyncio.Task | None = None
+        self._script = None
+        self.last_sync_at: float | None = None
+        self.sync_failures = 0
+
+    @property
+    def stale(self) -> bool:
+        if self.last_sync_at is None:
+            return self.sync_failures > 0
+        return time.monotonic() - self.last_sync_at > settings.RATE_LIMIT_STALE_AFTER_SECONDS
+
+    def _ensure_sync_task(self):
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+    def _bucket(self, identifier: str, limit: int, window_size_seconds: int, now: float):
+        """The existing bucket, refilled to ``now``, or None."""
+        key = (identifier, limit, window_size_seconds)
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+            rate = limit / window_size_seconds
+            bucket.tokens = min(limit, bucket.tokens + (now - bucket.updated_at) * rate)
+            bucket.updated_at = now
+        return bucket
+
+    async def acquire(
+        self, identifier: str, limit: int, window_size_seconds: int, cost: float = 1
+    ) -> RateLimitResult:
+        self._ensure_sync_task()
+        rate = limit / window_size_seconds
+        now = time.monotonic()
+
+        bucket = self._bucket(identifier, limit, window_size_seconds, now)
+        if bucket is None:
+            key = (identifier, limit, window_size_seconds)
+            bucket = self._buckets[key] = _Bucket(
+                identifier, limit, window_size_seconds, float(limit), now
+            )
+            self._evict_over_capacity(keep=key)
+            # Seed a new bucket with the client's global usage (one round
+            # trip per client and worker); later requests stay local
+            await self._sync([(key, bucket)])
+
+        if settings.RATE_LIMIT_FAIL_MODE == "closed" and self.stale:
+            return RateLimitResult(
+                False, limit, 0, math.ceil(settings.RATE_LIMIT_SYNC_INTERVAL_SECONDS)
+            )
 
-    # convert to int, default to 0 if None
-    prev_count = int(prev_count_str) if prev_count_str else 0
-    curr_count = int(curr_count_str) if curr_count_str else 0
+        if bucket.tokens < cost:
+            return RateLimitResult(
+                False, limit, 0, math.ceil((cost - bucket.tokens) / rate)
+            )
+        bucket.tokens -= cost
+        bucket.pending += cost
+        reset = math.ceil((limit - bucket.tokens) / rate)
+        return RateLimitResult(True, limit, int(bucket.tokens), reset)
+
+    def charge(self, identifier: str, limit: int, window_size_seconds: int, amount: float):
+        """Deduct work measured after admission; the bucket may go into debt."""
+        bucket = self._bucket(identifier, limit, window_size_seconds, time.monotonic())
+        if bucket is None:
+            return
+        bucket.tokens -= amount
+        bucket.pending += amount
+
+    def _evict_over_capacity(self, keep: tuple | None = None):
+        """Drop least recently used synced buckets beyond the size cap."""
+        overflow = len(self._buckets) - settings.RATE_LIMIT_MAX_TRACKED_CLIENTS
+        for key in list(self._buckets) if overflow > 0 else []:
+            if overflow <= 0:
+                break
+            # Unsynced counts must reach Redis first; the next sync sends them
+            if key != keep and self._buckets[key].pending <= 0:
+                del self._buckets[key]
+                overflow -= 1
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(settings.RATE_LIMIT_SYNC_INTERVAL_SECONDS)
+            await self.sync()
+
+    async def sync(self):
+        """Push pending counts and pull global usage for buckets used since the last sync."""
+        now = time.monotonic()
+        since = self.last_sync_at or 0.0
+        active = []
+        for key, bucket in list(self._buckets.items()):
+            if bucket.pending > 0 or bucket.updated_at >= since:
+                active.append((key, bucket))
+            elif now - bucket.updated_at > settings.RATE_LIMIT_BUCKET_IDLE_SECONDS:
+                del self._buckets[key]
+        if active:
+            await self._sync(active)
+        self._evict_over_capacity()
+
+    async def _sync(self, buckets: list[tuple[tuple, _Bucket]]):
+        if self._script is None:
+            self._script = redis_module.redis_client.register_script(SYNC_SCRIPT)
+
+        now_wall = time.time()
+        keys, args = [], [repr(now_wall)]
+        sent = []
+        for _, bucket in buckets:
+            curr_key, prev_key, window_start = _window_keys(
+                bucket.identifier, bucket.window_size_seconds, now_wall
+            )
+            keys += [curr_key, prev_key]
+            args += [repr(bucket.pending), bucket.window_size_seconds, window_start]
+            sent.append(bucket.pending)
+
+        try:
+            estimates = await asyncio.wait_for(
+                self._script(keys=keys, args=args),
+                timeout=settings.RATE_LIMIT_REDIS_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            # Pending counts stay on the buckets and go out with the next sync
+            self.sync_failures += 1
+            logger.warning("Rate limit sync to Redis failed: %s", e)
+            return
 
-    # calculate the weighted average
-    time_into_current_window = current_time - current_window_start
-    prev_weight = (window_size_seconds - time_into_current_window) / window_size_seconds
+        self.last_sync_at = time.monotonic()
+        for (key, bucket), consumed, estimate in zip(buckets, sent, estimates):
+            bucket.pending -= consumed
+            bucket.global_used = float(estimate)
+            # What's left across all workers, minus what we admitted since
+            bucket.tokens = min(
+                bucket.tokens, max(bucket.limit - bucket.global_used - bucket.pending, 0)
+            )
 
-    estimated_requests = (prev_count * prev_weight) + curr_count
+    async def aclose(self):
+        """Stop the background sync and flush what is still pending."""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        await self.sync()
 
-    if estimated_requests > limit:
-        return False
+    def stats(self) -> dict:
+        return {
+            "buckets": len(self._buckets),
+            "pending": round(sum(b.pending for b in self._buckets.values()), 2),
+            "sync_failures": self.sync_failures,
+            "seconds_since_sync": round(time.monotonic() - self.last_sync_at, 1)
+            if self.last_sync_at is not None
+            else None,
+            "fail_mode": settings.RATE_LIMIT_FAIL_MODE,
+        }
 
-    async with redis_module.redis_client.pipeline() as pipe:
-        pipe.incr(curr_key)
-        pipe.expire(curr_key, window_size_seconds * 2)
-        await pipe.execute()
 
-    return True
+hybrid_rate_limiter = HybridRateLimiter()
 
 
-def get_rate_limit(limit: int, window_size_seconds: int = 60) -> Callable:
+class ChargeBuffer:
     """
-    Returns a FastAPI dependency that checks the rate limit.
+    Cost measured after admission, for the Redis backend: added up per
+    counter in process memory and pushed to Redis with one batched script
+    every ``RATE_LIMIT_SYNC_INTERVAL_SECONDS``, off the request path. Failed
+    pushes are retried; at most ``RATE_LIMIT_MAX_TRACKED_CLIENTS`` counters
+    are buffered, oldest dropped first.
     """
 
-    async def _rate_limit_dependency(request: Request):
-        client_ip = get_client_ip(request)
+    def __init__(self):
+        self._pending: OrderedDict[tuple[str, int], float] = OrderedDict()
+        self._flush_task: asyncio.Task | None = None
+        self._script = None
+
+    def charge(self, identifier: str, window_size_seconds: int, amount: float):
+        key = (identifier, window_size_seconds)
+        self._pending[key] = self._pending.get(key, 0.0) + amount
+        self._pending.move_to_end(key)
+        while len(self._pending) > settings.RATE_LIMIT_MAX_TRACKED_CLIENTS:
+            self._pending.popitem(last=False)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            await asyncio.sleep(settings.RATE_LIMIT_SYNC_INTERVAL_SECONDS)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        if self._script is None:
+            self._script = redis_module.redis_client.register_script(SYNC_SCRIPT)
+
+        batch = list(self._pending.items())
+        self._pending.clear()
+        now = time.time()
+        keys, args = [], [repr(now)]
+        for (identifier, window_size_seconds), amount in batch:
+            curr_key, prev_key, window_start = _window_keys(
+                identifier, window_size_seconds, now
+            )
+            keys += [curr_key, prev_key]
+            args += [repr(amount), window_size_seconds, window_start]
+        try:
+            await asyncio.wait_for(
+                self._script(keys=keys, args=args),
+                timeout=settings.RATE_LIMIT_REDIS_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            logger.warning("Failed to push %d metered charges: %s", len(batch), e)
+            for (identifier, window_size_seconds), amount in batch:
+                self.charge(identifier, window_size_seconds, amount)
+
+    async def aclose(self):
+        """Stop the background flush and push what is still pending."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
 
-        identifier = f"ip:{client_ip}"
+charge_buffer = ChargeBuffer()
 
-        is_allowed = await check_rate_limit(identifier, limit, window_size_seconds)
 
-        if not is_allowed:
+async def _check(
+    checks: list[tuple[str, int, int, float]],
+) -> list[RateLimitResult | None]:
+    """
+    Admission on the configured backend, one result per check; None means
+    Redis is down and we fail open. The hybrid limiter stops at the first
+    refusal (later checks come back as None).
+    """
+    if settings.RATE_LIMIT_BACKEND == "hybrid":
+        results = []
+        for check in checks:
+            result = await hybrid_rate_limiter.acquire(*check)
+            results.append(result)
+            if not result.allowed:
+                break
+        return results + [None] * (len(checks) - len(results))
+
+    try:
+        return await asyncio.wait_for(
+            check_rate_limits(checks),
+            timeout=settings.RATE_LIMIT_REDIS_TIMEOUT_SECONDS,
+        )
+    except Exception as e:
+        logger.warning("Rate limit check against Redis failed: %s", e)
+    if settings.RATE_LIMIT_FAIL_MODE == "closed":
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Rate limiter unavailable",
+        )
+    return [None] * len(checks)
+
+
+def charge_rate_limit(
+    identifier: str, limit: int, window_size_seconds: int, amount: float
+):
+    """Add cost measured after a request was admitted to its counters."""
+    if settings.RATE_LIMIT_BACKEND == "hybrid":
+        hybrid_rate_limiter.charge(identifier, limit, window_size_seconds, amount)
+    else:
+        charge_buffer.charge(identifier, window_size_seconds, amount)
+
+
+def get_rate_limit(
+    limit: int, window_size_seconds: int = 60, cost: float = 1
+) -> Callable:
+    """
+    Returns a FastAPI dependency that checks the rate limit and sets the
+    ``RateLimit-Limit`` / ``-Remaining`` / ``-Reset`` response headers.
+    ``RATE_LIMIT_BACKEND`` picks the hybrid local limiter or the Redis check.
+
+    ``limit`` (requests per window) is scaled by the client's quota tier.
+    ``cost`` is charged up front against the client's work budget, checked
+    together with the route limit in one round trip; the LLM tokens, rows
+    and query time the request then uses are charged to the budget when it
+    finishes (batched, see ``ChargeBuffer``), so expensive clients run out
+    first.
+    """
+
+    async def _rate_limit_dependency(request: Request, response: Response):
+        client_ip = get_client_ip(request)
+
+        identifier, tier = await resolve_client(request, client_ip)
+        route_limit = max(1, round(limit * tier["limit_multiplier"]))
+        budget_key = f"budget:{identifier}"
+        budget_window = settings.RATE_LIMIT_BUDGET_WINDOW_SECONDS
+
+        result, budget = await _check(
+            [
+                (identifier, route_limit, window_size_seconds, 1),
+                (budget_key, tier["budget"], budget_window, cost),
+            ]
+        )
+        if result is not None and not result.allowed:
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="Too many requests",
+                headers={**result.headers(), "Retry-After": str(result.reset_seconds)},
+            )
+
+        if budget is not None and not budget.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Quota exhausted for the '{tier['name']}' tier",
+                headers={**budget.quota_headers(), "Retry-After": str(budget.reset_seconds)},
             )
 
+        if result is not None:
+            response.headers.update(result.headers())
+        if budget is not None:
+            response.headers.update(budget.quota_headers())
+
+        meter = start_work_meter()
+        try:
+            yield
+        finally:
+            extra = work_cost(meter)
+            if extra > 0:
+                charge_rate_limit(budget_key, tier["budget"], budget_window, extra)
+
     return _rate_limit_dependency
@@ -0,0 +1,175 @@
+"""Single-flight coalescing for identical in-flight requests.
+
+When a shared dashboard loads, the same suggest / column-bar / KPI request
+can arrive many times within milliseconds. ``single_flight.do`` keys each
+call by a fingerprint of its normalized request:
+
+* inside a worker, duplicates await the task already running for that key,
+  with no Redis traffic at all;
+* across workers, only for calls made with ``distributed=True`` (the LLM
+  routes, where a duplicate costs far more than a few round trips), the first
+  to take a short Redis lock computes the result and publishes it (result
+  key + pub/sub message); the others wait for it instead of running the work
+  again.
+
+If the leader fails with an HTTPException the followers raise the same
+error; on any other failure, timeout or Redis problem they simply run the
+call themselves. Counters are kept per worker.
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+import app.core.redis as redis_module
+from app.core.config import settings
+from app.core.llm_cache import fingerprint
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "single_flight:"
+
+
+class SingleFlight:
+    def __init__(
+        self,
+        enabled: bool,
+        lock_ttl_seconds: int,
+        result_ttl_seconds: int,
+        wait_seconds: float,
+    ):
+        self.enabled = enabled
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.wait_seconds = wait_seconds
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.local_shared = 0
+        self.remote_shared = 0
+
+    async def do(
+        self,
+        namespace: str,
+        parts: dict,
+        call: Callable[[], Awaitable[Any]],
+        distributed: bool = False,
+    ) -> Any:
+        """
+        Await ``call()`` once per ``(namespace, parts)`` across concurrent
+        callers in this worker, and across all workers when ``distributed``.
+        Results shared across workers must be JSON-serialisable.
+        """
+        if not self.enabled:
+            return await call()
+
+        key = f"{KEY_PREFIX}{namespace}:{fingerprint(parts)}"
+        task = self._inflight.get(key)
+        if task is not None:
+            self.local_shared += 1
+            logger.info("Coalesced duplicate %s request in-process", namespace)
+        else:
+            # A detached task, so one caller disconnecting doesn't cancel the
+            # work the others are waiting on
+            work = self._run_distributed(key, call) if distributed else call()
+            task = asyncio.create_task(work)
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _run_distributed(self, key: str, call: Callable[[], Awaitable[Any]]):
+        lock_key = f"{key}:lock"
+        result_key = f"{key}:result"
+        try:
+            acquired = await redis_module.redis_client.set(
+                lock_key, "1", nx=True, ex=self.lock_ttl_seconds
+            )
+        except Exception as e:
+            logger.warning("Single-flight lock failed, running uncoalesced: %s", e)
+            return await call()
+
+        if not acquired:
+            outcome = await self._wait_for_leader(result_key)
+            if outcome is not None and "result" in outcome:
+                self.remote_shared += 1
+                return outcome["result"]
+            if outcome is not None and "error" in outcome:
+                self.remote_shared += 1
+                raise HTTPException(**outcome["error"])
+            # Leader failed or took too long: do the work here
+            return await call()
+
+        self.leaders += 1
+        try:
+            result = await call()
+        except HTTPException as e:
+            await self._publish(
+                lock_key,
+                result_key,
+                {"error": {"status_code": e.status_code, "detail": e.detail}},
+            )
+            raise
+        except BaseException:
+            await self._publish(lock_key, result_key, {"failed": True})
+            raise
+        await self._publish(lock_key, result_key, {"result": jsonable_encoder(result)})
+        return result
+
+    async def _publish(self, lock_key: str, result_key: str, outcome: dict):
+        """Store and announce the outcome and release the lock, in one round trip."""
+        payload = json.dumps(outcome, default=str)
+        try:
+            async with redis_module.redis_client.pipeline(transaction=False) as pipe:
+                pipe.set(result_key, payload, ex=self.result_ttl_seconds)
+                pipe.publish(result_key, payload)
+                pipe.delete(lock_key)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Single-flight publish failed: %s", e)
+
+    async def _wait_for_leader(self, result_key: str) -> dict | None:
+        pubsub = redis_module.redis_client.pubsub()
+        try:
+            await pubsub.subscribe(result_key)
+            # The leader may have finished before we subscribed
+            raw = await redis_module.redis_client.get(result_key)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.wait_seconds
+            while raw is None and loop.time() < deadline:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+                if message is not None:
+                    raw = message["data"]
+            return json.loads(raw) if raw is not None else None
+        except Exception as e:
+            logger.warning("Single-flight wait failed: %s", e)
+            return None
+        finally:
+            try:
+                await pubsub.unsubscribe(result_key)
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    async def stats(self) -> dict:
+        """This worker's counters; ``leaders`` counts distributed calls only."""
+        return {
+            "worker": {
+                "leaders": self.leaders,
+                "local_shared": self.local_shared,
+                "remote_shared": self.remote_shared,
+                "in_flight": len(self._inflight),
+            },
+        }
+
+
+single_flight = SingleFlight(
+    enabled=settings.SINGLE_FLIGHT_ENABLED,
+    lock_ttl_seconds=settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS,
+    result_ttl_seconds=settings.SINGLE_FLIGHT_RESULT_TTL_SECONDS,
+    wait_seconds=settings.SINGLE_FLIGHT_WAIT_SECONDS,
+)
@@ -8,6 +8,8 @@ from app.api.v1.api import router as api_router
 from app.core.config import settings
 from app.core.logging import get_logger
 from app.core.db import engine
+from app.core.pipeline_metrics import flush_metrics
+from app.core.rate_limit import charge_buffer, hybrid_rate_limiter
 import app.core.redis as redis_module
 
 logger = get_logger(__name__)
@@ -28,6 +30,12 @@ async def lifespan(app: FastAPI):
 
     yield
 
+    # Flush locally admitted requests and metered work to the shared
+    # rate-limit counters, and buffered pipeline metrics
+    await hybrid_rate_limiter.aclose()
+    await charge_buffer.aclose()
+    await flush_metrics()
+
     await redis_module.redis_client.aclose()
     logger.info("Redis disconnected")
 
@@ -50,6 +58,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "RateLimit-Limit",
+        "RateLimit-Remaining",
+        "RateLimit-Reset",
+        "Retry-After",
+        "X-Quota-Limit",
+        "X-Quota-Remaining",
+    ],
 )
 
 # Include API router
@@ -17,6 +17,12 @@ class DatasetRegistry(Base):
     column_count = Column(Integer, nullable=True)
     column_descriptions = Column(JSON, default=dict)
     column_types = Column(JSON, default=dict)
+    column_stats = Column(JSON, nullable=True)
+    chart_suggestions = Column(JSON, nullable=True)
+    column_index = Column(JSON, nullable=True)
+    column_signature = Column(JSON, nullable=True)
+    signature_hash = Column(String, index=True, nullable=True)
+    suggestions_generated_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(
         DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow
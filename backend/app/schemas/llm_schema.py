@@ -8,11 +8,23 @@ class ChartGeneratorState(TypedDict):
     user_query: str
     schema_info: List[dict]
     sql_query: Optional[str]
+    sql_source: Optional[str]
+    schema_pruned: Optional[bool]
     sql_error: Optional[str]
     sql_results: Optional[List[dict]]
+    result_handle: Optional[str]
+    row_count: Optional[int]
     chart_spec: Optional[dict]
 
 
+class SqlBatchState(TypedDict):
+    dataset_id: str
+    schema_info: List[dict]
+    questions: List[str]
+    sql_queries: List[Optional[str]]
+    schema_pruned: bool
+
+
 class ChartGenerateRequest(BaseModel):
     dataset_id: str
     user_query: str
@@ -23,19 +35,27 @@ class KpiComputeRequest(BaseModel):
     kpi_column: str
     aggregation: str = Field(
         default="COUNT",
-        description="Aggregation function: COUNT, SUM, AVG, MIN, MAX",
+        description="Aggregation function: COUNT, SUM, AVG, MIN, MAX, MEDIAN, P90, P95, P99, COUNT_DISTINCT",
     )
     date_column: Optional[str] = Field(
         default=None,
         description="Optional date column for time-based grouping",
     )
+    approximate: bool = Field(
+        default=False,
+        description="Aggregate over a TABLESAMPLE and return scaled estimates with error bounds (COUNT_DISTINCT needs sketch mode)",
+    )
+    sketch: bool = Field(
+        default=False,
+        description="Answer percentile / COUNT_DISTINCT from precomputed KLL / HyperLogLog sketches",
+    )
 
 
 class ColumnBarXValue(BaseModel):
     column: str = Field(description="Column name, or '__record_count__' for row count")
     aggregation: str = Field(
         default="COUNT",
-        description="Aggregation: COUNT, SUM, AVG, MIN, MAX",
+        description="Aggregation: COUNT, SUM, AVG, MIN, MAX, MEDIAN, P90, P95, P99, COUNT_DISTINCT",
     )
 
 
@@ -49,8 +69,63 @@ class ColumnBarRequest(BaseModel):
     slice: Optional[str] = Field(
         default=None, description="Optional column for stacked/grouped series"
     )
+    time_grain: Optional[str] = Field(
+        default=None,
+        description="Bucket a date y_axis by day, week, month, quarter or year",
+    )
     sort_by: Optional[str] = Field(default=None, description="Column to sort by")
     sort_dir: str = Field(default="desc", description="Sort direction: asc or desc")
     chart_type: str = Field(
         default="column", description="'column' (vertical) or 'bar' (horizontal)"
     )
+    approximate: bool = Field(
+        default=False,
+        description="Aggregate over a TABLESAMPLE and return scaled estimates with error bounds (COUNT_DISTINCT needs sketch mode)",
+    )
+    sketch: bool = Field(
+        default=False,
+        description="Answer percentile / COUNT_DISTINCT from precomputed KLL / HyperLogLog sketches",
+    )
+
+
+class PivotRequest(BaseModel):
+    dataset_id: str
+    rows: List[str] = Field(
+        description="Row dimension columns, outermost first", min_length=1
+    )
+    columns: List[str] = Field(
+        default_factory=list,
+        description="Column dimension columns whose value combinations become pivot columns",
+    )
+    measure: str = Field(
+        default="__record_count__",
+        description="Column to aggregate, or '__record_count__' for row count",
+    )
+    aggregation: str = Field(
+        default="COUNT",
+        description="Aggregation: COUNT, SUM, AVG, MIN, MAX, MEDIAN, P90, P95, P99, COUNT_DISTINCT",
+    )
+    subtotals: bool = Field(
+        default=False, description="Include ROLLUP subtotal rows and a grand total"
+    )
+    max_column_keys: int = Field(
+        default=50, ge=1, le=200, description="Cap on distinct pivot column keys"
+    )
+    max_rows: int = Field(default=1000, ge=1, le=5000)
+
+
+class ColumnBarDrilldownRequest(BaseModel):
+    dataset_id: str
+    dimensions: List[str] = Field(
+        description="Ordered drill hierarchy, outermost first (e.g. region, country, city)",
+        min_length=1,
+        max_length=5,
+    )
+    x_values: List[ColumnBarXValue] = Field(
+        description="Metrics to measure on the value axis",
+        min_length=1,
+    )
+    path: List[str] = Field(
+        default_factory=list,
+        description="Drill path of dimension values; returns the subtree at that node",
+    )
@@ -0,0 +1,43 @@
+"""Shared aggregation vocabulary for the chart, KPI and pivot endpoints.
+
+Every endpoint that accepts an ``aggregation`` name validates it against
+``ALLOWED_AGGREGATIONS`` and renders it with ``aggregate_sql`` so the exact
+SQL stays identical across column-bar, pivot, drill-down and KPI queries.
+"""
+
+BASIC_AGGREGATIONS = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+
+# Percentile aggregations and the fraction passed to percentile_cont
+PERCENTILE_AGGREGATIONS = {
+    "MEDIAN": 0.5,
+    "P90": 0.9,
+    "P95": 0.95,
+    "P99": 0.99,
+}
+
+DISTINCT_AGGREGATIONS = {"COUNT_DISTINCT"}
+
+ALLOWED_AGGREGATIONS = (
+    BASIC_AGGREGATIONS | set(PERCENTILE_AGGREGATIONS) | DISTINCT_AGGREGATIONS
+)
+
+# Aggregations that can be answered from precomputed mergeable sketches
+SKETCH_AGGREGATIONS = set(PERCENTILE_AGGREGATIONS) | DISTINCT_AGGREGATIONS
+
+
+def normalize_aggregation(aggregation: str) -> str:
+    """Upper-case an aggregation name and accept ``COUNT DISTINCT`` spelling."""
+    return aggregation.upper().strip().replace(" ", "_")
+
+
+def aggregate_sql(aggregation: str, col_expr: str) -> str:
+    """
+    Render ``aggregation`` over an already-quoted column expression.
+    ``col_expr`` may be ``*`` only for COUNT.
+    """
+    if aggregation in PERCENTILE_AGGREGATIONS:
+        fraction = PERCENTILE_AGGREGATIONS[aggregation]
+        return f"percentile_cont({fraction}) WITHIN GROUP (ORDER BY {col_expr})"
+    if aggregation == "COUNT_DISTINCT":
+        return f"COUNT(DISTINCT {col_expr})"
+    return f"{aggregation}({col_expr})"
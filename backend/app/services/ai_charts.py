@@ -2,11 +2,14 @@ from typing import TypedDict, List
 from langgraph.graph import StateGraph, START, END
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from app.core.pipeline_metrics import instrument
 
 class ChartAgentState(TypedDict):
+    dataset_id: str
     schema_info: List[dict] 
     suggested_queries: List[str]        
 
+@instrument("suggest_charts")
 async def suggest_charts_node(state: ChartAgentState):
     schema = state["schema_info"]
     
@@ -17,10 +20,15 @@ Return ONLY a valid JSON object with a single key 'queries' containing an array
     ])
     
     from app.core.llm import llm
+    from app.core.llm_cache import fingerprint, llm_cache
     chain = prompt | llm.bind(response_format={"type": "json_object"}) | JsonOutputParser()
     
     try:
-        response = await chain.ainvoke({"schema": schema})
+        response = await llm_cache.get_or_call(
+            "suggest_charts",
+            {"dataset_id": state.get("dataset_id"), "schema": fingerprint(schema)},
+            lambda: chain.ainvoke({"schema": schema}),
+        )
         return {"suggested_queries": response.get("queries", [])}
     except Exception:
         return {"suggested_queries": []}
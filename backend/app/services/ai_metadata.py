@@ -1,47 +1,147 @@
+import asyncio
+import json
+
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from app.core.config import settings
 from app.core.llm import description_llm
+from app.core.llm_cache import fingerprint, llm_cache
 from app.core.logging import get_logger
+from app.core.pipeline_metrics import instrument
 
 logger = get_logger(__name__)
 
+# Seconds before the first retry of a chunk, doubled for each later one
+RETRY_BACKOFF_SECONDS = 1.0
+# Sample values per column shown for the dataset description
+OVERVIEW_SAMPLES_PER_COLUMN = 3
+
+COLUMN_DESCRIPTION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are an expert data dictionary assistant. "
+               "Given a JSON dictionary containing column names and a list of their sample values from a CSV, "
+               "reply with ONLY a valid JSON object. "
+               "The keys must be the column names, and the values must be a concise, 1-sentence description "
+               "explaining what the column likely represents based on the column name and the sample data. "
+               "Do not include markdown blocks or any other text."),
+    ("user", "{samples}")
+])
+
+
+def _estimate_tokens(value) -> int:
+    # ~4 characters per token is close enough for budgeting prompts
+    return len(json.dumps(value, default=str)) // 4 + 1
+
+
+def chunk_columns(sample_data: dict, token_budget: int) -> list[dict]:
+    """Split ``{column: samples}`` into chunks of at most ``token_budget`` tokens."""
+    chunks, current, used = [], {}, 0
+    for col, samples in sample_data.items():
+        cost = _estimate_tokens({col: samples})
+        if current and used + cost > token_budget:
+            chunks.append(current)
+            current, used = {}, 0
+        current[col] = samples
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def overview_samples(sample_data: dict) -> dict:
+    """The leading columns, a few samples each, within one chunk's token budget."""
+    trimmed = {
+        col: list(samples)[:OVERVIEW_SAMPLES_PER_COLUMN]
+        for col, samples in sample_data.items()
+    }
+    chunks = chunk_columns(trimmed, settings.COLUMN_DESCRIPTION_CHUNK_TOKENS)
+    return chunks[0] if chunks else {}
+
+
+async def _describe_chunk(chain, chunk: dict, semaphore: asyncio.Semaphore) -> dict:
+    """Describe one chunk, retrying it on its own; {} if every attempt fails."""
+
+    async def describe():
+        response = await chain.ainvoke({"samples": chunk})
+        if not isinstance(response, dict):
+            raise ValueError(f"expected a JSON object, got {type(response).__name__}")
+        # Ignore anything the model invented outside this chunk
+        described = {
+            col: response[col] for col in chunk if isinstance(response.get(col), str)
+        }
+        if not described:
+            raise ValueError("no descriptions for any column in the chunk")
+        # Raising before this point keeps a bad response out of the cache
+        return described
+
+    attempts = settings.COLUMN_DESCRIPTION_CHUNK_RETRIES + 1
+    for attempt in range(1, attempts + 1):
+        try:
+            async with semaphore:
+                return await llm_cache.get_or_call(
+                    "column_descriptions", {"samples": fingerprint(chunk)}, describe
+                )
+        except Exception as e:
+            logger.warning(
+                f"Column description chunk ({len(chunk)} columns) failed, "
+                f"attempt {attempt}/{attempts}: {e}"
+            )
+        if attempt < attempts:
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    return {}
+
+
+@instrument("column_descriptions")
 async def generate_column_descriptions(sample_data: dict) -> dict:
     """
     Takes a dict of column names mapping to lists of sample values.
     Returns a dict mapping column names to 1-sentence string descriptions.
+
+    Wide datasets are split into token-budgeted chunks that are described
+    concurrently (bounded by ``COLUMN_DESCRIPTION_CONCURRENCY``); a failed
+    chunk only loses its own columns.
     """
     try:
-        logger.info("Generating AI column descriptions for dataset...")
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are an expert data dictionary assistant. "
-                       "Given a JSON dictionary containing column names and a list of their sample values from a CSV, "
-                       "reply with ONLY a valid JSON object. "
-                       "The keys must be the column names, and the values must be a concise, 1-sentence description "
-                       "explaining what the column likely represents based on the column name and the sample data. "
-                       "Do not include markdown blocks or any other text."),
-            ("user", "{samples}")
-        ])
-        
+        chunks = chunk_columns(sample_data, settings.COLUMN_DESCRIPTION_CHUNK_TOKENS)
+        logger.info(
+            f"Generating AI column descriptions for {len(sample_data)} columns "
+            f"in {len(chunks)} chunk(s)..."
+        )
+
         # We use a fast, deterministic setting 
-        chain = prompt | description_llm.bind(response_format={"type": "json_object"}) | JsonOutputParser()
-        
-        response = await chain.ainvoke({"samples": sample_data})
-        logger.info("Successfully generated AI descriptions.")
+        chain = COLUMN_DESCRIPTION_PROMPT | description_llm.bind(response_format={"type": "json_object"}) | JsonOutputParser()
+
+        semaphore = asyncio.Semaphore(settings.COLUMN_DESCRIPTION_CONCURRENCY)
+        results = await asyncio.gather(
+            *(_describe_chunk(chain, chunk, semaphore) for chunk in chunks)
+        )
+
+        response = {}
+        for result in results:
+            response.update(result)
+        logger.info(
+            f"Successfully generated AI descriptions for {len(response)}/{len(sample_data)} columns."
+        )
         return response
     except Exception as e:
         logger.error(f"Failed to generate descriptions: {e}")
         return {}
 
+@instrument("dataset_description")
 async def generate_dataset_description(sample_data: dict, filename: str) -> str:
     """
     Takes a dict of column names mapping to lists of sample values and the filename.
     Returns a cohesive 2-3 sentence paragraph summarizing the dataset's purpose.
+
+    Only the leading columns that fit ``COLUMN_DESCRIPTION_CHUNK_TOKENS``
+    (with a few samples each) go into the prompt, so wide tables fit too.
     """
     try:
+        sample_data = overview_samples(sample_data)
         logger.info(f"Generating overall dataset description for {filename}...")
         prompt = ChatPromptTemplate.from_messages([
             ("system", "You are an expert data analyst assistant. "
-                       "Given the filename '{filename}' and a JSON dictionary of column names with sample values from the dataset, "
+                       "Given the filename '{filename}' and a JSON dictionary of column names with sample values from the dataset "
+                       "(possibly only some of its columns), "
                        "write a cohesive, professional 2-3 sentence paragraph summarizing what this dataset likely represents, "
                        "the types of information it contains, and what it might be useful for analyzing. "
                        "Return ONLY the plain text paragraph. Do not include markdown, greetings, or formatting."),
@@ -51,13 +151,22 @@ async def generate_dataset_description(sample_data: dict, filename: str) -> str:
         # Output parser is implicit for plain text string returns
         chain = prompt | description_llm
         
-        response = await chain.ainvoke({
-            "filename": filename,
-            "samples": sample_data
-        })
+        async def _describe():
+            response = await chain.ainvoke({
+                "filename": filename,
+                "samples": sample_data
+            })
+            # Cache the text, not the AIMessage
+            return str(response.content).strip()
+
+        description = await llm_cache.get_or_call(
+            "dataset_description",
+            {"filename": filename, "samples": fingerprint(sample_data)},
+            _describe,
+        )
         
         logger.info("Successfully generated overall dataset description.")
-        return str(response.content).strip()
+        return description
     except Exception as e:
         logger.error(f"Failed to generate dataset description: {e}")
         return ""
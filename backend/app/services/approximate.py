@@ -0,0 +1,97 @@
+"""Approximate aggregation over TABLESAMPLE for instant previews.
+
+Aggregations run over a random sample of the dataset table, then COUNT/SUM
+are scaled back up by the inverse sampling fraction and every value gets a
+95% error half-width. The bounds assume row-level (BERNOULLI) sampling; the
+SYSTEM method samples whole pages and is only used on very large tables,
+where its bounds are optimistic for physically clustered data.
+"""
+
+import math
+
+# Aim to aggregate roughly this many rows regardless of table size
+TARGET_SAMPLE_ROWS = 100_000
+# Below this many rows a full scan is already cheap, so stay exact
+MIN_ROWS_FOR_SAMPLING = 2 * TARGET_SAMPLE_ROWS
+# Page-level sampling reads far fewer blocks, worth it on huge tables
+SYSTEM_SAMPLING_MIN_ROWS = 10_000_000
+MIN_SAMPLE_PERCENT = 0.01
+Z_95 = 1.96
+# A sample's distinct count is only a lower bound with no usable error
+# estimate; these have to come from sketches (``sketch=true``) instead
+UNSAMPLEABLE_AGGREGATIONS = {"COUNT_DISTINCT"}
+
+
+def plan_sample(row_count: int | None) -> dict | None:
+    """
+    Pick an adaptive sample rate for a table of ``row_count`` rows.
+    Returns None when the query should simply run exactly.
+    """
+    if not row_count or row_count < MIN_ROWS_FOR_SAMPLING:
+        return None
+
+    percent = max(MIN_SAMPLE_PERCENT, TARGET_SAMPLE_ROWS / row_count * 100)
+    percent = round(min(percent, 100.0), 4)
+    method = "SYSTEM" if row_count >= SYSTEM_SAMPLING_MIN_ROWS else "BERNOULLI"
+    return {"percent": percent, "fraction": percent / 100, "method": method}
+
+
+def tablesample_clause(plan: dict | None) -> str:
+    """SQL fragment to append after the table name in a FROM clause."""
+    if not plan:
+        return ""
+    return f" TABLESAMPLE {plan['method']} ({plan['percent']})"
+
+
+def approx_aux_parts(aggregation: str, col_expr: str, alias: str) -> list[str]:
+    """
+    Extra SELECT expressions needed to estimate the error of ``alias``.
+    ``col_expr`` is an already-quoted column or ``*`` for record counts.
+    """
+    if aggregation == "SUM":
+        return [f"SUM(({col_expr})::float8 * ({col_expr})::float8) AS {alias}__sq"]
+    if aggregation == "AVG":
+        return [
+            f"STDDEV_SAMP({col_expr}) AS {alias}__sd",
+            f"COUNT({col_expr}) AS {alias}__n",
+        ]
+    return []
+
+
+def scale_aggregate(aggregation: str, row: dict, alias: str, fraction: float):
+    """
+    Scale a sampled aggregate to a full-table estimate.
+    Returns ``(estimate, error)`` where error is a 95% half-width or None.
+    """
+    value = row.get(alias)
+    if value is None:
+        return None, None
+    value = float(value)
+
+    if aggregation == "COUNT":
+        # Bernoulli count: Var(n / q) = n (1 - q) / q^2
+        return value / fraction, Z_95 * math.sqrt(value * (1 - fraction)) / fraction
+
+    if aggregation == "SUM":
+        sum_sq = float(row.get(f"{alias}__sq") or 0)
+        return value / fraction, Z_95 * math.sqrt((1 - fraction) * sum_sq) / fraction
+
+    if aggregation == "AVG":
+        sd = row.get(f"{alias}__sd")
+        n = row.get(f"{alias}__n") or 0
+        if sd is None or n < 2:
+            return value, None
+        return value, Z_95 * float(sd) / math.sqrt(n)
+
+    # MIN / MAX / percentiles of a sample cannot be bounded without
+    # distribution assumptions
+    return value, None
+
+
+def sample_metadata(plan: dict) -> dict:
+    """Describe the sampling applied, for the API response."""
+    return {
+        "sample_percent": plan["percent"],
+        "method": plan["method"],
+        "confidence": 0.95,
+    }
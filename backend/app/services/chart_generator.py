@@ -1,12 +1,20 @@
 from typing import TypedDict, List, Dict, Any, Optional
 from langgraph.graph import StateGraph, START, END
+from app.core.config import settings
 from app.core.llm import llm
+from app.core.llm_cache import fingerprint, llm_cache, normalize_query
+from app.core.llm_governor import LLMUnavailableError
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from sqlalchemy import text
-from app.core.db import engine
 from app.core.logging import get_logger
-from app.schemas.llm_schema import ChartGeneratorState
+from app.core.pipeline_metrics import instrument
+from app.schemas.llm_schema import ChartGeneratorState, SqlBatchState
+from app.services.chart_spec_builder import build_chart_spec, build_fallback_spec
+from app.services.column_index import relevant_schema
+from app.services.intent_matcher import dataset_context, match_intent, record_match
+from app.services.query_engine import run_query
+from app.services.result_store import store_results
+from app.services.sql_guard import SqlGuardError, check_plan_cost, guard_sql
 import json
 
 logger = get_logger(__name__)
@@ -22,12 +30,18 @@ logger = get_logger(__name__)
 #     chart_spec: Optional[dict]
 
 
+@instrument("generate_sql")
 async def generate_sql_node(state: ChartGeneratorState):
     """Generates PostgreSQL query based on schema and user request."""
     logger.info(f"Generating SQL for query: {state['user_query']}")
-    schema = state["schema_info"]
     query = state["user_query"]
     dataset_id = state["dataset_id"]
+    # SQL from a pruned schema that failed to run is retried with every column
+    if state.get("sql_error") and state.get("schema_pruned"):
+        schema = state["schema_info"]
+    else:
+        schema = await relevant_schema(dataset_id, state["schema_info"], [query])
+    schema_pruned = len(schema) < len(state["schema_info"])
 
     prompt = ChatPromptTemplate.from_messages(
         [
@@ -47,15 +61,111 @@ Ensure the SQL is safe (SELECT only) and uses correct column names.""",
     )
 
     try:
-        response = await chain.ainvoke(
-            {"table_name": dataset_id, "schema": json.dumps(schema), "query": query}
+        response = await llm_cache.get_or_call(
+            "generate_sql",
+            {
+                "dataset_id": dataset_id,
+                "schema": fingerprint(schema),
+                "query": normalize_query(query),
+            },
+            lambda: chain.ainvoke(
+                {"table_name": dataset_id, "schema": json.dumps(schema), "query": query}
+            ),
         )
-        return {"sql_query": response.get("sql_query", "")}
+        return {
+            "sql_query": response.get("sql_query", ""),
+            "sql_source": "llm",
+            "schema_pruned": schema_pruned,
+        }
     except Exception as e:
         logger.error(f"Failed to generate SQL: {e}")
-        return {"sql_error": str(e)}
+        return {
+            "sql_error": str(e),
+            "sql_query": None,
+            "sql_source": "llm",
+            "schema_pruned": False,
+        }
+
+
+@instrument("match_intent")
+async def match_intent_node(state: ChartGeneratorState):
+    """Serves common question shapes from SQL templates, skipping generate_sql."""
+    if not settings.INTENT_MATCHER_ENABLED:
+        return {}
+
+    dataset_id = state["dataset_id"]
+    column_types, dataset_name = await dataset_context(dataset_id)
+    match = match_intent(
+        state["user_query"], dataset_id, state["schema_info"], column_types, dataset_name
+    )
+    await record_match(match is not None, match and match["intent"])
+    if match is None:
+        return {}
+
+    logger.info(f"Matched intent '{match['intent']}' locally, skipping SQL generation.")
+    return {"sql_query": match["sql"], "sql_source": "template"}
+
+
+@instrument("generate_sql_batch")
+async def generate_sql_batch_node(state: SqlBatchState):
+    """Generates one PostgreSQL query per question in a single LLM call."""
+    questions = state["questions"]
+    logger.info(f"Generating SQL for {len(questions)} questions in one batch")
+    dataset_id = state["dataset_id"]
+    schema = await relevant_schema(dataset_id, state["schema_info"], questions)
+
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                """You are an expert PostgreSQL data analyst. 
+Given the following database schema for a table named '{table_name}', write a valid PostgreSQL query to answer each of the user's numbered requests.
+Return ONLY a valid JSON object with a single key 'sql_queries' containing an array of raw SQL strings, one per request, in the same order. Do not include markdown formatting or explanations.
+Ensure the SQL is safe (SELECT only) and uses correct column names.""",
+            ),
+            ("user", "Schema: {schema}\n\nUser Requests:\n{questions}"),
+        ]
+    )
+
+    chain = (
+        prompt | llm.bind(response_format={"type": "json_object"}) | JsonOutputParser()
+    )
+
+    try:
+        response = await llm_cache.get_or_call(
+            "generate_sql_batch",
+            {
+                "dataset_id": dataset_id,
+                "schema": fingerprint(schema),
+                "questions": [normalize_query(q) for q in questions],
+            },
+            lambda: chain.ainvoke(
+                {
+                    "table_name": dataset_id,
+                    "schema": json.dumps(schema),
+                    "questions": "\n".join(
+                        f"{i + 1}. {q}" for i, q in enumerate(questions)
+                    ),
+                }
+            ),
+        )
+        sql_queries = [
+            q if isinstance(q, str) and q.strip() else None
+            for q in response.get("sql_queries", [])
+        ]
+    except Exception as e:
+        logger.error(f"Failed to generate batched SQL: {e}")
+        sql_queries = []
 
+    # Missing entries fall back to per-question generation downstream
+    sql_queries = (sql_queries + [None] * len(questions))[: len(questions)]
+    return {
+        "sql_queries": sql_queries,
+        "schema_pruned": len(schema) < len(state["schema_info"]),
+    }
 
+
+@instrument("execute_sql")
 async def execute_sql_node(state: ChartGeneratorState):
     """Executes the generated SQL query securely against the database."""
     sql_query = state.get("sql_query")
@@ -66,19 +176,26 @@ async def execute_sql_node(state: ChartGeneratorState):
     logger.info(f"Executing SQL: {sql_query}")
 
     try:
-        # Security check: ensure it's a SELECT query
-        if not sql_query.strip().upper().startswith("SELECT"):
-            return {"sql_error": "Only SELECT queries are allowed."}
+        # Security check: single read-only SELECT on this dataset, row-capped
+        guarded_sql = guard_sql(sql_query, state["dataset_id"])
+        await check_plan_cost(guarded_sql)
 
-        async with engine.connect() as conn:
-            # Execute in read-only transaction if possible, but for now just execute
-            result = await conn.execute(text(sql_query))
-            rows = result.mappings().fetchall()
-            # Convert to list of dicts, converting non-serializable types if necessary
-            data = [dict(row) for row in rows]
+        # Runs on the configured query engine; DuckDB reads the Parquet snapshot
+        data = await run_query(state["dataset_id"], guarded_sql, read_only=True)
 
         logger.info(f"SQL execution successful, retrieved {len(data)} rows.")
-        return {"sql_results": data, "sql_error": None}
+
+        # Spool the full result; only the first page stays in the graph state
+        handle = await store_results(state["dataset_id"], guarded_sql, data)
+        return {
+            "sql_results": data[: settings.RESULT_PAGE_SIZE] if handle else data,
+            "result_handle": handle,
+            "row_count": len(data),
+            "sql_error": None,
+        }
+    except SqlGuardError as e:
+        logger.warning(f"SQL rejected by guard: {e}")
+        return {"sql_error": str(e), "sql_results": None}
     except Exception as e:
         logger.error(f"SQL Execution failed: {e}")
         return {"sql_error": str(e), "sql_results": None}
@@ -87,16 +204,30 @@ async def execute_sql_node(state: ChartGeneratorState):
 def should_generate_chart(state: ChartGeneratorState):
     """Conditional edge to check if SQL execution was successful."""
     if state.get("sql_error"):
+        # A template that doesn't run on this data (e.g. odd date strings)
+        # gets a second chance through the LLM
+        if state.get("sql_source") == "template":
+            return "generate_sql"
+        # SQL written without some columns may just be missing the right one
+        if state.get("schema_pruned"):
+            return "generate_sql"
         return END
     return "generate_chart_spec"
 
 
+@instrument("generate_chart_spec")
 async def generate_chart_spec_node(state: ChartGeneratorState):
     """Generates an ECharts JSON configuration based on the SQL results."""
     logger.info("Generating ECharts specification.")
     data = state.get("sql_results", [])
     query = state["user_query"]
 
+    # Common result shapes get a deterministic spec without an LLM round trip
+    spec = build_chart_spec(data or [], query)
+    if spec is not None:
+        logger.info("Built chart spec deterministically, skipping LLM.")
+        return {"chart_spec": spec}
+
     # Cap data size if too large for LLM context
     limited_data = data[:50]
 
@@ -122,27 +253,64 @@ async def generate_chart_spec_node(state: ChartGeneratorState):
     )
 
     try:
-        response = await chain.ainvoke(
+        response = await llm_cache.get_or_call(
+            "generate_chart_spec",
             {
-                "query": query,
-                "data": json.dumps(limited_data, default=str),  # Handle dates/decimals
-            }
+                "dataset_id": state["dataset_id"],
+                "query": normalize_query(query),
+                "data": fingerprint(limited_data),
+            },
+            lambda: chain.ainvoke(
+                {
+                    "query": query,
+                    "data": json.dumps(limited_data, default=str),  # Handle dates/decimals
+                }
+            ),
         )
         return {"chart_spec": response}
+    except LLMUnavailableError as e:
+        logger.warning(f"LLM unavailable, using fallback chart spec: {e}")
+        return {"chart_spec": build_fallback_spec(data or [], query)}
     except Exception as e:
         logger.error(f"Failed to generate chart spec: {e}")
         return {"chart_spec": None}
 
 
+def route_start(state: ChartGeneratorState):
+    """Skip SQL generation when the SQL was already produced (e.g. in a batch)."""
+    if state.get("sql_query"):
+        return "execute_sql"
+    return "match_intent"
+
+
+def route_intent(state: ChartGeneratorState):
+    """Templated SQL goes straight to execution; otherwise ask the LLM."""
+    if state.get("sql_query"):
+        return "execute_sql"
+    return "generate_sql"
+
+
 workflow = StateGraph(ChartGeneratorState)
 
+workflow.add_node("match_intent", match_intent_node)
 workflow.add_node("generate_sql", generate_sql_node)
 workflow.add_node("execute_sql", execute_sql_node)
 workflow.add_node("generate_chart_spec", generate_chart_spec_node)
 
-workflow.add_edge(START, "generate_sql")
+workflow.add_conditional_edges(START, route_start)
+workflow.add_conditional_edges("match_intent", route_intent)
 workflow.add_edge("generate_sql", "execute_sql")
 workflow.add_conditional_edges("execute_sql", should_generate_chart)
 workflow.add_edge("generate_chart_spec", END)
 
 chart_generator_app = workflow.compile()
+
+
+batch_workflow = StateGraph(SqlBatchState)
+
+batch_workflow.add_node("generate_sql_batch", generate_sql_batch_node)
+
+batch_workflow.add_edge(START, "generate_sql_batch")
+batch_workflow.add_edge("generate_sql_batch", END)
+
+sql_batch_app = batch_workflow.compile()
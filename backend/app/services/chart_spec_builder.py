@@ -0,0 +1,233 @@
+"""Rule-based ECharts spec builder for common SQL result shapes.
+
+``generate_chart_spec_node`` tries this first and only asks the LLM when the
+shape is ambiguous. Supported shapes:
+
+* one category + one or more measures  -> bar (pie / line on intent keywords)
+* one date + one or more measures      -> line (bar on intent keywords)
+* two dimensions + one measure         -> stacked bar, one series per slice
+* two measures, no dimension           -> scatter on intent keywords
+"""
+
+import datetime
+import re
+from decimal import Decimal
+
+MAX_ROWS = 200
+
+_DATE_STRING = re.compile(r"^\d{4}-\d{2}(-\d{2})?([ T]\d{2}:\d{2}(:\d{2})?)?")
+_DATE_NAME = re.compile(r"(^|_)(date|day|week|month|quarter|year|period)(_|$)", re.I)
+
+
+def _keywords(*words: str) -> re.Pattern:
+    """Whole-word (optionally plural) match, so "line" doesn't fire on "online"."""
+    return re.compile(r"\b(?:%s)s?\b" % "|".join(re.escape(w) for w in words))
+
+
+_PIE_WORDS = _keywords("pie", "share", "proportion", "percentage", "composition", "breakdown")
+_LINE_WORDS = _keywords("trend", "over time", "line", "timeline", "monthly", "daily", "weekly", "yearly", "per month", "per year", "per day")
+_BAR_WORDS = _keywords("bar", "column", "compare", "comparison", "top", "rank", "ranking")
+_SCATTER_WORDS = _keywords("scatter", "correlation", "correlate", "vs", "versus", "relationship")
+_HORIZONTAL_WORDS = _keywords("horizontal")
+
+
+def _has(query: str, words: re.Pattern) -> bool:
+    return words.search(query) is not None
+
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float, Decimal)) and not isinstance(v, bool)
+
+
+def _classify(name: str, values: list) -> str:
+    """'measure', 'date' or 'category' for one result column."""
+    present = [v for v in values if v is not None]
+    if not present:
+        return "category"
+    if all(isinstance(v, (datetime.date, datetime.datetime)) for v in present):
+        return "date"
+    if all(isinstance(v, str) and _DATE_STRING.match(v) for v in present):
+        return "date"
+    if all(_is_number(v) for v in present):
+        # Integer year/month columns are dimensions, not measures
+        if _DATE_NAME.search(name) and all(float(v).is_integer() for v in present):
+            return "date"
+        return "measure"
+    return "category"
+
+
+def _label(v) -> str:
+    return str(v) if v is not None else "(empty)"
+
+
+def _num(v):
+    return float(v) if v is not None else 0
+
+
+def _title(query: str) -> dict:
+    return {"text": query, "left": "center", "textStyle": {"fontSize": 14}}
+
+
+def _axis_spec(query, categories, series, is_horizontal):
+    category_axis = {"type": "category", "data": categories}
+    value_axis = {"type": "value"}
+    return {
+        "title": _title(query),
+        "tooltip": {"trigger": "axis", "axisPointer": {"type": "shadow"}},
+        "legend": {"show": len(series) > 1, "top": "bottom", "type": "scroll"},
+        "grid": {"left": "3%", "right": "4%", "bottom": "10%", "containLabel": True},
+        "xAxis": category_axis if not is_horizontal else value_axis,
+        "yAxis": value_axis if not is_horizontal else category_axis,
+        "series": series,
+    }
+
+
+def _single_dimension_spec(query, rows, dim, dim_kind, measures):
+    categories = [_label(r[dim]) for r in rows]
+
+    wants_pie = _has(query, _PIE_WORDS) and len(measures) == 1 and dim_kind == "category"
+    if wants_pie:
+        return {
+            "title": _title(query),
+            "tooltip": {"trigger": "item"},
+            "legend": {"top": "bottom", "type": "scroll"},
+            "series": [
+                {
+                    "name": measures[0],
+                    "type": "pie",
+                    "radius": "60%",
+                    "data": [
+                        {"name": c, "value": _num(r[measures[0]])}
+                        for c, r in zip(categories, rows)
+                    ],
+                }
+            ],
+        }
+
+    if dim_kind == "date":
+        chart_type = "bar" if _has(query, _BAR_WORDS) else "line"
+    else:
+        chart_type = "line" if _has(query, _LINE_WORDS) else "bar"
+
+    series = [
+        {
+            "name": m,
+            "type": chart_type,
+            "data": [_num(r[m]) for r in rows],
+            "emphasis": {"focus": "series"},
+            **({"smooth": True} if chart_type == "line" else {}),
+        }
+        for m in measures
+    ]
+    is_horizontal = chart_type == "bar" and _has(query, _HORIZONTAL_WORDS)
+    return _axis_spec(query, categories, series, is_horizontal)
+
+
+def _sliced_spec(query, rows, dim, slice_dim, measure):
+    categories, slices = [], []
+    data_map: dict = {}
+    for r in rows:
+        cat, sv = _label(r[dim]), _label(r[slice_dim])
+        slice_map = data_map.setdefault(sv, {})
+        slice_map[cat] = slice_map.get(cat, 0) + _num(r[measure])
+        if cat not in categories:
+            categories.append(cat)
+        if sv not in slices:
+            slices.append(sv)
+
+    chart_type = "line" if _has(query, _LINE_WORDS) else "bar"
+    series = [
+        {
+            "name": sv,
+            "type": chart_type,
+            **({"stack": "total"} if chart_type == "bar" else {}),
+            "data": [data_map[sv].get(cat, 0) for cat in categories],
+            "emphasis": {"focus": "series"},
+        }
+        for sv in slices
+    ]
+    is_horizontal = chart_type == "bar" and _has(query, _HORIZONTAL_WORDS)
+    return _axis_spec(query, categories, series, is_horizontal)
+
+
+def _scatter_spec(query, rows, x, y):
+    return {
+        "title": _title(query),
+        "tooltip": {"trigger": "item"},
+        "grid": {"left": "3%", "right": "4%", "bottom": "3%", "containLabel": True},
+        "xAxis": {"type": "value", "name": x, "scale": True},
+        "yAxis": {"type": "value", "name": y, "scale": True},
+        "series": [
+            {
+                "type": "scatter",
+                "data": [
+                    [_num(r[x]), _num(r[y])]
+                    for r in rows
+                    if r[x] is not None and r[y] is not None
+                ],
+            }
+        ],
+    }
+
+
+def build_fallback_spec(rows: list[dict], user_query: str) -> dict | None:
+    """
+    Best-effort bar chart of every measure against the first other column
+    (or the row number). Used when the LLM is unavailable.
+    """
+    if not rows:
+        return None
+    rows = rows[:MAX_ROWS]
+    query = user_query.lower()
+    columns = list(rows[0].keys())
+    kinds = {c: _classify(c, [r.get(c) for r in rows]) for c in columns}
+    measures = [c for c in columns if kinds[c] == "measure"]
+    dims = [c for c in columns if kinds[c] != "measure"]
+    if not measures:
+        return None
+    if dims:
+        return _single_dimension_spec(query, rows, dims[0], kinds[dims[0]], measures)
+    categories = [str(i + 1) for i in range(len(rows))]
+    series = [
+        {"name": m, "type": "bar", "data": [_num(r[m]) for r in rows]}
+        for m in measures
+    ]
+    return _axis_spec(query, categories, series, False)
+
+
+def build_chart_spec(rows: list[dict], user_query: str) -> dict | None:
+    """
+    Build an ECharts option for a recognised result shape, or return None
+    when the shape is ambiguous and the LLM should decide.
+    """
+    if not rows:
+        return None
+    rows = rows[:MAX_ROWS]
+    query = user_query.lower()
+
+    columns = list(rows[0].keys())
+    kinds = {c: _classify(c, [r.get(c) for r in rows]) for c in columns}
+    measures = [c for c in columns if kinds[c] == "measure"]
+    dims = [c for c in columns if kinds[c] != "measure"]
+
+    if len(dims) == 1 and measures:
+        if len(rows) == 1 and len(measures) == 1:
+            # A single number is a KPI, not a chart
+            return None
+        return _single_dimension_spec(query, rows, dims[0], kinds[dims[0]], measures)
+
+    if len(dims) == 2 and len(measures) == 1:
+        # Put the date (or the higher-cardinality dimension) on the axis
+        dim, slice_dim = dims
+        if kinds[slice_dim] == "date" and kinds[dim] != "date":
+            dim, slice_dim = slice_dim, dim
+        elif kinds[dim] == kinds[slice_dim] and len({r[slice_dim] for r in rows}) > len(
+            {r[dim] for r in rows}
+        ):
+            dim, slice_dim = slice_dim, dim
+        return _sliced_spec(query, rows, dim, slice_dim, measures[0])
+
+    if not dims and len(measures) == 2 and _has(query, _SCATTER_WORDS):
+        return _scatter_spec(query, rows, measures[0], measures[1])
+
+    return None
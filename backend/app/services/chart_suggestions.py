@@ -0,0 +1,158 @@
+"""AI chart suggestions: generation, storage and ingest-time precompute.
+
+Suggestions only depend on a dataset's schema, so they are generated once in
+the background after upload and stored on the registry row together with
+their SQL, result rows and chart specs. ``/charts/suggest`` serves the stored
+copy and only runs the LLM pipeline when nothing is stored yet or a refresh
+is forced.
+"""
+
+import asyncio
+import datetime
+import json
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+
+from app.core.db import SessionLocal
+from app.core.logging import get_logger
+from app.models.dataset_registry import DatasetRegistry
+from app.services.ai_charts import chart_suggester_app
+from app.services.chart_generator import chart_generator_app, sql_batch_app
+from app.utils import pull_db_column_description, pull_db_schema
+
+logger = get_logger(__name__)
+
+
+async def schema_with_descriptions(dataset_id: str) -> list[dict]:
+    """Dataset columns merged with their AI descriptions, 404 if missing."""
+    columns = await pull_db_schema(dataset_id)
+    if columns is None:
+        logger.error("Dataset not found: %s", dataset_id)
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    descriptions = await pull_db_column_description(dataset_id, DatasetRegistry)
+    for col in columns:
+        col["description"] = descriptions.get(col["name"], "")
+    return columns
+
+
+async def generate_batch_sql(
+    dataset_id: str, columns: list[dict], queries: list[str]
+) -> tuple[list[str | None], bool]:
+    """
+    SQL for every query from one batched LLM call (None where it failed), and
+    whether it was written from a pruned schema.
+    """
+    result = await sql_batch_app.ainvoke(
+        {"dataset_id": dataset_id, "schema_info": columns, "questions": queries}
+    )
+    sql_queries = result.get("sql_queries") or [None] * len(queries)
+    return sql_queries, bool(result.get("schema_pruned"))
+
+
+async def generate_single_chart(
+    dataset_id: str,
+    columns: list[dict],
+    query: str,
+    sql_query: str | None = None,
+    schema_pruned: bool = False,
+):
+    """
+    Run the Text-to-SQL graph for one suggested query; None on failure.
+    A pre-generated ``sql_query`` skips the graph's SQL generation step;
+    ``schema_pruned`` lets it be regenerated from the full schema if it fails.
+    """
+    generator_state = {
+        "dataset_id": dataset_id,
+        "user_query": query,
+        "schema_info": columns,
+        "sql_query": sql_query,
+        "schema_pruned": schema_pruned and sql_query is not None,
+    }
+    res = await chart_generator_app.ainvoke(generator_state)
+
+    # If it failed to generate SQL, skip peacefully
+    if res.get("sql_error"):
+        return None
+
+    spec = (
+        res.get("chart_spec", {}).get("chart_spec")
+        if isinstance(res.get("chart_spec"), dict)
+        and "chart_spec" in res.get("chart_spec")
+        else res.get("chart_spec")
+    )
+
+    return {
+        "query": query,
+        "sql_query": res.get("sql_query"),
+        "data": res.get("sql_results"),
+        "chart_spec": spec,
+    }
+
+
+async def generate_chart_suggestions(
+    dataset_id: str, columns: list[dict]
+) -> list[dict] | None:
+    """
+    Suggest queries for the schema and build a chart for each concurrently.
+    Returns the successful charts, or None if no queries could be suggested.
+    """
+    result = await chart_suggester_app.ainvoke(
+        {"dataset_id": dataset_id, "schema_info": columns}
+    )
+    queries = result.get("suggested_queries", [])
+    if not queries:
+        return None
+
+    sql_queries, schema_pruned = await generate_batch_sql(dataset_id, columns, queries)
+    chart_tasks = [
+        generate_single_chart(dataset_id, columns, q, sql, schema_pruned)
+        for q, sql in zip(queries, sql_queries)
+    ]
+    generated_charts = await asyncio.gather(*chart_tasks)
+
+    # Filter out any that failed
+    return [c for c in generated_charts if c and c.get("chart_spec")]
+
+
+async def load_chart_suggestions(dataset_id: str) -> list[dict] | None:
+    """Stored suggestions for a dataset, or None if never generated."""
+    async with SessionLocal() as session:
+        result = await session.execute(
+            select(DatasetRegistry.chart_suggestions).where(
+                DatasetRegistry.table_name == dataset_id
+            )
+        )
+        return result.scalar_one_or_none()
+
+
+async def store_chart_suggestions(dataset_id: str, charts: list[dict]):
+    # Result rows can hold Decimals and dates; store them JSON-safe
+    charts = json.loads(json.dumps(charts, default=str))
+    async with SessionLocal() as session:
+        await session.execute(
+            update(DatasetRegistry)
+            .where(DatasetRegistry.table_name == dataset_id)
+            .values(
+                chart_suggestions=charts,
+                suggestions_generated_at=datetime.datetime.utcnow(),
+            )
+        )
+        await session.commit()
+
+
+async def precompute_chart_suggestions(dataset_id: str):
+    """Background task run after ingest; failures only log."""
+    try:
+        columns = await schema_with_descriptions(dataset_id)
+        charts = await generate_chart_suggestions(dataset_id, columns)
+        if charts:
+            await store_chart_suggestions(dataset_id, charts)
+            logger.info(
+                "Precomputed %d chart suggestions for %s", len(charts), dataset_id
+            )
+        else:
+            logger.warning("No chart suggestions generated for %s", dataset_id)
+    except Exception as e:
+        logger.error(f"Failed to precompute chart suggestions for {dataset_id}: {e}")
@@ -0,0 +1,182 @@
+"""Local BM25 retrieval over dataset columns to shrink text-to-SQL prompts.
+
+At ingest each column gets a small token document (its name, AI description
+and most frequent values) stored on the registry row. Before SQL generation
+the user's question is scored against those documents and only the top-K
+columns go into the prompt, plus every date and key column (questions such
+as "revenue per month" rarely name them). Narrow tables, and questions that
+match nothing, keep the full schema; SQL written from a pruned schema that
+fails to run is regenerated once from the full schema (see
+``chart_generator``).
+"""
+
+import math
+import re
+from collections import Counter, OrderedDict
+
+import pandas as pd
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.core.logging import get_logger
+from app.models.dataset_registry import DatasetRegistry
+
+logger = get_logger(__name__)
+
+TOP_VALUES_PER_COLUMN = 5
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "by", "for", "from", "how", "in", "is", "many",
+    "me", "of", "on", "or", "per", "show", "the", "to", "what", "which", "with",
+}
+_INDEX_CACHE_SIZE = 64
+# Date and key columns always go into the prompt (dates are often stored as text)
+_ALWAYS_INCLUDED_NAME = re.compile(
+    r"(^|_)(id|key|date|day|time|timestamp|month|year|created|updated)(_|$)",
+    re.IGNORECASE,
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-case word tokens (underscores split), stopwords dropped, crude plural strip."""
+    tokens = []
+    for token in _TOKEN.findall(str(text).lower().replace("_", " ")):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def top_values(df: pd.DataFrame, limit: int = TOP_VALUES_PER_COLUMN) -> dict:
+    """Most frequent values of each low-cardinality text column (profile data)."""
+    values = {}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        counts = df[col].dropna().astype(str).value_counts()
+        if 0 < len(counts) <= 1000:
+            values[col] = counts.head(limit).index.tolist()
+    return values
+
+
+def build_column_documents(
+    columns: list[str], descriptions: dict, profile_values: dict
+) -> dict:
+    """Token document per column, with the column name weighted double."""
+    documents = {}
+    for col in columns:
+        name_tokens = tokenize(col)
+        documents[col] = (
+            name_tokens * 2
+            + tokenize(descriptions.get(col, ""))
+            + [t for v in profile_values.get(col, []) for t in tokenize(v)]
+        )
+    return documents
+
+
+class BM25Index:
+    def __init__(self, documents: dict, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = {col: Counter(tokens) for col, tokens in documents.items()}
+        self.lengths = {col: len(tokens) for col, tokens in documents.items()}
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0
+        doc_freq = Counter(t for tf in self.term_freqs.values() for t in tf)
+        n = len(documents)
+        self.idf = {
+            t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()
+        }
+
+    def scores(self, query: str) -> dict:
+        terms = tokenize(query)
+        scores = {}
+        for col, tf in self.term_freqs.items():
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[col] / (self.avg_length or 1))
+            score = 0.0
+            for t in terms:
+                f = tf.get(t)
+                if f:
+                    score += self.idf[t] * f * (self.k1 + 1) / (f + norm)
+            scores[col] = score
+        return scores
+
+
+_indexes: OrderedDict[str, BM25Index] = OrderedDict()
+
+
+async def _load_index(dataset_id: str, schema: list[dict]) -> BM25Index:
+    index = _indexes.get(dataset_id)
+    if index is not None:
+        _indexes.move_to_end(dataset_id)
+        return index
+
+    documents = None
+    try:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(DatasetRegistry.column_index).where(
+                    DatasetRegistry.table_name == dataset_id
+                )
+            )
+            documents = result.scalar_one_or_none()
+    except Exception as e:
+        logger.warning("Failed to load column index for %s: %s", dataset_id, e)
+
+    if not documents:
+        # Datasets ingested before the index existed: names + descriptions only
+        documents = build_column_documents(
+            [c["name"] for c in schema],
+            {c["name"]: c.get("description", "") for c in schema},
+            {},
+        )
+
+    index = _indexes[dataset_id] = BM25Index(documents)
+    while len(_indexes) > _INDEX_CACHE_SIZE:
+        _indexes.popitem(last=False)
+    return index
+
+
+def _always_included(column: dict) -> bool:
+    return bool(_ALWAYS_INCLUDED_NAME.search(column["name"])) or str(
+        column.get("type", "")
+    ).upper().startswith(("DATE", "TIME"))
+
+
+async def relevant_schema(
+    dataset_id: str, schema: list[dict], questions: list[str]
+) -> list[dict]:
+    """
+    The subset of ``schema`` relevant to any of ``questions`` (the top-K
+    columns by score for each question, plus date and key columns, original
+    column order kept), or the full schema when the table is narrow or a
+    question matches no column.
+    """
+    top_k = settings.COLUMN_RETRIEVAL_TOP_K
+    if len(schema) <= settings.COLUMN_RETRIEVAL_MIN_COLUMNS:
+        return schema
+
+    index = await _load_index(dataset_id, schema)
+    names = [c["name"] for c in schema]
+    selected = {c["name"] for c in schema if _always_included(c)}
+    for question in questions:
+        scores = index.scores(question)
+        if not any(scores.get(name, 0) > 0 for name in names):
+            return schema
+        # Stable sort: ties (including unmatched padding) keep schema order
+        ranked = sorted(names, key=lambda name: scores.get(name, 0), reverse=True)
+        selected.update(ranked[:top_k])
+
+    if len(selected) >= len(schema):
+        return schema
+
+    pruned = [c for c in schema if c["name"] in selected]
+    logger.info(
+        "Column retrieval kept %d of %d columns for %s",
+        len(pruned),
+        len(schema),
+        dataset_id,
+    )
+    return pruned
@@ -0,0 +1,301 @@
+"""In-process columnar cache for hot datasets.
+
+Datasets that keep getting queried are loaded once into a NumPy-backed
+pandas DataFrame and kept in an LRU under a memory budget. KPI and
+column-bar aggregations run against the resident frame and return rows in
+the same shape as their SQL counterparts; anything the cache can't answer
+returns None so the caller falls back to Postgres.
+
+Loading streams the table in batches and builds the frame in a worker
+thread, so a large load never stalls the event loop.
+
+Dataset tables are never updated in place (a re-upload creates a new
+table), so resident frames only leave the cache through eviction or an
+explicit ``invalidate`` when the table is dropped.
+"""
+
+import asyncio
+from collections import Counter, OrderedDict
+
+import pandas as pd
+from sqlalchemy import select, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.logging import get_logger
+from app.models.dataset_registry import DatasetRegistry
+from app.services.aggregations import PERCENTILE_AGGREGATIONS, normalize_aggregation
+
+logger = get_logger(__name__)
+
+LOAD_BATCH_ROWS = 50_000
+
+
+class _Unsupported(Exception):
+    """The requested aggregation can't be reproduced exactly in memory."""
+
+
+def _to_python(value):
+    """Convert NumPy/pandas scalars to plain Python, NA-likes to None."""
+    if value is None or value is pd.NA:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value.item() if hasattr(value, "item") else value
+
+
+def _build_frame(columns: list[str], batches: list[list]) -> pd.DataFrame:
+    """
+    Frame from fetched row batches with nullable dtypes inferred per column
+    (Int64 / Float64 / string / boolean), like ``read_sql`` with
+    ``dtype_backend="numpy_nullable"``.
+    """
+    rows = [row for batch in batches for row in batch]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(
+        {name: pd.array(list(values)) for name, values in zip(columns, zip(*rows))}
+    )
+
+
+def _metric(source, frame: pd.DataFrame, column: str, aggregation: str):
+    """
+    Apply ``aggregation`` to ``source`` (a DataFrame or a GroupBy) with the
+    same NULL semantics as the SQL aggregate.
+    """
+    if column == "__record_count__":
+        return len(source) if isinstance(source, pd.DataFrame) else source.size()
+
+    values = source[column]
+    if aggregation == "COUNT":
+        return values.count()
+    if aggregation == "COUNT_DISTINCT":
+        return values.nunique()
+    if aggregation == "MIN":
+        return values.min()
+    if aggregation == "MAX":
+        return values.max()
+
+    if not pd.api.types.is_numeric_dtype(frame[column]):
+        raise _Unsupported(f"{aggregation} on non-numeric column '{column}'")
+    if aggregation == "SUM":
+        return values.sum(min_count=1)
+    if aggregation == "AVG":
+        return values.mean()
+    if aggregation in PERCENTILE_AGGREGATIONS:
+        # Linear interpolation matches percentile_cont
+        return values.quantile(PERCENTILE_AGGREGATIONS[aggregation])
+    raise _Unsupported(aggregation)
+
+
+class ColumnarCache:
+    """LRU of dataset DataFrames bounded by total bytes."""
+
+    def __init__(self, enabled: bool, max_bytes: int, max_rows: int, hot_threshold: int):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.hot_threshold = hot_threshold
+        self._frames: OrderedDict[str, pd.DataFrame] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._misses: Counter = Counter()
+        self._loading: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self.hits = 0
+        self.fallbacks = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def get(self, dataset_id: str) -> pd.DataFrame | None:
+        """Return the resident frame, or note the miss and maybe start a load."""
+        if not self.enabled:
+            return None
+
+        frame = self._frames.get(dataset_id)
+        if frame is not None:
+            self._frames.move_to_end(dataset_id)
+            return frame
+
+        self._misses[dataset_id] += 1
+        if (
+            self._misses[dataset_id] >= self.hot_threshold
+            and dataset_id not in self._loading
+        ):
+            self._loading.add(dataset_id)
+            task = asyncio.get_running_loop().create_task(self._load(dataset_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return None
+
+    def invalidate(self, dataset_id: str):
+        self._frames.pop(dataset_id, None)
+        self._sizes.pop(dataset_id, None)
+        self._misses.pop(dataset_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "datasets": list(self._frames),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+        }
+
+    async def _load(self, dataset_id: str):
+        try:
+            async with engine.connect() as conn:
+                row_count = (
+                    await conn.execute(
+                        select(DatasetRegistry.row_count).where(
+                            DatasetRegistry.table_name == dataset_id
+                        )
+                    )
+                ).scalar_one_or_none()
+                if row_count is None or row_count > self.max_rows:
+                    logger.info(
+                        "Dataset %s not eligible for columnar cache (%s rows)",
+                        dataset_id,
+                        row_count,
+                    )
+                    return
+
+                table = '"' + dataset_id.replace('"', '""') + '"'
+                result = await conn.stream(text(f"SELECT * FROM {table}"))
+                columns = list(result.keys())
+                batches = [batch async for batch in result.partitions(LOAD_BATCH_ROWS)]
+
+            frame = await asyncio.to_thread(_build_frame, columns, batches)
+            size = await asyncio.to_thread(
+                lambda: int(frame.memory_usage(deep=True).sum())
+            )
+            if size > self.max_bytes:
+                logger.info("Dataset %s too large for columnar cache", dataset_id)
+                return
+
+            self._frames[dataset_id] = frame
+            self._sizes[dataset_id] = size
+            self._misses.pop(dataset_id, None)
+            while self.total_bytes > self.max_bytes:
+                evicted, _ = self._frames.popitem(last=False)
+                self._sizes.pop(evicted, None)
+                logger.info("Evicted dataset %s from columnar cache", evicted)
+            logger.info(
+                "Loaded dataset %s into columnar cache (%d bytes)", dataset_id, size
+            )
+        except Exception as e:
+            logger.warning("Columnar cache load failed for %s: %s", dataset_id, e)
+        finally:
+            self._loading.discard(dataset_id)
+
+    def kpi(
+        self,
+        dataset_id: str,
+        kpi_column: str,
+        aggregation: str,
+        date_column: str | None = None,
+    ) -> dict | None:
+        """``compute_kpi`` value and breakdown from memory, or None to fall back."""
+        frame = self.get(dataset_id)
+        if frame is None:
+            return None
+
+        # compute_kpi counts rows, not non-null values, for COUNT
+        column = "__record_count__" if aggregation == "COUNT" else kpi_column
+        try:
+            value = _metric(frame, frame, column, aggregation)
+            breakdown = None
+            if date_column:
+                grouped = frame.groupby(date_column, dropna=False, sort=True)
+                series = _metric(grouped, frame, column, aggregation)
+                breakdown = [
+                    {"period": str(_to_python(period)), "value": _to_python(v)}
+                    for period, v in series.items()
+                ]
+        except _Unsupported:
+            self.fallbacks += 1
+            return None
+
+        self.hits += 1
+        return {"value": _to_python(value), "breakdown": breakdown}
+
+    def column_bar_rows(
+        self,
+        dataset_id: str,
+        y_axis: str,
+        x_values: list,
+        slice_column: str | None = None,
+        sort_by: str | None = None,
+        sort_dir: str = "desc",
+        limit: int = 200,
+        time_grain: str | None = None,
+    ) -> list[dict] | None:
+        """
+        Rows shaped like the column-bar SQL result (``category``,
+        ``slice_val``, ``val_0``...), or None to fall back to SQL.
+        """
+        frame = self.get(dataset_id)
+        if frame is None:
+            return None
+        if time_grain:
+            # Date bucketing is left to the database
+            self.fallbacks += 1
+            return None
+
+        ascending = sort_dir.lower() == "asc"
+        if sort_by in (None, "__record_count__"):
+            sort_key = "val_0"
+        elif sort_by == y_axis:
+            sort_key = "category"
+        elif slice_column and sort_by == slice_column:
+            sort_key = "slice_val"
+        else:
+            self.fallbacks += 1
+            return None
+        if sort_by is None:
+            ascending = False
+
+        keys = [y_axis] + ([slice_column] if slice_column else [])
+        filtered = frame[frame[y_axis].notna()]
+        grouped = filtered.groupby(keys, dropna=False, sort=False)
+        try:
+            metrics = {
+                f"val_{i}": _metric(
+                    grouped, frame, xv.column, normalize_aggregation(xv.aggregation)
+                )
+                for i, xv in enumerate(x_values)
+            }
+        except _Unsupported:
+            self.fallbacks += 1
+            return None
+
+        result = pd.DataFrame(metrics).reset_index()
+        result.columns = (
+            ["category"] + (["slice_val"] if slice_column else []) + list(metrics)
+        )
+        # Postgres sorts NULLs first for DESC and last for ASC
+        result = result.sort_values(
+            sort_key,
+            ascending=ascending,
+            na_position="last" if ascending else "first",
+            kind="stable",
+        ).head(limit)
+
+        self.hits += 1
+        return [
+            {k: _to_python(v) for k, v in row.items()}
+            for row in result.to_dict(orient="records")
+        ]
+
+
+columnar_cache = ColumnarCache(
+    enabled=settings.COLUMNAR_CACHE_ENABLED,
+    max_bytes=settings.COLUMNAR_CACHE_MAX_BYTES,
+    max_rows=settings.COLUMNAR_CACHE_MAX_ROWS,
+    hot_threshold=settings.COLUMNAR_CACHE_HOT_THRESHOLD,
+)
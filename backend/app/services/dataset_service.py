@@ -5,12 +5,13 @@ import pandas as pd
 import hashlib
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text, Table, Column, Integer, String, Float, MetaData, inspect
+from sqlalchemy import Table, Column, Integer, String, Float, MetaData, inspect
 
 from fastapi import HTTPException, UploadFile
 
 from app.core.db import SessionLocal, engine
 from app.core.logging import get_logger
+from app.core.pipeline_metrics import start_trace
 from app.models.dataset_registry import DatasetRegistry
 from app.utils import (
     handle_duplicate_content,
@@ -18,10 +19,30 @@ from app.utils import (
     pull_db_schema,
     pull_db_column_description,
 )
-from app.services.ai_metadata import (
-    generate_column_descriptions,
-    generate_dataset_description,
+from app.services.metadata_reuse import (
+    column_signature,
+    describe_dataset,
+    find_reference_metadata,
+    signature_hash,
 )
+from app.services.aggregations import (
+    ALLOWED_AGGREGATIONS,
+    SKETCH_AGGREGATIONS,
+    aggregate_sql,
+    normalize_aggregation,
+)
+from app.services.approximate import (
+    UNSAMPLEABLE_AGGREGATIONS,
+    approx_aux_parts,
+    plan_sample,
+    sample_metadata,
+    scale_aggregate,
+    tablesample_clause,
+)
+from app.services.column_index import build_column_documents, top_values
+from app.services.columnar_cache import columnar_cache
+from app.services.query_engine import run_query, write_parquet_snapshot
+from app.services.sketches import get_group_sketches, merge_sketches, sketch_value
 from sqlalchemy import select
 
 logger = get_logger(__name__)
@@ -89,6 +110,24 @@ def categorize_columns(df: pd.DataFrame) -> dict:
     return column_types
 
 
+def _safe_column_name(col_name) -> str:
+    return str(col_name).strip().lower().replace(" ", "_").replace("-", "_")
+
+
+def column_statistics(df: pd.DataFrame) -> dict:
+    """Distinct count and null fraction per column (used for heuristic charts)."""
+    row_count = len(df)
+    return {
+        col_name: {
+            "distinct": int(df[col_name].nunique(dropna=True)),
+            "null_fraction": round(float(df[col_name].isna().mean()), 4)
+            if row_count
+            else 0.0,
+        }
+        for col_name in df.columns
+    }
+
+
 async def upload_dataset(file: UploadFile, db: AsyncSession):
     # 1. Validate file extension
     filename = file.filename.lower()
@@ -127,6 +166,13 @@ async def upload_dataset(file: UploadFile, db: AsyncSession):
                 "rows_inserted": 0,
             }
 
+        # Find reusable AI metadata before a same-named predecessor is replaced
+        signature = column_signature(
+            (_safe_column_name(c), pandas_dtype_to_sqlalchemy_type(t))
+            for c, t in df.dtypes.items()
+        )
+        reference_metadata = await find_reference_metadata(signature)
+
         # check for duplicate file name
         await handle_duplicate_name(DatasetRegistry, filename, db)
 
@@ -144,9 +190,7 @@ async def upload_dataset(file: UploadFile, db: AsyncSession):
         logger.info("Inferring schema and dynamically creating SQLAlchemy Table")
         for col_name, dtype in df.dtypes.items():
             # Sanitize column names for SQL safety
-            safe_col_name = (
-                str(col_name).strip().lower().replace(" ", "_").replace("-", "_")
-            )
+            safe_col_name = _safe_column_name(col_name)
 
             # Store max 10 non-empty samples for the LLM metadata request
             samples = df[col_name].dropna().astype(str).head(10).tolist()
@@ -228,12 +272,24 @@ async def upload_dataset(file: UploadFile, db: AsyncSession):
             async with engine.begin() as conn:
                 await conn.execute(dynamic_table.insert(), data_to_insert)
 
-        # Generate the AI descriptions using the extracted samples
-        column_descriptions = await generate_column_descriptions(sample_data)
-        dataset_description = await generate_dataset_description(sample_data, filename)
+        # Columnar copy for the DuckDB query engine
+        await write_parquet_snapshot(table_name, columns, data_to_insert)
+
+        # Generate the AI descriptions using the extracted samples, reusing
+        # those of an earlier upload with the same columns where possible
+        start_trace(table_name)
+        column_descriptions, dataset_description = await describe_dataset(
+            sample_data, filename, signature, reference_metadata
+        )
 
         # Categorize columns into categorical, numerical, or date
         column_types = categorize_columns(df)
+        column_stats = column_statistics(df)
+
+        # Retrieval documents so SQL prompts only carry relevant columns
+        column_index = build_column_documents(
+            [col.name for col in columns], column_descriptions or {}, top_values(df)
+        )
 
         # Create a new registry entry
         new_registry = DatasetRegistry(
@@ -245,6 +301,10 @@ async def upload_dataset(file: UploadFile, db: AsyncSession):
             column_count=len(columns),
             column_descriptions=column_descriptions,
             column_types=column_types,
+            column_stats=column_stats,
+            column_index=column_index,
+            column_signature=signature,
+            signature_hash=signature_hash(signature),
         )
         db.add(new_registry)
         await db.commit()
@@ -300,25 +360,33 @@ async def get_db_schema(dataset_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-ALLOWED_AGGREGATIONS = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
-
-
 async def compute_kpi(
     dataset_id: str,
     kpi_column: str,
     aggregation: str = "COUNT",
     date_column: str | None = None,
+    approximate: bool = False,
+    sketch: bool = False,
 ):
     """
     Compute an aggregate KPI value (and optional time-series breakdown) for a dataset column.
+    With ``approximate`` set, large tables are sampled and the values come back
+    as scaled estimates with 95% error bounds. With ``sketch`` set, percentile
+    and COUNT_DISTINCT KPIs are answered from precomputed per-period sketches.
     """
-    aggregation = aggregation.upper().strip()
+    aggregation = normalize_aggregation(aggregation)
     if aggregation not in ALLOWED_AGGREGATIONS:
         raise HTTPException(
             status_code=400,
             detail=f"Invalid aggregation '{aggregation}'. Must be one of {ALLOWED_AGGREGATIONS}",
         )
 
+    if approximate and not sketch and aggregation in UNSAMPLEABLE_AGGREGATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{aggregation} can't be estimated from a sample; use sketch mode",
+        )
+
     # Pull schema to validate columns exist
     columns = await pull_db_schema(dataset_id)
     if columns is None:
@@ -337,32 +405,70 @@ async def compute_kpi(
             detail=f"Date column '{date_column}' not found in dataset",
         )
 
+    # Hot datasets are answered exactly from the in-memory cache
+    cached = columnar_cache.kpi(dataset_id, kpi_column, aggregation, date_column)
+    if cached is not None:
+        return {
+            "dataset_id": dataset_id,
+            "kpi_column": kpi_column,
+            "aggregation": aggregation,
+            "value": cached["value"],
+            "date_column": date_column,
+            "breakdown": cached["breakdown"],
+            "approximate": None,
+        }
+
+    if sketch and aggregation in SKETCH_AGGREGATIONS:
+        return await _compute_kpi_from_sketches(
+            dataset_id, kpi_column, aggregation, date_column
+        )
+
+    plan = None
+    if approximate:
+        from app.utils import pull_dataset_overview
+
+        overview = await pull_dataset_overview(dataset_id, DatasetRegistry)
+        plan = plan_sample(overview.get("row_count") if overview else None)
+
     try:
-        async with engine.connect() as conn:
-            # ---- Overall aggregate value ----
-            agg_expr = (
-                f"COUNT(*)"
-                if aggregation == "COUNT"
-                else f'{aggregation}("{kpi_column}")'
+        # ---- Overall aggregate value ----
+        agg_expr = (
+            f"COUNT(*)"
+            if aggregation == "COUNT"
+            else aggregate_sql(aggregation, f'"{kpi_column}"')
+        )
+        select_parts = [f"{agg_expr} AS value"]
+        if plan:
+            col_expr = "*" if aggregation == "COUNT" else f'"{kpi_column}"'
+            select_parts += approx_aux_parts(aggregation, col_expr, "value")
+        source = f'"{dataset_id}"{tablesample_clause(plan)}'
+
+        overall_sql = f"SELECT {', '.join(select_parts)} FROM {source}"
+        overall_row = (await run_query(dataset_id, overall_sql))[0]
+        overall_value, overall_error = overall_row["value"], None
+        if plan:
+            overall_value, overall_error = scale_aggregate(
+                aggregation, overall_row, "value", plan["fraction"]
             )
-            overall_sql = f'SELECT {agg_expr} AS value FROM "{dataset_id}"'
-            result = await conn.execute(text(overall_sql))
-            overall_value = result.scalar()
-
-            # ---- Optional time-series breakdown ----
-            breakdown = None
-            if date_column:
-                breakdown_sql = (
-                    f'SELECT "{date_column}" AS period, {agg_expr} AS value '
-                    f'FROM "{dataset_id}" '
-                    f'GROUP BY "{date_column}" '
-                    f'ORDER BY "{date_column}" ASC'
-                )
-                bk_result = await conn.execute(text(breakdown_sql))
-                rows = bk_result.mappings().fetchall()
-                breakdown = [
-                    {"period": str(r["period"]), "value": r["value"]} for r in rows
-                ]
+
+        # ---- Optional time-series breakdown ----
+        breakdown = None
+        if date_column:
+            breakdown_sql = (
+                f'SELECT "{date_column}" AS period, {", ".join(select_parts)} '
+                f"FROM {source} "
+                f'GROUP BY "{date_column}" '
+                f'ORDER BY "{date_column}" ASC'
+            )
+            rows = await run_query(dataset_id, breakdown_sql)
+            breakdown = []
+            for r in rows:
+                point = {"period": str(r["period"]), "value": r["value"]}
+                if plan:
+                    point["value"], point["error"] = scale_aggregate(
+                        aggregation, r, "value", plan["fraction"]
+                    )
+                breakdown.append(point)
 
         return {
             "dataset_id": dataset_id,
@@ -371,9 +477,43 @@ async def compute_kpi(
             "value": overall_value,
             "date_column": date_column,
             "breakdown": breakdown,
+            "approximate": (
+                {**sample_metadata(plan), "error": overall_error} if plan else None
+            ),
         }
     except HTTPException:
         raise
     except Exception as e:
         logger.error("Error computing KPI: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _compute_kpi_from_sketches(
+    dataset_id: str, kpi_column: str, aggregation: str, date_column: str | None
+):
+    """Sketch-backed KPI: the overall value is the merge of the per-period sketches."""
+    try:
+        groups = await get_group_sketches(dataset_id, date_column, kpi_column)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error computing KPI from sketches: %s", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    breakdown = None
+    if date_column:
+        breakdown = [
+            {"period": period, "value": sketch_value(aggregation, groups[period])}
+            for period in sorted(groups)
+        ]
+
+    overall = merge_sketches(groups) if groups else None
+    return {
+        "dataset_id": dataset_id,
+        "kpi_column": kpi_column,
+        "aggregation": aggregation,
+        "value": sketch_value(aggregation, overall) if overall else None,
+        "date_column": date_column,
+        "breakdown": breakdown,
+        "approximate": {"method": "sketch"},
+    }
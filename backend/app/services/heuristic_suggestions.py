@@ -0,0 +1,191 @@
+"""Zero-LLM starter chart suggestions from column profiles.
+
+Good first charts for typical tables are formulaic, so these are built from
+the registry's ``column_types`` and the per-column statistics gathered at
+ingest (distinct count, null fraction) in a few milliseconds:
+
+* record counts by the most readable low-cardinality categoricals;
+* totals of the main numeric columns over the first date column, bucketed
+  by week or month when it has too many distinct dates to chart one by one;
+* a numeric total broken down by the best categorical;
+* KPI cards summarising numeric distributions (average, median, P90).
+
+Each suggestion is a ready-to-post request for the deterministic
+``/charts/column-bar`` or ``/dataset/{id}/kpi`` endpoints. They are the
+default for ``/charts/suggest`` until LLM suggestions are stored, and the
+fallback whenever the LLM pipeline fails.
+"""
+
+import re
+
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.core.db import SessionLocal
+from app.core.logging import get_logger
+from app.models.dataset_registry import DatasetRegistry
+
+logger = get_logger(__name__)
+
+MAX_CATEGORY_CARDINALITY = 50
+# Bar charts read best with roughly this many categories
+IDEAL_CATEGORY_CARDINALITY = 8
+MAX_SUGGESTIONS = 8
+# Above this many distinct dates, trends are charted per week / per month
+MAX_DATE_POINTS = 60
+MAX_WEEKLY_DATES = 400
+
+_ID_NAME = re.compile(r"(^|_)(id|uuid|key|code|number|no)$", re.IGNORECASE)
+
+
+def _label(column: str) -> str:
+    return column.replace("_", " ")
+
+
+def _is_identifier(column: str, stats: dict, row_count: int | None) -> bool:
+    """ID-like by name, or (for text columns) unique on nearly every row."""
+    if _ID_NAME.search(column):
+        return True
+    distinct = stats.get("distinct")
+    return bool(row_count and distinct and distinct > 0.9 * row_count and row_count > 50)
+
+
+def _time_grain(stats: dict) -> str | None:
+    """
+    No bucketing for few distinct dates, else a grain that keeps the chart
+    readable; ``distinct`` bounds the span in days, so daily data over a
+    year gets weekly bars and anything longer monthly ones.
+    """
+    distinct = stats.get("distinct")
+    if distinct is not None and distinct <= MAX_DATE_POINTS:
+        return None
+    if distinct is not None and distinct <= MAX_WEEKLY_DATES:
+        return "week"
+    return "month"
+
+
+def _column_bar(dataset_id, title, y_axis, x_values, **options) -> dict:
+    return {
+        "query": title,
+        "type": "column_bar",
+        "endpoint": "/api/v1/charts/column-bar",
+        "request": {"dataset_id": dataset_id, "y_axis": y_axis, "x_values": x_values, **options},
+    }
+
+
+def _kpi(dataset_id, title, column, aggregation) -> dict:
+    return {
+        "query": title,
+        "type": "kpi",
+        "endpoint": f"/api/v1/dataset/{dataset_id}/kpi",
+        "request": {"dataset_id": dataset_id, "kpi_column": column, "aggregation": aggregation},
+    }
+
+
+def build_heuristic_suggestions(
+    dataset_id: str,
+    column_types: dict,
+    column_stats: dict | None = None,
+    row_count: int | None = None,
+) -> list[dict]:
+    """Rank column roles from their profiles and emit starter chart requests."""
+    column_stats = column_stats or {}
+
+    def stats(col):
+        return column_stats.get(col, {})
+
+    usable = [
+        c
+        for c in column_types
+        if stats(c).get("null_fraction", 0) < 0.5 and stats(c).get("distinct", 2) > 1
+    ]
+    dates = [c for c in usable if column_types[c] == "date"]
+    measures = [
+        c
+        for c in usable
+        if column_types[c] == "numerical" and not _ID_NAME.search(c)
+    ]
+    categories = [
+        c
+        for c in usable
+        if column_types[c] == "categorical"
+        and not _is_identifier(c, stats(c), row_count)
+        and stats(c).get("distinct", IDEAL_CATEGORY_CARDINALITY) <= MAX_CATEGORY_CARDINALITY
+    ]
+    # Prefer categoricals whose cardinality makes a readable bar chart
+    categories.sort(
+        key=lambda c: abs(stats(c).get("distinct", IDEAL_CATEGORY_CARDINALITY) - IDEAL_CATEGORY_CARDINALITY)
+    )
+
+    record_count = [{"column": "__record_count__", "aggregation": "COUNT"}]
+    suggestions = []
+
+    for cat in categories[:2]:
+        horizontal = stats(cat).get("distinct", 0) > 12
+        suggestions.append(
+            _column_bar(
+                dataset_id,
+                f"Count of records by {_label(cat)}",
+                cat,
+                record_count,
+                chart_type="bar" if horizontal else "column",
+            )
+        )
+
+    if dates:
+        date = dates[0]
+        grain = _time_grain(stats(date))
+        for measure in measures[:2] or [None]:
+            suggestions.append(
+                _column_bar(
+                    dataset_id,
+                    f"Total {_label(measure)} over {_label(date)}"
+                    if measure
+                    else f"Count of records over {_label(date)}",
+                    date,
+                    [{"column": measure, "aggregation": "SUM"}] if measure else record_count,
+                    time_grain=grain,
+                    sort_by=date,
+                    sort_dir="asc",
+                )
+            )
+
+    if categories and measures:
+        suggestions.append(
+            _column_bar(
+                dataset_id,
+                f"Total {_label(measures[0])} by {_label(categories[0])}",
+                categories[0],
+                [{"column": measures[0], "aggregation": "SUM"}],
+            )
+        )
+
+    for measure in measures[:2]:
+        suggestions.append(_kpi(dataset_id, f"Average {_label(measure)}", measure, "AVG"))
+        suggestions.append(_kpi(dataset_id, f"Median {_label(measure)}", measure, "MEDIAN"))
+        suggestions.append(
+            _kpi(dataset_id, f"90th percentile of {_label(measure)}", measure, "P90")
+        )
+
+    return suggestions[:MAX_SUGGESTIONS]
+
+
+async def heuristic_suggestions(dataset_id: str) -> list[dict]:
+    """Heuristic suggestions for a registered dataset; 404 if it doesn't exist."""
+    async with SessionLocal() as session:
+        result = await session.execute(
+            select(
+                DatasetRegistry.column_types,
+                DatasetRegistry.column_stats,
+                DatasetRegistry.row_count,
+            ).where(DatasetRegistry.table_name == dataset_id)
+        )
+        row = result.first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    suggestions = build_heuristic_suggestions(
+        dataset_id, row.column_types or {}, row.column_stats, row.row_count
+    )
+    logger.info("Built %d heuristic suggestions for %s", len(suggestions), dataset_id)
+    return suggestions
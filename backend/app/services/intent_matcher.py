@@ -0,0 +1,269 @@
+"""Local intent matcher: common chart questions -> templated SQL, no LLM.
+
+Questions such as "count of orders by region", "average price per month" or
+"top 10 products by total revenue" follow a handful of shapes. The matcher
+recognises those shapes with regexes, resolves each slot to exactly one
+column (by column name, or by a word from the column's AI description as a
+synonym) and renders the SQL from a fixed template. Every word of a slot
+must be accounted for, so qualifiers the templates can't express ("count of
+cancelled orders", "by region in 2023", "distinct products") fall through.
+Anything ambiguous - an unknown shape, a slot matching no or several
+columns, leftover words, a non-numeric measure - returns None and the
+question goes to the LLM as before.
+"""
+
+import re
+
+from sqlalchemy import select
+
+import app.core.redis as redis_module
+from app.core.db import SessionLocal
+from app.core.llm_cache import normalize_query
+from app.core.logging import get_logger
+from app.models.dataset_registry import DatasetRegistry
+from app.services.aggregations import aggregate_sql
+from app.services.column_index import tokenize
+
+logger = get_logger(__name__)
+
+STATS_KEY = "intent_matcher:stats"
+MAX_CATEGORIES = 50
+
+_AGGREGATIONS = {
+    "total": "SUM",
+    "sum": "SUM",
+    "average": "AVG",
+    "avg": "AVG",
+    "mean": "AVG",
+    "max": "MAX",
+    "maximum": "MAX",
+    "highest": "MAX",
+    "min": "MIN",
+    "minimum": "MIN",
+    "lowest": "MIN",
+    "median": "MEDIAN",
+    "count": "COUNT",
+}
+_GRAINS = {
+    "day": "day", "daily": "day", "date": "day",
+    "week": "week", "weekly": "week",
+    "month": "month", "monthly": "month", "time": "month",
+    "quarter": "quarter", "quarterly": "quarter",
+    "year": "year", "yearly": "year", "annual": "year",
+}
+# What "count of <what> by ..." may count besides the dataset's own name
+_RECORD_NOUNS = frozenset(tokenize("records rows entries items lines"))
+_NUMERIC_TYPES = ("INT", "FLOAT", "DOUBLE", "NUMERIC", "DECIMAL", "REAL")
+_DATE_NAME = re.compile(r"(^|_)(date|day|time|timestamp|month|created|updated)(_|$)")
+
+_AGG = r"(?P<agg>total|sum|average|avg|mean|max|maximum|highest|min|minimum|lowest|median)"
+_BY = r"\s+(?:by|per|for each|for every|across|over)\s+(?:each\s+|the\s+)?"
+_LEAD = r"^(?:(?:show|plot|chart|graph|display|give|list|get|what|is|are|was|the|me|us|a|an)\s+)*"
+_PATTERNS = [
+    (
+        "top_n",
+        re.compile(
+            _LEAD + r"top\s+(?P<n>\d{1,3})\s+(?P<dim>.+?)\s+by\s+"
+            r"(?:(?P<agg>total|sum|average|avg|mean|max|maximum|min|minimum|median|count)\s+(?:of\s+)?)?"
+            r"(?P<measure>.+)$"
+        ),
+    ),
+    (
+        "count_by",
+        re.compile(
+            _LEAD + r"(?:count|number|how many|total number)(?:\s+of)?(?:\s+(?P<what>.+?))?"
+            + _BY + r"(?P<dim>.+)$"
+        ),
+    ),
+    ("aggregate_by", re.compile(_LEAD + _AGG + r"\s+(?:of\s+)?(?P<measure>.+?)" + _BY + r"(?P<dim>.+)$")),
+    (
+        "periodic_aggregate",
+        re.compile(
+            _LEAD + r"(?P<dim>daily|weekly|monthly|quarterly|yearly|annual)\s+"
+            + _AGG + r"\s+(?:of\s+)?(?P<measure>.+)$"
+        ),
+    ),
+]
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _is_numeric(column: dict, column_types: dict) -> bool:
+    if column_types.get(column["name"]):
+        return column_types[column["name"]] == "numerical"
+    return str(column.get("type", "")).upper().startswith(_NUMERIC_TYPES)
+
+
+def _is_date(column: dict, column_types: dict) -> bool:
+    if column_types.get(column["name"]):
+        return column_types[column["name"]] == "date"
+    return bool(_DATE_NAME.search(column["name"]))
+
+
+def resolve_column(phrase: str, columns: list[dict]) -> dict | None:
+    """
+    The single column ``phrase`` refers to: an exact match on the column
+    name beats a phrase naming part of it, which beats a synonym found in its
+    description. Every word of the phrase must be used by the match; None
+    when words are left over or no / several columns match best.
+    """
+    words = set(tokenize(phrase))
+    if not words:
+        return None
+    scored = []
+    for col in columns:
+        name_words = set(tokenize(col["name"]))
+        if not name_words:
+            continue
+        if words == name_words:
+            score = 3
+        elif words <= name_words:
+            score = 2
+        elif words <= set(tokenize(col.get("description", ""))):
+            score = 1
+        else:
+            continue
+        scored.append((score, col))
+    if not scored:
+        return None
+    best = max(score for score, _ in scored)
+    matches = [col for score, col in scored if score == best]
+    return matches[0] if len(matches) == 1 else None
+
+
+def _grain(phrase: str) -> str | None:
+    """The time grain when the phrase is exactly one grain word ("month")."""
+    words = phrase.split()
+    return _GRAINS.get(words[0]) if len(words) == 1 else None
+
+
+def _counts_records(what: str | None, record_nouns: set[str]) -> bool:
+    """Whether "count of <what>" counts rows, i.e. <what> names the records."""
+    return not what or set(tokenize(what)) <= record_nouns
+
+
+def _date_column(columns: list[dict], column_types: dict) -> dict | None:
+    dates = [c for c in columns if _is_date(c, column_types)]
+    return dates[0] if len(dates) == 1 else None
+
+
+def _render(table, dim, grain, agg, measure, limit, time_alias=None) -> str:
+    value_expr = "COUNT(*)" if measure is None else aggregate_sql(agg, _quote(measure["name"]))
+    value_alias = "record_count" if measure is None else f"{agg.lower()}_{measure['name']}"
+    dim_col = _quote(dim["name"])
+    if grain:
+        return (
+            f"SELECT date_trunc('{grain}', CAST({dim_col} AS timestamp)) "
+            f"AS {_quote(time_alias or grain)}, "
+            f"{value_expr} AS {_quote(value_alias)} "
+            f"FROM {_quote(table)} WHERE {dim_col} IS NOT NULL "
+            f"GROUP BY 1 ORDER BY 1"
+        )
+    return (
+        f"SELECT {dim_col}, {value_expr} AS {_quote(value_alias)} "
+        f"FROM {_quote(table)} WHERE {dim_col} IS NOT NULL "
+        f"GROUP BY {dim_col} ORDER BY 2 DESC LIMIT {limit}"
+    )
+
+
+def match_intent(
+    user_query: str,
+    table_name: str,
+    columns: list[dict],
+    column_types: dict | None = None,
+    dataset_name: str | None = None,
+) -> dict | None:
+    """
+    ``{"intent", "sql"}`` when the question confidently matches a template,
+    else None. ``dataset_name`` (e.g. the uploaded file name) supplies the
+    nouns that mean "rows" in count questions.
+    """
+    column_types = column_types or {}
+    query = normalize_query(user_query)
+    record_nouns = _RECORD_NOUNS | set(tokenize(re.sub(r"\.\w+$", "", dataset_name or "")))
+
+    for intent, pattern in _PATTERNS:
+        m = pattern.match(query)
+        if not m:
+            continue
+        slots = m.groupdict()
+        if intent == "count_by" and not _counts_records(slots.get("what"), record_nouns):
+            return None
+        agg = _AGGREGATIONS.get(slots.get("agg") or "", "SUM" if intent == "top_n" else "COUNT")
+
+        measure = None
+        if intent != "count_by" and agg != "COUNT":
+            measure = resolve_column(slots["measure"], columns)
+            if measure is None or not _is_numeric(measure, column_types):
+                return None
+
+        grain = _grain(slots["dim"])
+        if grain:
+            dim = _date_column(columns, column_types)
+        else:
+            dim = resolve_column(slots["dim"], columns)
+        if dim is None or (measure is not None and dim["name"] == measure["name"]):
+            return None
+        # "by order date" is a time series: every day in date order, not the
+        # 50 busiest days (a top-N question does ask for a ranking)
+        time_alias = None
+        if not grain and intent != "top_n" and _is_date(dim, column_types):
+            grain, time_alias = "day", dim["name"]
+
+        limit = min(int(slots["n"]), MAX_CATEGORIES) if slots.get("n") else MAX_CATEGORIES
+        sql = _render(table_name, dim, grain, agg, measure, limit, time_alias)
+        return {"intent": intent, "sql": sql}
+    return None
+
+
+async def dataset_context(dataset_id: str) -> tuple[dict, str | None]:
+    """
+    The registry's column roles and original file name; empty (type-based
+    fallback, generic record nouns) if unavailable.
+    """
+    try:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(
+                    DatasetRegistry.column_types, DatasetRegistry.original_filename
+                ).where(DatasetRegistry.table_name == dataset_id)
+            )
+            row = result.first()
+    except Exception as e:
+        logger.warning("Could not load column types for %s: %s", dataset_id, e)
+        return {}, None
+    if row is None:
+        return {}, None
+    return row.column_types or {}, row.original_filename
+
+
+async def record_match(matched: bool, intent: str | None = None):
+    """Count fast-path hits / misses in Redis for the stats endpoint."""
+    try:
+        async with redis_module.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hincrby(STATS_KEY, "matched" if matched else "missed", 1)
+            if intent:
+                pipe.hincrby(STATS_KEY, f"intent:{intent}", 1)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to record intent match: %s", e)
+
+
+async def intent_stats() -> dict:
+    stats = {}
+    try:
+        stats = await redis_module.redis_client.hgetall(STATS_KEY)
+    except Exception as e:
+        logger.warning("Intent matcher stats read failed: %s", e)
+    matched = int(stats.get("matched", 0))
+    missed = int(stats.get("missed", 0))
+    return {
+        "matched": matched,
+        "missed": missed,
+        "fast_path_fraction": round(matched / (matched + missed), 4) if matched + missed else 0.0,
+        "by_intent": {
+            k.split(":", 1)[1]: int(v) for k, v in stats.items() if k.startswith("intent:")
+        },
+    }
@@ -0,0 +1,138 @@
+"""Reuse AI column / dataset descriptions across uploads with the same columns.
+
+Recurring feeds (e.g. monthly exports) arrive with identical headers. Each
+dataset's column signature - its sanitized column names with their SQL types
+- is stored on the registry row. On upload the previously described dataset
+with the closest signature (exact match first, otherwise the best Jaccard
+overlap above ``METADATA_REUSE_MIN_OVERLAP``) donates its descriptions, and
+only the columns it doesn't cover are sent to the LLM. The dataset
+description is reused when no columns are new.
+"""
+
+import asyncio
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.core.llm_cache import fingerprint
+from app.core.logging import get_logger
+from app.models.dataset_registry import DatasetRegistry
+from app.services.ai_metadata import (
+    generate_column_descriptions,
+    generate_dataset_description,
+)
+
+logger = get_logger(__name__)
+
+# How many recent datasets to compare against when there is no exact match
+CANDIDATE_SCAN_LIMIT = 200
+
+
+def column_signature(columns) -> list[str]:
+    """Sorted ``name:type`` entries for ``(name, SQLAlchemy type)`` pairs."""
+    return sorted(
+        f"{name}:{(sa_type if isinstance(sa_type, type) else type(sa_type)).__name__.lower()}"
+        for name, sa_type in columns
+    )
+
+
+def signature_hash(signature: list[str]) -> str:
+    return fingerprint(sorted(signature))
+
+
+def _overlap(a: list[str], b: list[str]) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 0.0
+
+
+def _as_reference(registry: DatasetRegistry) -> dict:
+    return {
+        "table_name": registry.table_name,
+        "signature": registry.column_signature or [],
+        "column_descriptions": registry.column_descriptions or {},
+        "description": registry.description,
+    }
+
+
+async def find_reference_metadata(signature: list[str]) -> dict | None:
+    """
+    Descriptions of the previously described dataset closest to ``signature``,
+    or None. Returned as a plain dict so it outlives the registry row (a
+    same-named upload replaces its predecessor).
+    """
+    if not settings.METADATA_REUSE_ENABLED or not signature:
+        return None
+    try:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(DatasetRegistry)
+                .where(DatasetRegistry.signature_hash == signature_hash(signature))
+                .order_by(DatasetRegistry.created_at.desc())
+                .limit(1)
+            )
+            exact = result.scalar_one_or_none()
+            if exact is not None and exact.column_descriptions:
+                return _as_reference(exact)
+
+            result = await session.execute(
+                select(DatasetRegistry)
+                .where(DatasetRegistry.column_signature.isnot(None))
+                .order_by(DatasetRegistry.created_at.desc())
+                .limit(CANDIDATE_SCAN_LIMIT)
+            )
+            candidates = [r for r in result.scalars() if r.column_descriptions]
+    except Exception as e:
+        logger.warning("Failed to look up reusable metadata: %s", e)
+        return None
+
+    best, best_overlap = None, settings.METADATA_REUSE_MIN_OVERLAP
+    for candidate in candidates:
+        overlap = _overlap(signature, candidate.column_signature)
+        if overlap >= best_overlap:
+            best, best_overlap = candidate, overlap
+    return _as_reference(best) if best is not None else None
+
+
+async def describe_dataset(
+    sample_data: dict, filename: str, signature: list[str], reference: dict | None
+) -> tuple[dict, str]:
+    """
+    Column descriptions and dataset description for an upload, reusing
+    ``reference`` where the column (name and type) is unchanged.
+    """
+    if reference is None:
+        column_descriptions, dataset_description = await asyncio.gather(
+            generate_column_descriptions(sample_data),
+            generate_dataset_description(sample_data, filename),
+        )
+        return column_descriptions, dataset_description
+
+    known = set(reference["signature"])
+    entries = {entry.rsplit(":", 1)[0]: entry for entry in signature}
+    reused = {
+        name: description
+        for name, description in reference["column_descriptions"].items()
+        if entries.get(name) in known
+    }
+    new_columns = [name for name in sample_data if name not in reused]
+
+    column_descriptions = dict(reused)
+    if not new_columns and reference["description"]:
+        dataset_description = reference["description"]
+    else:
+        generated, dataset_description = await asyncio.gather(
+            generate_column_descriptions(
+                {name: sample_data[name] for name in new_columns}
+            ),
+            generate_dataset_description(sample_data, filename),
+        )
+        column_descriptions.update(generated)
+
+    logger.info(
+        "Reused %d column descriptions from %s, generated %d",
+        len(reused),
+        reference["table_name"],
+        len(new_columns),
+    )
+    return column_descriptions, dataset_description
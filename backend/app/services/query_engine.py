@@ -0,0 +1,189 @@
+"""Query router between Postgres and DuckDB-over-Parquet.
+
+At ingest every dataset is also written as a Parquet snapshot under
+``PARQUET_SNAPSHOT_DIR``. With ``QUERY_ENGINE=duckdb`` analytical reads are
+run by an in-process DuckDB against that snapshot (exposed as a view with
+the dataset's table name, so the SQL is unchanged). Postgres stays the
+source of truth and the fallback whenever DuckDB, the snapshot or the query
+itself isn't usable.
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import Float, Integer, text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.logging import get_logger
+from app.core.quotas import record_work
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = None
+    pq = None
+
+logger = get_logger(__name__)
+
+# Postgres-only syntax that DuckDB parses differently; always sent to Postgres
+_POSTGRES_ONLY = re.compile(r"\bTABLESAMPLE\b", re.IGNORECASE)
+# ``:name`` bind parameters, but not ``::type`` casts
+_BIND_PARAM = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+
+def snapshot_path(table_name: str) -> str:
+    return os.path.join(settings.PARQUET_SNAPSHOT_DIR, f"{table_name}.parquet")
+
+
+def _arrow_type(sa_type):
+    if isinstance(sa_type, Integer):
+        return pa.int64()
+    if isinstance(sa_type, Float):
+        return pa.float64()
+    return pa.string()
+
+
+def _write_snapshot(table_name: str, columns: list, rows: list[dict]):
+    schema = pa.schema([(col.name, _arrow_type(col.type)) for col in columns])
+    table = pa.Table.from_pylist(rows, schema=schema)
+    os.makedirs(settings.PARQUET_SNAPSHOT_DIR, exist_ok=True)
+    # Write then rename so readers never see a half-written file
+    tmp_path = snapshot_path(table_name) + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, snapshot_path(table_name))
+
+
+async def write_parquet_snapshot(table_name: str, columns: list, rows: list[dict]):
+    """
+    Write the cleaned ingest rows as ``<table_name>.parquet``. ``columns`` are
+    the SQLAlchemy Column objects the Postgres table was created with.
+    Failures are logged and never fail the upload.
+    """
+    if pq is None:
+        return
+    try:
+        await asyncio.to_thread(_write_snapshot, table_name, columns, rows)
+        logger.info("Wrote Parquet snapshot for %s", table_name)
+    except Exception as e:
+        logger.warning("Failed to write Parquet snapshot for %s: %s", table_name, e)
+
+
+async def export_parquet_snapshot(table_name: str):
+    """Backfill a snapshot for a dataset ingested before snapshots existed."""
+    quoted = '"' + table_name.replace('"', '""') + '"'
+    async with engine.connect() as conn:
+        result = await conn.execute(text(f"SELECT * FROM {quoted}"))
+        names = list(result.keys())
+        data = [dict(zip(names, r)) for r in result.fetchall()]
+
+    def _write():
+        table = pa.Table.from_pylist(data) if data else pa.table({n: [] for n in names})
+        os.makedirs(settings.PARQUET_SNAPSHOT_DIR, exist_ok=True)
+        pq.write_table(table, snapshot_path(table_name))
+
+    await asyncio.to_thread(_write)
+
+
+def delete_parquet_snapshot(table_name: str):
+    try:
+        os.remove(snapshot_path(table_name))
+    except FileNotFoundError:
+        pass
+
+
+def _duckdb_query(
+    table_name: str, sql: str, params: dict | None, timeout_ms: int | None = None
+) -> list[dict]:
+    quoted = '"' + table_name.replace('"', '""') + '"'
+    path = snapshot_path(table_name).replace("'", "''")
+    with duckdb.connect() as conn:
+        conn.execute(f"CREATE VIEW {quoted} AS SELECT * FROM read_parquet('{path}')")
+        # DuckDB has no statement_timeout; interrupt the query from a timer
+        timer = threading.Timer(timeout_ms / 1000, conn.interrupt) if timeout_ms else None
+        if timer:
+            timer.start()
+        try:
+            cursor = conn.execute(_BIND_PARAM.sub(r"$\1", sql), params or {})
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, r)) for r in cursor.fetchall()]
+        except duckdb.InterruptException:
+            raise TimeoutError(
+                f"Query exceeded the {timeout_ms} ms statement timeout"
+            ) from None
+        finally:
+            if timer:
+                timer.cancel()
+
+
+async def _postgres_query(
+    sql: str, params: dict | None, read_only: bool = False
+) -> list[dict]:
+    async with engine.connect() as conn:
+        if read_only:
+            # Both settings are scoped to this (implicit) transaction only
+            await conn.execute(text("SET TRANSACTION READ ONLY"))
+            await conn.execute(
+                text(
+                    "SET LOCAL statement_timeout = "
+                    f"{int(settings.SQL_GUARD_STATEMENT_TIMEOUT_MS)}"
+                )
+            )
+        result = await conn.execute(text(sql), params or {})
+        return [dict(r) for r in result.mappings().fetchall()]
+
+
+def duckdb_available(table_name: str) -> bool:
+    return duckdb is not None and os.path.exists(snapshot_path(table_name))
+
+
+async def run_query(
+    table_name: str,
+    sql: str,
+    params: dict | None = None,
+    engine_name: str | None = None,
+    read_only: bool = False,
+) -> list[dict]:
+    """
+    Run a read-only query against one dataset table on the configured engine
+    (or ``engine_name``), falling back to Postgres. Returns rows as dicts.
+    ``read_only`` (used for untrusted, LLM-written SQL) runs the Postgres path
+    in a READ ONLY transaction and caps either engine at
+    ``SQL_GUARD_STATEMENT_TIMEOUT_MS``; a timed-out query isn't retried.
+    """
+    started_at = time.perf_counter()
+    rows = await _run_on_engine(
+        table_name, sql, params, engine_name or settings.QUERY_ENGINE, read_only
+    )
+    # Charged to the requesting client's work budget (see app.core.quotas)
+    record_work(rows=len(rows), query_ms=(time.perf_counter() - started_at) * 1000)
+    return rows
+
+
+async def _run_on_engine(
+    table_name: str, sql: str, params: dict | None, engine_name: str, read_only: bool
+) -> list[dict]:
+    if (
+        engine_name == "duckdb"
+        and duckdb_available(table_name)
+        and not _POSTGRES_ONLY.search(sql)
+    ):
+        timeout_ms = settings.SQL_GUARD_STATEMENT_TIMEOUT_MS if read_only else None
+        try:
+            return await asyncio.to_thread(
+                _duckdb_query, table_name, sql, params, timeout_ms
+            )
+        except TimeoutError:
+            raise
+        except Exception as e:
+            logger.warning("DuckDB query failed, falling back to Postgres: %s", e)
+    return await _postgres_query(sql, params, read_only)
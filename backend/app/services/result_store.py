@@ -0,0 +1,105 @@
+"""Server-side spool for LLM query results.
+
+``execute_sql_node`` writes the full result to Redis under a random handle
+(one JSON row per list element, plus a small metadata hash) and only the
+first page travels on through the graph state and the API response.
+``GET /charts/results/{handle}`` pages through or exports the rest without
+rerunning the SQL. Both keys expire after ``RESULT_HANDLE_TTL_SECONDS``.
+"""
+
+import csv
+import io
+import json
+import uuid
+from typing import AsyncIterator
+
+import app.core.redis as redis_module
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "results:"
+EXPORT_BATCH_ROWS = 1000
+
+
+def _meta_key(handle: str) -> str:
+    return f"{KEY_PREFIX}{handle}"
+
+
+def _rows_key(handle: str) -> str:
+    return f"{KEY_PREFIX}{handle}:rows"
+
+
+async def store_results(dataset_id: str, sql_query: str, rows: list[dict]) -> str | None:
+    """Spool ``rows`` and return their handle, or None if Redis is unavailable."""
+    handle = uuid.uuid4().hex
+    ttl = settings.RESULT_HANDLE_TTL_SECONDS
+    columns = list(rows[0].keys()) if rows else []
+    try:
+        async with redis_module.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(
+                _meta_key(handle),
+                mapping={
+                    "dataset_id": dataset_id,
+                    "sql_query": sql_query,
+                    "row_count": len(rows),
+                    "columns": json.dumps(columns),
+                },
+            )
+            pipe.expire(_meta_key(handle), ttl)
+            for start in range(0, len(rows), EXPORT_BATCH_ROWS):
+                batch = rows[start : start + EXPORT_BATCH_ROWS]
+                pipe.rpush(_rows_key(handle), *(json.dumps(r, default=str) for r in batch))
+            pipe.expire(_rows_key(handle), ttl)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to spool query results: %s", e)
+        return None
+    return handle
+
+
+async def get_result_meta(handle: str) -> dict | None:
+    meta = await redis_module.redis_client.hgetall(_meta_key(handle))
+    if not meta:
+        return None
+    return {
+        "dataset_id": meta["dataset_id"],
+        "sql_query": meta["sql_query"],
+        "row_count": int(meta["row_count"]),
+        "columns": json.loads(meta["columns"]),
+    }
+
+
+async def get_result_page(handle: str, offset: int, limit: int) -> list[dict]:
+    raw = await redis_module.redis_client.lrange(
+        _rows_key(handle), offset, offset + limit - 1
+    )
+    return [json.loads(r) for r in raw]
+
+
+async def export_results(
+    handle: str, columns: list[str], fmt: str
+) -> AsyncIterator[str]:
+    """Stream every spooled row as CSV or newline-delimited JSON."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        yield buffer.getvalue()
+
+    offset = 0
+    while True:
+        raw = await redis_module.redis_client.lrange(
+            _rows_key(handle), offset, offset + EXPORT_BATCH_ROWS - 1
+        )
+        if not raw:
+            break
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+            writer.writerows(json.loads(r) for r in raw)
+            yield buffer.getvalue()
+        else:
+            yield "\n".join(raw) + "\n"
+        offset += EXPORT_BATCH_ROWS
@@ -0,0 +1,321 @@
+"""Mergeable sketches for fast approximate percentiles and distinct counts.
+
+Sketches are built per group in one streaming pass over the dataset table
+and stored in Redis, so repeated MEDIAN / P90 / COUNT_DISTINCT queries on the
+same (group column, value column) pair never rescan Postgres. After ingest
+``precompute_sketches`` builds them for the dataset's main numeric columns,
+overall and by its date and low-cardinality categorical columns; any other
+pair is built on first use. Rows are fed to the (pure Python) sketches in a
+worker thread, a batch at a time. Both sketch types merge losslessly, so a
+grand total is just the merge of its groups.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+
+from fastapi import HTTPException
+from sqlalchemy import select, text
+
+import app.core.redis as redis_module
+from app.core.db import SessionLocal, engine
+from app.core.logging import get_logger
+from app.models.dataset_registry import DatasetRegistry
+from app.services.aggregations import PERCENTILE_AGGREGATIONS
+
+logger = get_logger(__name__)
+
+SKETCH_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+MAX_SKETCH_GROUPS = 10_000
+ALL_ROWS_GROUP = "__all__"
+STREAM_BATCH_ROWS = 10_000
+# Precomputed at ingest: value columns x (overall + group columns)
+PRECOMPUTE_VALUE_COLUMNS = 5
+PRECOMPUTE_GROUP_COLUMNS = 5
+
+
+class KLLSketch:
+    """KLL quantile sketch (Karnin, Lang & Liberty) with deterministic compaction."""
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.n = 0
+        self.compactors: list[list[float]] = [[]]
+        self._rng = random.Random(seed)
+
+    def _capacity(self, height: int) -> int:
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def _size(self) -> int:
+        return sum(len(c) for c in self.compactors)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _compress(self):
+        while self._size() >= self._max_size():
+            for h in range(len(self.compactors)):
+                if len(self.compactors[h]) >= self._capacity(h):
+                    if h + 1 >= len(self.compactors):
+                        self.compactors.append([])
+                    items = sorted(self.compactors[h])
+                    # An odd item out stays behind at this level
+                    keep = [items.pop()] if len(items) % 2 else []
+                    offset = self._rng.randint(0, 1)
+                    self.compactors[h + 1].extend(items[offset::2])
+                    self.compactors[h] = keep
+                    break
+
+    def update(self, value: float):
+        self.compactors[0].append(value)
+        self.n += 1
+        if self._size() >= self._max_size():
+            self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for h, items in enumerate(other.compactors):
+            self.compactors[h].extend(items)
+        self.n += other.n
+        self._compress()
+
+    def quantile(self, q: float) -> float | None:
+        weighted = sorted(
+            (value, 2**h) for h, items in enumerate(self.compactors) for value in items
+        )
+        if not weighted:
+            return None
+        total = sum(w for _, w in weighted)
+        target = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return weighted[-1][0]
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "compactors": self.compactors}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLLSketch":
+        sketch = cls(k=data["k"])
+        sketch.n = data["n"]
+        sketch.compactors = data["compactors"]
+        return sketch
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2**p registers (~1.6% error at p=12)."""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def update(self, value):
+        h = int.from_bytes(
+            hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big"
+        )
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        for i, r in enumerate(other.registers):
+            if r > self.registers[i]:
+                self.registers[i] = r
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m**2 / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small-range correction: linear counting
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self) -> dict:
+        return {"p": self.p, "registers": base64.b64encode(self.registers).decode()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HyperLogLog":
+        sketch = cls(p=data["p"])
+        sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        return sketch
+
+
+def sketch_value(aggregation: str, sketches: dict):
+    """Answer a sketch aggregation from a ``{"kll", "hll"}`` pair."""
+    if aggregation == "COUNT_DISTINCT":
+        return sketches["hll"].count()
+    return sketches["kll"].quantile(PERCENTILE_AGGREGATIONS[aggregation])
+
+
+def merge_sketches(groups: dict) -> dict:
+    """Merge every group's sketches into one overall pair."""
+    merged = {"kll": KLLSketch(), "hll": HyperLogLog()}
+    for sketches in groups.values():
+        merged["kll"].merge(sketches["kll"])
+        merged["hll"].merge(sketches["hll"])
+    return merged
+
+
+def _cache_key(dataset_id: str, group_column: str | None, value_column: str) -> str:
+    return f"sketches:{dataset_id}:{group_column or ALL_ROWS_GROUP}:{value_column}"
+
+
+async def get_group_sketches(
+    dataset_id: str, group_column: str | None, value_column: str
+) -> dict:
+    """
+    Return ``{group_key: {"kll": KLLSketch, "hll": HyperLogLog}}`` for a value
+    column grouped by ``group_column`` (or a single ``__all__`` group).
+    Loads from Redis when precomputed, otherwise builds and stores them.
+    """
+    cache_key = _cache_key(dataset_id, group_column, value_column)
+    try:
+        cached = await redis_module.redis_client.hgetall(cache_key)
+        if cached:
+            return {
+                group: {
+                    "kll": KLLSketch.from_dict(payload["kll"]),
+                    "hll": HyperLogLog.from_dict(payload["hll"]),
+                }
+                for group, payload in (
+                    (g, json.loads(raw)) for g, raw in cached.items()
+                )
+            }
+    except Exception as e:
+        logger.warning("Sketch cache read failed: %s", e)
+
+    groups = (await build_group_sketches(dataset_id, group_column, [value_column]))[
+        value_column
+    ]
+    await _store_group_sketches(cache_key, groups)
+    return groups
+
+
+async def _store_group_sketches(cache_key: str, groups: dict):
+    if not groups:
+        return
+    try:
+        async with redis_module.redis_client.pipeline() as pipe:
+            pipe.delete(cache_key)
+            pipe.hset(
+                cache_key,
+                mapping={
+                    group: json.dumps(
+                        {"kll": s["kll"].to_dict(), "hll": s["hll"].to_dict()}
+                    )
+                    for group, s in groups.items()
+                },
+            )
+            pipe.expire(cache_key, SKETCH_CACHE_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Sketch cache write failed: %s", e)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _feed(groups_by_column: dict, grouped: bool, rows: list):
+    """Add a batch of ``(group, value, value, ...)`` rows to the sketches."""
+    for row in rows:
+        key = str(row[0]) if grouped else ALL_ROWS_GROUP
+        for groups, val in zip(groups_by_column.values(), row[1:]):
+            if val is None:
+                continue
+            sketches = groups.get(key)
+            if sketches is None:
+                if len(groups) >= MAX_SKETCH_GROUPS:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Too many groups for sketch mode (>{MAX_SKETCH_GROUPS})",
+                    )
+                sketches = groups[key] = {"kll": KLLSketch(), "hll": HyperLogLog()}
+            sketches["hll"].update(val)
+            try:
+                sketches["kll"].update(float(val))
+            except (TypeError, ValueError):
+                # Non-numeric values only feed the distinct counter
+                pass
+
+
+async def build_group_sketches(
+    dataset_id: str, group_column: str | None, value_columns: list[str]
+) -> dict:
+    """
+    Stream the table once and feed every row into its group's sketches, for
+    each of ``value_columns``: ``{value_column: {group_key: sketches}}``.
+    """
+    group_expr = _quote(group_column) if group_column else "NULL"
+    sql = (
+        f"SELECT {group_expr} AS grp, {', '.join(_quote(c) for c in value_columns)} "
+        f"FROM {_quote(dataset_id)}"
+    )
+    logger.info("Building sketches: %s", sql)
+
+    groups_by_column: dict = {column: {} for column in value_columns}
+    async with engine.connect() as conn:
+        result = await conn.stream(text(sql))
+        async for rows in result.partitions(STREAM_BATCH_ROWS):
+            await asyncio.to_thread(
+                _feed, groups_by_column, group_column is not None, rows
+            )
+    return groups_by_column
+
+
+async def precompute_sketches(dataset_id: str):
+    """
+    Background task run after ingest: sketch the main numeric columns overall
+    and by each date / low-cardinality categorical column. Failures only log.
+    """
+    try:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(
+                    DatasetRegistry.column_types, DatasetRegistry.column_stats
+                ).where(DatasetRegistry.table_name == dataset_id)
+            )
+            row = result.first()
+        if row is None or not row.column_types:
+            return
+        column_types, column_stats = row.column_types, row.column_stats or {}
+
+        value_columns = [
+            c for c, kind in column_types.items() if kind == "numerical"
+        ][:PRECOMPUTE_VALUE_COLUMNS]
+        if not value_columns:
+            return
+        group_columns = [
+            c
+            for c, kind in column_types.items()
+            if kind in ("date", "categorical")
+            and column_stats.get(c, {}).get("distinct", MAX_SKETCH_GROUPS + 1)
+            <= MAX_SKETCH_GROUPS
+        ][:PRECOMPUTE_GROUP_COLUMNS]
+
+        for group_column in [None, *group_columns]:
+            built = await build_group_sketches(dataset_id, group_column, value_columns)
+            for value_column, groups in built.items():
+                await _store_group_sketches(
+                    _cache_key(dataset_id, group_column, value_column), groups
+                )
+        logger.info(
+            "Precomputed sketches for %s: %d value x %d group columns",
+            dataset_id,
+            len(value_columns),
+            len(group_columns) + 1,
+        )
+    except Exception as e:
+        logger.error("Sketch precompute failed for %s: %s", dataset_id, e)
@@ -0,0 +1,173 @@
+"""Guard layer for LLM-generated SQL.
+
+Before ``execute_sql_node`` runs model output the SQL is:
+
+1. parsed (sqlglot, Postgres dialect) and rejected unless it is exactly one
+   read-only SELECT / set operation that only reads the dataset's own table
+   (CTEs allowed) and calls only allowlisted functions;
+2. wrapped so at most ``SQL_GUARD_MAX_ROWS`` rows can come back;
+3. costed with ``EXPLAIN`` and rejected over ``SQL_GUARD_MAX_PLAN_COST``.
+
+Execution itself then happens in a READ ONLY transaction with a
+``statement_timeout``, or on DuckDB under the same timeout (see
+``run_query(..., read_only=True)``).
+"""
+
+import json
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import OptimizeError
+from sqlglot.optimizer.scope import traverse_scope
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+_READ_ROOTS = (exp.Select, exp.Union, exp.Intersect, exp.Except)
+_FORBIDDEN_NODES = (
+    exp.Insert,
+    exp.Update,
+    exp.Delete,
+    exp.Merge,
+    exp.Create,
+    exp.Drop,
+    exp.Alter,
+    exp.Command,
+    exp.Into,  # SELECT ... INTO creates a table
+    exp.Lock,  # FOR UPDATE / FOR SHARE take row locks
+)
+# sqlglot models operators (AND, =, LIKE, ...) as functions too
+_OPERATORS = (exp.Binary, exp.Unary, exp.Connector, exp.Predicate)
+
+# Functions the generated SQL may call, by sqlglot's lowercase name. Anything
+# else is rejected: Postgres has functions that read arbitrary tables from a
+# string argument (query_to_xml, table_to_xml, cursor_to_xml, xpath, ...),
+# which the table check below can't see, so a blocklist isn't enough.
+_ALLOWED_FUNCTIONS = frozenset(
+    {
+        # aggregates
+        "count", "sum", "avg", "min", "max", "stddev", "stddev_pop",
+        "stddev_samp", "variance", "variance_pop", "corr", "covar_pop",
+        "covar_samp", "percentile_cont", "percentile_disc", "mode",
+        "array_agg", "group_concat", "logical_and", "logical_or",
+        "approx_distinct", "count_if",
+        # window functions
+        "row_number", "rank", "dense_rank", "percent_rank", "cume_dist",
+        "ntile", "lag", "lead", "first_value", "last_value", "nth_value",
+        # conditionals and casts
+        "case", "if", "coalesce", "nullif", "greatest", "least", "cast",
+        "try_cast", "array",
+        # math
+        "abs", "ceil", "floor", "round", "trunc", "sign", "sqrt", "cbrt",
+        "power", "exp", "ln", "log", "mod", "width_bucket", "safe_divide",
+        # strings
+        "lower", "upper", "initcap", "trim", "length", "substring", "left",
+        "right", "concat", "concat_ws", "replace", "split_part",
+        "str_position", "pad", "regexp_replace", "regexp_like",
+        "regexp_extract", "reverse", "repeat",
+        # dates and times
+        "extract", "date_trunc", "timestamp_trunc", "time_to_str",
+        "str_to_date", "str_to_time", "unix_to_time", "to_number",
+        "current_date", "current_timestamp", "date_add", "date_sub",
+        "date_diff", "timestamp_add", "timestamp_sub", "timestamp_diff",
+        "age", "date_part", "to_char", "to_date", "to_timestamp",
+        "make_date", "justify_interval",
+    }
+)
+
+
+class SqlGuardError(ValueError):
+    """The SQL was rejected by the guard; the message is safe to show users."""
+
+
+def _function_name(node: exp.Func) -> str:
+    if isinstance(node, exp.Anonymous):
+        return str(node.name).lower()
+    return node.sql_name().lower()
+
+
+def _check_tables(tree: exp.Expression, table_name: str):
+    """
+    Every table reference must be the dataset table, or a CTE defined in the
+    reference's own or an enclosing scope (a CTE's name doesn't leak out of
+    the subquery that defines it).
+    """
+    try:
+        scopes = traverse_scope(tree)
+    except OptimizeError as e:
+        raise SqlGuardError(f"Could not resolve the query's tables: {e}")
+
+    checked = set()
+    for scope in scopes:
+        for table in scope.tables:
+            checked.add(id(table))
+            if not table.db and table.name in scope.cte_sources:
+                continue
+            if table.name != table_name or table.db not in ("", "public"):
+                raise SqlGuardError(
+                    f"Query may only read the dataset table '{table_name}'."
+                )
+    # Anything the scopes didn't reach can't be proven to be the dataset
+    if any(id(table) not in checked for table in tree.find_all(exp.Table)):
+        raise SqlGuardError(f"Query may only read the dataset table '{table_name}'.")
+
+
+def guard_sql(sql: str, table_name: str, max_rows: int | None = None) -> str:
+    """
+    Validate ``sql`` against ``table_name`` and return it wrapped with a row
+    LIMIT. Raises SqlGuardError when the statement isn't allowed.
+    """
+    max_rows = max_rows or settings.SQL_GUARD_MAX_ROWS
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="postgres") if s is not None]
+    except sqlglot.errors.ParseError as e:
+        raise SqlGuardError(f"Could not parse SQL: {e}")
+
+    if len(statements) != 1:
+        raise SqlGuardError("Exactly one SQL statement is allowed.")
+    tree = statements[0]
+
+    if not isinstance(tree, _READ_ROOTS):
+        raise SqlGuardError("Only SELECT queries are allowed.")
+    for node in tree.walk():
+        if isinstance(node, _FORBIDDEN_NODES):
+            raise SqlGuardError(
+                f"Statement contains a forbidden clause: {type(node).__name__}."
+            )
+        if (
+            isinstance(node, exp.Func)
+            and not isinstance(node, _OPERATORS)
+            and _function_name(node) not in _ALLOWED_FUNCTIONS
+        ):
+            raise SqlGuardError(f"Function '{_function_name(node)}' is not allowed.")
+
+    _check_tables(tree, table_name)
+
+    # Clamp the result size regardless of any LIMIT inside the query. The
+    # body is re-rendered from the validated tree, so what runs is exactly
+    # what was checked (no comments or text the parser skipped)
+    body = tree.sql(dialect="postgres", comments=False)
+    return f"SELECT * FROM ({body}\n) AS guarded_query LIMIT {int(max_rows)}"
+
+
+async def check_plan_cost(sql: str, params: dict | None = None) -> float:
+    """EXPLAIN the query and reject it if the planner's total cost is too high."""
+    async with engine.connect() as conn:
+        result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params or {})
+        plan = result.scalar()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    cost = float(plan[0]["Plan"]["Total Cost"])
+    logger.info("Planner cost for guarded SQL: %.0f", cost)
+
+    if cost > settings.SQL_GUARD_MAX_PLAN_COST:
+        raise SqlGuardError(
+            f"Query is too expensive to run (estimated cost {cost:.0f}, "
+            f"limit {settings.SQL_GUARD_MAX_PLAN_COST:.0f})."
+        )
+    return cost
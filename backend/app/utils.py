@@ -5,6 +5,8 @@ from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import inspect
 from app.core.db import engine
+from app.services.columnar_cache import columnar_cache
+from app.services.query_engine import delete_parquet_snapshot
 
 logger = get_logger(__name__)
 
@@ -36,6 +38,8 @@ async def handle_duplicate_name(dataset: DatasetRegistry, filename: str, db: Asy
 
         # Actually drop the old table from the Postgres database!
         await db.execute(text(f"DROP TABLE IF EXISTS {old_table_name}"))
+        columnar_cache.invalidate(old_table_name)
+        delete_parquet_snapshot(old_table_name)
 
         await db.delete(old_dataset)
         await db.commit()
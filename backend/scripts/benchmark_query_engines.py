@@ -0,0 +1,99 @@
+"""Compare Postgres and DuckDB-over-Parquet on the same chart queries.
+
+Usage (from backend/):
+    python -m scripts.benchmark_query_engines <dataset_id> \
+        --category <column> --measure <numeric column> [--runs 5] [--snapshot]
+
+``--snapshot`` (re)exports the Parquet snapshot from Postgres first, for
+datasets uploaded before snapshots were written at ingest.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.core.db import engine
+from app.services.query_engine import (
+    _duckdb_query,
+    _postgres_query,
+    duckdb_available,
+    export_parquet_snapshot,
+)
+
+
+def build_queries(table: str, category: str, measure: str) -> dict:
+    t, c, m = (f'"{name}"' for name in (table, category, measure))
+    return {
+        "column-bar count": (
+            f"SELECT {c} AS category, COUNT(*) AS val_0 FROM {t} "
+            f"WHERE {c} IS NOT NULL GROUP BY category ORDER BY val_0 DESC LIMIT 200"
+        ),
+        "column-bar sum/avg": (
+            f"SELECT {c} AS category, SUM({m}) AS val_0, AVG({m}) AS val_1 FROM {t} "
+            f"WHERE {c} IS NOT NULL GROUP BY category ORDER BY val_0 DESC LIMIT 200"
+        ),
+        "kpi median": (
+            f"SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY {m}) AS value FROM {t}"
+        ),
+        "distinct-values": (
+            f"SELECT {c} AS val, COUNT(*) AS cnt FROM {t} WHERE {c} IS NOT NULL "
+            f"GROUP BY {c} ORDER BY cnt DESC LIMIT 100"
+        ),
+    }
+
+
+async def execute(table: str, sql: str, engine_name: str) -> list[dict]:
+    """Run on exactly one engine. run_query would quietly fall back from
+    DuckDB to Postgres and time Postgres twice, so it isn't used here."""
+    if engine_name == "duckdb":
+        return await asyncio.to_thread(_duckdb_query, table, sql, None)
+    return await _postgres_query(sql, None)
+
+
+async def time_query(table: str, sql: str, engine_name: str, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await execute(table, sql, engine_name)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dataset_id")
+    parser.add_argument("--category", required=True)
+    parser.add_argument("--measure", required=True)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--snapshot", action="store_true")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        await export_parquet_snapshot(args.dataset_id)
+    if not duckdb_available(args.dataset_id):
+        raise SystemExit(
+            "DuckDB or the Parquet snapshot is missing; install the `duckdb` extra "
+            "and/or pass --snapshot"
+        )
+
+    print(f"{'query':<22}{'postgres p50 ms':>18}{'duckdb p50 ms':>16}{'speedup':>10}")
+    for name, sql in build_queries(args.dataset_id, args.category, args.measure).items():
+        # Warm both engines so connection setup isn't measured; a query
+        # DuckDB can't run is reported rather than timed
+        await execute(args.dataset_id, sql, "postgres")
+        try:
+            await execute(args.dataset_id, sql, "duckdb")
+        except Exception as e:
+            print(f"{name:<22}{'':>18}{'failed':>16}   ({e})")
+            continue
+
+        pg = statistics.median(await time_query(args.dataset_id, sql, "postgres", args.runs))
+        dk = statistics.median(await time_query(args.dataset_id, sql, "duckdb", args.runs))
+        print(f"{name:<22}{pg:>18.1f}{dk:>16.1f}{pg / dk:>9.1f}x")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+from app.core.llm_cache import LLMResponseCache
+from app.services import ai_metadata
+
+
+class _Chain:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    async def ainvoke(self, _):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def _local_cache(monkeypatch):
+    cache = LLMResponseCache(True, 60, max_entries=10, local_max_entries=10)
+
+    async def store(key, entry):
+        cache._remember(key, json.dumps(entry), entry["created_at"])
+
+    monkeypatch.setattr(cache, "_store", store)
+    monkeypatch.setattr(cache, "_record", lambda *a, **k: asyncio.sleep(0))
+    monkeypatch.setattr(ai_metadata, "llm_cache", cache)
+    monkeypatch.setattr(ai_metadata, "RETRY_BACKOFF_SECONDS", 0)
+    return cache
+
+
+def test_bad_chunk_response_is_retried_not_cached(monkeypatch):
+    cache = _local_cache(monkeypatch)
+    chunk = {"region": ["north", "south"]}
+    chain = _Chain([["not", "a", "dict"], {"region": "Sales region"}])
+
+    async def run():
+        first = await ai_metadata._describe_chunk(chain, chunk, asyncio.Semaphore(1))
+        # The good response was cached, so describing again costs no call
+        second = await ai_metadata._describe_chunk(chain, chunk, asyncio.Semaphore(1))
+        return first, second
+
+    assert asyncio.run(run()) == ({"region": "Sales region"},) * 2
+    assert chain.calls == 2
+    assert cache.hits == 1
+
+
+def test_chunk_drops_invented_and_non_text_columns(monkeypatch):
+    _local_cache(monkeypatch)
+    chunk = {"region": ["north"], "amount": [1, 2]}
+    chain = _Chain([{"region": "Sales region", "amount": 3, "extra": "Invented"}])
+
+    described = asyncio.run(
+        ai_metadata._describe_chunk(chain, chunk, asyncio.Semaphore(1))
+    )
+    assert described == {"region": "Sales region"}
+
+
+def test_overview_samples_are_bounded(monkeypatch):
+    monkeypatch.setattr(ai_metadata.settings, "COLUMN_DESCRIPTION_CHUNK_TOKENS", 200)
+    wide = {f"column_{i}": list(range(20)) for i in range(500)}
+
+    overview = ai_metadata.overview_samples(wide)
+    assert 0 < len(overview) < len(wide)
+    assert all(
+        len(samples) == ai_metadata.OVERVIEW_SAMPLES_PER_COLUMN
+        for samples in overview.values()
+    )
+    assert ai_metadata.overview_samples({}) == {}
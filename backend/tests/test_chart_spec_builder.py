@@ -0,0 +1,41 @@
+import pytest
+
+from app.services.chart_spec_builder import build_chart_spec
+
+ROWS = [{"region": "north", "revenue": 10}, {"region": "south", "revenue": 20}]
+
+
+def _chart_type(query):
+    return build_chart_spec(ROWS, query)["series"][0]["type"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "revenue of online orders by region",
+        "revenue past deadline by region",
+        "laptop revenue by region",
+        "revenue by region for frank",
+    ],
+)
+def test_keywords_inside_other_words_do_not_match(query):
+    assert _chart_type(query) == "bar"
+    assert "yAxis" in build_chart_spec(ROWS, query)
+
+
+@pytest.mark.parametrize(
+    "query, chart_type",
+    [
+        ("revenue by region as a line", "line"),
+        ("Revenue trends by region", "line"),
+        ("share of revenue by region", "pie"),
+    ],
+)
+def test_whole_keywords_match(query, chart_type):
+    assert _chart_type(query) == chart_type
+
+
+def test_date_dimension_matches_bar_keywords_as_words():
+    rows = [{"month": "2024-01", "revenue": 10}, {"month": "2024-02", "revenue": 20}]
+    assert build_chart_spec(rows, "laptop revenue per month")["series"][0]["type"] == "line"
+    assert build_chart_spec(rows, "top revenue per month")["series"][0]["type"] == "bar"
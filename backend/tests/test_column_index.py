@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import column_index
+from app.services.column_index import BM25Index, build_column_documents, relevant_schema
+
+DATASET = "dataset_wide"
+
+
+@pytest.fixture
+def wide_schema(monkeypatch):
+    monkeypatch.setattr(settings, "COLUMN_RETRIEVAL_TOP_K", 3)
+    monkeypatch.setattr(settings, "COLUMN_RETRIEVAL_MIN_COLUMNS", 5)
+    names = ["customer_id", "order_date", "revenue", "region"] + [f"metric_{i}" for i in range(20)]
+    schema = [{"name": n, "type": "VARCHAR"} for n in names]
+    documents = build_column_documents(names, {"revenue": "sales amount"}, {})
+    monkeypatch.setitem(column_index._indexes, DATASET, BM25Index(documents))
+    return schema
+
+
+def _names(columns):
+    return [c["name"] for c in columns]
+
+
+def test_pads_to_top_k_and_keeps_date_and_key_columns(wide_schema):
+    pruned = asyncio.run(relevant_schema(DATASET, wide_schema, ["average revenue per month"]))
+    names = _names(pruned)
+    assert {"revenue", "order_date", "customer_id"} <= set(names)
+    assert len(names) < len(wide_schema)
+    # Padded to top-K per question even though only one column scored
+    assert len(names) >= settings.COLUMN_RETRIEVAL_TOP_K
+
+
+def test_question_matching_nothing_keeps_full_schema(wide_schema):
+    full = asyncio.run(
+        relevant_schema(DATASET, wide_schema, ["revenue by region", "something unrelated"])
+    )
+    assert full == wide_schema
@@ -0,0 +1,27 @@
+import pytest
+
+from app.services.heuristic_suggestions import build_heuristic_suggestions
+
+
+def _trend_requests(date_distinct):
+    suggestions = build_heuristic_suggestions(
+        "sales",
+        {"order_date": "date", "revenue": "numerical"},
+        {
+            "order_date": {} if date_distinct is None else {"distinct": date_distinct},
+            "revenue": {"distinct": 500},
+        },
+        row_count=5000,
+    )
+    return [s["request"] for s in suggestions if s["request"].get("y_axis") == "order_date"]
+
+
+@pytest.mark.parametrize(
+    "distinct, grain",
+    [(12, None), (60, None), (365, "week"), (900, "month"), (None, "month")],
+)
+def test_date_trend_grain_follows_distinct_dates(distinct, grain):
+    requests = _trend_requests(distinct)
+    assert requests
+    assert all(r["time_grain"] == grain for r in requests)
+    assert all(r["sort_by"] == "order_date" and r["sort_dir"] == "asc" for r in requests)
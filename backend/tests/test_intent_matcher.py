@@ -0,0 +1,73 @@
+import pytest
+
+from app.services.intent_matcher import match_intent
+
+TABLE = "dataset_abc"
+COLUMNS = [
+    {"name": "order_id", "type": "INTEGER"},
+    {"name": "region", "type": "VARCHAR", "description": "Sales territory of the order."},
+    {"name": "product_name", "type": "VARCHAR", "description": "Name of the item sold"},
+    {"name": "order_date", "type": "VARCHAR"},
+    {"name": "status", "type": "VARCHAR"},
+    {"name": "price", "type": "DOUBLE PRECISION"},
+    {"name": "revenue", "type": "DOUBLE PRECISION", "description": "Sales amount in USD"},
+]
+COLUMN_TYPES = {
+    "order_id": "numerical",
+    "region": "categorical",
+    "product_name": "categorical",
+    "order_date": "date",
+    "status": "categorical",
+    "price": "numerical",
+    "revenue": "numerical",
+}
+
+
+def match(query):
+    return match_intent(query, TABLE, COLUMNS, COLUMN_TYPES, dataset_name="orders.csv")
+
+
+@pytest.mark.parametrize(
+    "query, intent, fragment",
+    [
+        ("Count of orders by region", "count_by", 'SELECT "region", COUNT(*)'),
+        ("count by region", "count_by", 'GROUP BY "region"'),
+        ("How many orders per month?", "count_by", "date_trunc('month'"),
+        ("average price by region", "aggregate_by", 'AVG("price")'),
+        ("monthly total revenue", "periodic_aggregate", 'SUM("revenue")'),
+        ("Top 10 products by total revenue", "top_n", "LIMIT 10"),
+    ],
+)
+def test_matches_plain_questions(query, intent, fragment):
+    result = match(query)
+    assert result is not None
+    assert result["intent"] == intent
+    assert fragment in result["sql"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "count of cancelled orders by region",
+        "average price by region in 2023",
+        "total revenue by region excluding refunds",
+        "count of orders by region for last year",
+        "number of distinct products by region",
+        "average price per month in 2023",
+        "top 5 products by revenue in europe",
+        "revenue by region",
+        "what is the correlation between price and revenue",
+    ],
+)
+def test_leaves_qualified_or_unknown_questions_to_the_llm(query):
+    assert match(query) is None
+
+
+@pytest.mark.parametrize(
+    "query", ["count of records by order date", "total revenue by order date"]
+)
+def test_date_dimension_is_a_time_series_in_date_order(query):
+    sql = match(query)["sql"]
+    assert "date_trunc('day', CAST(\"order_date\" AS timestamp)) AS \"order_date\"" in sql
+    assert sql.endswith("GROUP BY 1 ORDER BY 1")
+    assert "LIMIT" not in sql
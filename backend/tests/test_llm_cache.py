@@ -0,0 +1,79 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import app.core.redis as redis_module
+from app.core.llm_cache import LLMResponseCache, normalize_query
+
+
+def test_ignores_case_whitespace_and_sentence_punctuation():
+    assert normalize_query("  Revenue  by Region? ") == "revenue by region"
+    assert normalize_query("Revenue, by region!") == normalize_query("revenue by region")
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("orders with amount > 100", "orders with amount < 100"),
+        ("orders with amount >= 100", "orders with amount = 100"),
+        ("status != shipped", "status = shipped"),
+        ("change of -5%", "change of 5%"),
+        ("price above 2.5", "price above 25"),
+    ],
+)
+def test_keeps_operators_signs_and_decimals_apart(a, b):
+    assert normalize_query(a) != normalize_query(b)
+
+
+class _EmptyRedis:
+    async def get(self, key):
+        return None
+
+
+def _local_cache(monkeypatch, ttl_seconds=60):
+    cache = LLMResponseCache(True, ttl_seconds, max_entries=10, local_max_entries=10)
+
+    async def store(key, entry):
+        cache._remember(key, json.dumps(entry), entry["created_at"])
+
+    monkeypatch.setattr(cache, "_store", store)
+    monkeypatch.setattr(cache, "_record", lambda *a, **k: asyncio.sleep(0))
+    return cache
+
+
+def test_local_hits_are_independent_copies(monkeypatch):
+    cache = _local_cache(monkeypatch)
+
+    async def call():
+        return {"chart": {"series": [1]}}
+
+    async def run():
+        first = await cache.get_or_call("ns", {"q": 1}, call)
+        first["chart"]["series"].append(2)
+        second = await cache.get_or_call("ns", {"q": 1}, call)
+        second["chart"]["series"].append(3)
+        return await cache.get_or_call("ns", {"q": 1}, call)
+
+    assert asyncio.run(run()) == {"chart": {"series": [1]}}
+    assert cache.hits == 2
+
+
+def test_local_entries_expire_with_the_ttl(monkeypatch):
+    cache = _local_cache(monkeypatch, ttl_seconds=60)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+
+    monkeypatch.setattr(redis_module, "redis_client", _EmptyRedis())
+    asyncio.run(cache.get_or_call("ns", {"q": 1}, call))
+    now[0] += 30
+    assert asyncio.run(cache.get_or_call("ns", {"q": 1}, call)) == {"n": 1}
+    now[0] += 31
+    assert asyncio.run(cache.get_or_call("ns", {"q": 1}, call)) == {"n": 2}
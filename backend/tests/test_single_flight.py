@@ -0,0 +1,46 @@
+import asyncio
+
+import app.core.redis as redis_module
+from app.core.single_flight import SingleFlight
+
+
+class _NoRedis:
+    def __getattr__(self, name):
+        raise AssertionError(f"unexpected Redis call: {name}")
+
+
+def test_coalesces_in_process_without_redis(monkeypatch):
+    monkeypatch.setattr(redis_module, "redis_client", _NoRedis())
+    flight = SingleFlight(True, lock_ttl_seconds=5, result_ttl_seconds=5, wait_seconds=1)
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"ok": True}
+
+    async def run():
+        return await asyncio.gather(
+            *(flight.do("column_bar", {"x": 1}, work) for _ in range(5))
+        )
+
+    results = asyncio.run(run())
+    assert results == [{"ok": True}] * 5
+    assert calls == 1
+    assert flight.local_shared == 4
+    assert flight.leaders == 0
+
+
+def test_distinct_requests_run_separately(monkeypatch):
+    monkeypatch.setattr(redis_module, "redis_client", _NoRedis())
+    flight = SingleFlight(True, lock_ttl_seconds=5, result_ttl_seconds=5, wait_seconds=1)
+
+    async def run():
+        return await asyncio.gather(
+            flight.do("kpi", {"x": 1}, lambda: asyncio.sleep(0, result=1)),
+            flight.do("kpi", {"x": 2}, lambda: asyncio.sleep(0, result=2)),
+        )
+
+    assert asyncio.run(run()) == [1, 2]
+    assert flight.local_shared == 0
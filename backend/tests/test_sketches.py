@@ -0,0 +1,22 @@
+from app.services.sketches import ALL_ROWS_GROUP, _feed, merge_sketches, sketch_value
+
+
+def test_feed_sketches_every_value_column_per_group():
+    groups_by_column = {"price": {}, "qty": {}}
+    rows = [("north" if i % 2 else "south", float(i), i % 10) for i in range(1000)]
+    rows.append(("north", None, 3))
+    _feed(groups_by_column, True, rows)
+
+    price, qty = groups_by_column["price"], groups_by_column["qty"]
+    assert set(price) == set(qty) == {"north", "south"}
+    assert price["north"]["kll"].n == 500
+    assert qty["north"]["kll"].n == 501
+    assert sketch_value("COUNT_DISTINCT", qty["south"]) == 5
+    median = sketch_value("MEDIAN", merge_sketches(price))
+    assert abs(median - 500) < 30
+
+
+def test_feed_without_group_column_uses_one_group():
+    groups_by_column = {"price": {}}
+    _feed(groups_by_column, False, [(None, 1.0), (None, 2.0)])
+    assert list(groups_by_column["price"]) == [ALL_ROWS_GROUP]
@@ -0,0 +1,84 @@
+import pytest
+
+from app.services.sql_guard import SqlGuardError, guard_sql
+
+TABLE = "dataset_abc"
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        f"SELECT region, SUM(revenue) FROM {TABLE} GROUP BY region",
+        f"SELECT date_trunc('month', CAST(order_date AS timestamp)) AS m, COUNT(*) FROM {TABLE} GROUP BY 1",
+        f"SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY revenue) FROM {TABLE}",
+        f"SELECT region, RANK() OVER (ORDER BY revenue DESC) FROM {TABLE}",
+        f"WITH t AS (SELECT region, AVG(revenue) AS r FROM {TABLE} GROUP BY region) SELECT * FROM t",
+        f"WITH t AS (SELECT region FROM {TABLE}) SELECT * FROM t AS a WHERE region IN (SELECT region FROM t)",
+        f"WITH RECURSIVE n AS (SELECT 1 AS i UNION ALL SELECT i + 1 FROM n WHERE i < 5) SELECT * FROM n, {TABLE}",
+        f"SELECT * FROM {TABLE} WHERE name ILIKE '%a%' AND qty BETWEEN 1 AND 3 OR qty IN (SELECT qty FROM {TABLE})",
+        f"SELECT to_char(CAST(order_date AS date), 'YYYY-MM'), COALESCE(region, 'n/a') FROM public.{TABLE}",
+    ],
+)
+def test_allows_read_only_queries_on_the_dataset(sql):
+    guarded = guard_sql(sql, TABLE, max_rows=100)
+    assert guarded.startswith("SELECT * FROM (")
+    assert guarded.endswith(") AS guarded_query LIMIT 100")
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT query_to_xml('select * from dataset_registry', true, true, '')",
+        "SELECT table_to_xml('dataset_registry', true, true, '')",
+        "SELECT query_to_xml_and_xmlschema('select 1', true, true, '')",
+        "SELECT cursor_to_xml('c', 10, true, true, '')",
+        "SELECT xpath('/a', '<a/>')",
+        f"SELECT region FROM {TABLE} WHERE 1 = (SELECT COUNT(*) FROM table_to_xml('users', true, true, ''))",
+        "SELECT pg_sleep(10)",
+        "SELECT current_setting('server_version')",
+        "SELECT set_config('statement_timeout', '0', false)",
+        "SELECT dblink('host=x', 'select 1')",
+    ],
+)
+def test_rejects_functions_outside_the_allowlist(sql):
+    with pytest.raises(SqlGuardError, match="not allowed"):
+        guard_sql(sql, TABLE)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT * FROM dataset_registry",
+        f"SELECT * FROM {TABLE} JOIN dataset_registry ON true",
+        f"SELECT * FROM {TABLE} WHERE 1 = (SELECT COUNT(*) FROM pg_catalog.pg_user)",
+        f"SELECT * FROM other_schema.{TABLE}",
+        # A CTE name only covers its own scope, not tables elsewhere in the query
+        "SELECT r.* FROM (WITH dataset_registry AS (SELECT 1 AS x) "
+        "SELECT x FROM dataset_registry) s, dataset_registry r",
+        f"SELECT region FROM {TABLE} UNION ALL SELECT rolname::text FROM "
+        "(WITH pg_authid AS (SELECT 1 AS y) SELECT y FROM pg_authid) s, pg_authid",
+    ],
+)
+def test_rejects_other_tables(sql):
+    with pytest.raises(SqlGuardError, match="only read the dataset table"):
+        guard_sql(sql, TABLE)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        f"DELETE FROM {TABLE}",
+        f"SELECT * INTO copy FROM {TABLE}",
+        f"SELECT * FROM {TABLE} FOR UPDATE",
+        f"SELECT 1 FROM {TABLE}; DROP TABLE {TABLE}",
+    ],
+)
+def test_rejects_writes_and_multiple_statements(sql):
+    with pytest.raises(SqlGuardError):
+        guard_sql(sql, TABLE)
+
+
+def test_wraps_the_rendered_tree_not_the_raw_text():
+    guarded = guard_sql(f"SELECT region FROM {TABLE} -- ) x; DROP TABLE y", TABLE)
+    assert "DROP" not in guarded
+    assert "--" not in guarded